@@ -0,0 +1,138 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import asyncio
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from database import set_local_statement_timeout
+from models import Venue, Artist, Show, venue_genres, artist_genres
+from repository import (artist_page_data, assemble_detail, detail_statement, genre_names_statement,
+                        upcoming_boundary, venue_page_data)
+
+# asyncio driver of each database, in the form backend name: drivername.
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+# ----------------------------------------------------------------------------#
+# Engine configuration.
+# ----------------------------------------------------------------------------#
+
+def async_database_url(uri: str):
+    """Return the URL of the database at uri with its driver replaced by the asyncio one."""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No asyncio driver for {backend!r} databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(config, url) -> dict:
+    """Build the options of the asyncio engine from the DB_* settings, like database.engine_options.
+
+    The pool is an asyncio queue pool of the same size as the pool of a WSGI
+    worker. With DB_PGBOUNCER asyncpg must not cache prepared statements, they
+    do not survive transaction pooling.
+
+    """
+    if url.get_backend_name() == 'sqlite':
+        return {}
+    if config['DB_PGBOUNCER']:
+        return {'poolclass': NullPool, 'connect_args': {'statement_cache_size': 0}}
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if config['DB_STATEMENT_TIMEOUT_MS']:
+        options['connect_args'] = {
+            'server_settings': {'statement_timeout': str(int(config['DB_STATEMENT_TIMEOUT_MS']))}
+        }
+    return options
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class AsyncDatabase:
+    """Flask extension holding the asyncio engine of the async mode, see asgi.py.
+
+    Queries are built by repository.py, the same statements as the WSGI mode,
+    but the independent ones of a page run concurrently, each on its own
+    connection. Reads always go to the primary. The engine binds its
+    connections to the event loop that opens them, start() must run inside
+    that loop (the ASGI lifespan startup). Requires the asyncpg package on
+    postgres and aiosqlite on sqlite.
+
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.config = None
+        self.engine = None
+        self.sessionmaker = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.config = app.config
+        app.extensions['async_db'] = self
+
+    def start(self):
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+
+        url = async_database_url(self.config['SQLALCHEMY_DATABASE_URI'])
+        if self.config['DB_PGBOUNCER'] and url.get_backend_name() == 'postgresql':
+            url = url.update_query_dict({'prepared_statement_cache_size': '0'})
+        self.engine = create_async_engine(url, **async_engine_options(self.config, url))
+        timeout_ms = self.config['DB_STATEMENT_TIMEOUT_MS']
+        if self.config['DB_PGBOUNCER'] and timeout_ms:
+            event.listen(self.engine.sync_engine, 'begin', set_local_statement_timeout(timeout_ms))
+        instrumentation = self.app.extensions.get('instrumentation')
+        if instrumentation is not None:
+            instrumentation.watch(self.engine.sync_engine)
+        self.sessionmaker = sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    async def fetch(self, statement) -> list:
+        """Run statement in a session of its own and return all its rows."""
+        async with self.sessionmaker() as session:
+            return (await session.execute(statement)).all()
+
+    async def _get_page_data(self, model, show_fk, other_model, other_fk, prefix: str, genre_fk,
+                             entity_id: int, past_shows_limit: int, format_data) -> dict:
+        now = upcoming_boundary()
+        rows, genres = await asyncio.gather(
+            self.fetch(detail_statement(model, show_fk, other_model, other_fk, entity_id, past_shows_limit, now)),
+            self.fetch(genre_names_statement(genre_fk, entity_id)))
+        detail = assemble_detail(rows, prefix)
+        if detail is None:
+            return None
+        return format_data(detail['entity'], [name for name, in genres], detail)
+
+    async def get_venue_page_data(self, venue_id: int, past_shows_limit: int) -> dict:
+        """Build the data of the venue page like repository.get_venue_page_data, or None."""
+        return await self._get_page_data(Venue, Show.venue_id, Artist, Show.artist_id, 'artist',
+                                         venue_genres.c.venue_id, venue_id, past_shows_limit, venue_page_data)
+
+    async def get_artist_page_data(self, artist_id: int, past_shows_limit: int) -> dict:
+        """Build the data of the artist page like repository.get_artist_page_data, or None."""
+        return await self._get_page_data(Artist, Show.artist_id, Venue, Show.venue_id, 'venue',
+                                         artist_genres.c.artist_id, artist_id, past_shows_limit, artist_page_data)
+
+
+async_db = AsyncDatabase()
@@ -0,0 +1,251 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import hmac
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+
+from cache import cache
+from importer import FORMATS, IMPORTABLE, import_upload
+from pagination import InvalidCursor, get_list_page
+from repository import (get_artist_page_data, get_artists_page, get_shows_page, get_venue_areas_page,
+                        get_venue_page_data, iter_artists, iter_shows, iter_venues)
+
+# ----------------------------------------------------------------------------#
+# Blueprint.
+# ----------------------------------------------------------------------------#
+
+# Versioned JSON API serving the same data as the html pages. Responses carry an
+# ETag built from the cache namespaces they depend on (see Cache.etag), a request
+# with a matching If-None-Match gets a 304 without querying the database.
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def _json_default(value):
+    """Serialize the values json does not handle, datetimes as ISO 8601."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(data) -> str:
+    """Serialize data as the API does, also used by the async mode (see asgi.py)."""
+    return json.dumps(data, default=_json_default)
+
+
+def _conditional(namespaces: list, args: tuple, build) -> Response:
+    """Return the response of build(), or a 304 if the client already has it.
+
+    build returns the data to send as json, or a Response for streamed bodies.
+
+    """
+    etag = cache.etag(namespaces, args)
+    if etag is not None and etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        data = build()
+        if isinstance(data, Response):
+            response = data
+        else:
+            response = current_app.response_class(dumps(data), mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+async def conditional_async(namespaces: list, args: tuple, build) -> Response:
+    """Like _conditional for a coroutine function build, used by the async mode (see asgi.py)."""
+    etag = cache.etag(namespaces, args)
+    if etag is not None and etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = current_app.response_class(dumps(await build()), mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def _page(items: list, page) -> dict:
+    """Build the response format shared by the paginated listings."""
+    return {
+        'data': items,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor
+    }
+
+
+def _ndjson(rows, to_dict) -> Response:
+    """Stream rows as newline delimited json, one to_dict(row) object per line."""
+    def generate():
+        for row in rows:
+            yield dumps(to_dict(row)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def _genre_filter() -> str:
+    return request.args.get('genre') or None
+
+
+# ----------------------------------------------------------------------------#
+# Venues.
+# ----------------------------------------------------------------------------#
+
+def _venue_row(row) -> dict:
+    return {
+        'id': row.id,
+        'name': row.name,
+        'city': row.city,
+        'state': row.state,
+        'num_upcoming_shows': row.num_upcoming_shows
+    }
+
+
+@api.route('/venues')
+def venues():
+    # Venues grouped by area, the same cached pages as the venues page.
+    limit, after, before = get_list_page()
+    genre = _genre_filter()
+
+    def build():
+        page = cache.get_or_set('venue_areas', (limit, after, before, genre),
+                                lambda: get_venue_areas_page(limit, after=after, before=before, genre=genre))
+        return _page(page.items, page)
+
+    return _conditional(['venue_areas'], ('page', limit, after, before, genre), build)
+
+
+@api.route('/venues.ndjson')
+def venues_ndjson():
+    # Every venue, one per line in area order.
+    genre = _genre_filter()
+    batch_size = current_app.config['API_STREAM_BATCH_SIZE']
+    return _conditional(['venue_areas'], ('all', genre),
+                        lambda: _ndjson(iter_venues(genre=genre, batch_size=batch_size), _venue_row))
+
+
+@api.route('/venues/<int:venue_id>')
+def venue(venue_id):
+    def build():
+        data = cache.get_or_set(f'venue:{venue_id}', (),
+                                lambda: get_venue_page_data(venue_id, current_app.config['PAST_SHOWS_LIMIT']))
+        if data is None:
+            abort(404)
+        return data
+
+    return _conditional([f'venue:{venue_id}'], (), build)
+
+
+# ----------------------------------------------------------------------------#
+# Artists.
+# ----------------------------------------------------------------------------#
+
+def _artist_row(row) -> dict:
+    return {
+        'id': row.id,
+        'name': row.name
+    }
+
+
+@api.route('/artists')
+def artists():
+    limit, after, before = get_list_page()
+    genre = _genre_filter()
+
+    def build():
+        page = get_artists_page(limit, after=after, before=before, genre=genre)
+        return _page([_artist_row(x) for x in page], page)
+
+    return _conditional(['artists'], ('page', limit, after, before, genre), build)
+
+
+@api.route('/artists.ndjson')
+def artists_ndjson():
+    # Every artist, one per line ordered by name.
+    genre = _genre_filter()
+    batch_size = current_app.config['API_STREAM_BATCH_SIZE']
+    return _conditional(['artists'], ('all', genre),
+                        lambda: _ndjson(iter_artists(genre=genre, batch_size=batch_size), _artist_row))
+
+
+@api.route('/artists/<int:artist_id>')
+def artist(artist_id):
+    def build():
+        data = cache.get_or_set(f'artist:{artist_id}', (),
+                                lambda: get_artist_page_data(artist_id, current_app.config['PAST_SHOWS_LIMIT']))
+        if data is None:
+            abort(404)
+        return data
+
+    return _conditional([f'artist:{artist_id}'], (), build)
+
+
+# ----------------------------------------------------------------------------#
+# Shows.
+# ----------------------------------------------------------------------------#
+
+def _show_row(row) -> dict:
+    return {
+        'id': row.id,
+        'start_time': row.start_time,
+        'venue_id': row.venue_id,
+        'venue_name': row.venue_name,
+        'artist_id': row.artist_id,
+        'artist_name': row.artist_name,
+        'artist_image_link': row.artist_image_link
+    }
+
+
+@api.route('/shows')
+def shows():
+    limit, after, before = get_list_page()
+
+    def build():
+        page = get_shows_page(limit, after=after, before=before)
+        return _page([_show_row(x) for x in page], page)
+
+    return _conditional(['shows'], ('page', limit, after, before), build)
+
+
+@api.route('/shows.ndjson')
+def shows_ndjson():
+    # Every show, one per line ordered by start time.
+    batch_size = current_app.config['API_STREAM_BATCH_SIZE']
+    return _conditional(['shows'], ('all',),
+                        lambda: _ndjson(iter_shows(batch_size=batch_size), _show_row))
+
+
+# ----------------------------------------------------------------------------#
+# Bulk import.
+# ----------------------------------------------------------------------------#
+
+@api.route('/imports/<kind>', methods=['POST'])
+def import_rows(kind):
+    # Bulk import of an uploaded csv or ndjson file, see importer.py and `flask import`.
+    # Only enabled with an IMPORT_API_TOKEN, sent as "Authorization: Bearer <token>".
+    token = current_app.config.get('IMPORT_API_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return jsonify({'error': 'a valid "Authorization: Bearer <token>" header is required'}), 401
+    upload = request.files.get('file')
+    fmt = request.form.get('format')
+    if kind not in IMPORTABLE or upload is None or fmt not in (None, *FORMATS):
+        return jsonify({'error': f'POST a csv or ndjson file as "file", kind is one of {sorted(IMPORTABLE)}'}), 400
+    return jsonify(import_upload(kind, upload, fmt, batch_size=current_app.config['IMPORT_BATCH_SIZE']))
+
+
+# ----------------------------------------------------------------------------#
+# Errors.
+# ----------------------------------------------------------------------------#
+
+@api.errorhandler(404)
+def not_found_error(error):
+    return jsonify({'error': 'not found'}), 404
+
+
+@api.errorhandler(InvalidCursor)
+def invalid_cursor_error(error):
+    return jsonify({'error': str(error)}), 400
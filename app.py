@@ -2,19 +2,41 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
-from datetime import datetime
+import http.client
+import ipaddress
 import logging
-import sys
-from logging import Formatter, FileHandler
+import socket
+import urllib.error
+import urllib.parse
+import urllib.request
+from logging import FileHandler
 
-import babel
-import dateutil.parser
-from flask import Flask, render_template, request, flash, redirect, url_for, jsonify
+from flask import Flask, render_template, request, flash, redirect, url_for, jsonify, abort
 from flask_moment import Moment
 from flask_migrate import Migrate
+from sqlalchemy import inspect
 from forms import VenueForm, ArtistForm, ShowForm
 
+from api import api
+from assets import assets, assets_cli
+from cache import cache
+from counters import counters_cli
+from database import configure_engines, db_monitor
+from exporter import export_command
+from formatting import DatetimeFormatter
+from fragments import fragment_cache
+from http_cache import http_cache
+from importer import import_command
+from instrumentation import JsonFormatter, configure_logging, instrumentation
+from jobs import job_queue, jobs_cli
+from loaders import loader
 from models import Venue, Artist, Show
+from pagination import InvalidCursor, get_list_page
+from repository import (get_artist_page_data, get_artist_venue_ids, get_artists_page, get_genres, get_shows_page,
+                        get_venue_areas_page, get_venue_artist_ids, get_venue_page_data)
+from routing import replica_router
+from search import search_index
+from seeding import seed_command
 from shared import db
 
 # ----------------------------------------------------------------------------#
@@ -24,43 +46,175 @@ from shared import db
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
+configure_engines(app.config)
 db.init_app(app)
+configure_logging(app)
+instrumentation.init_app(app)
+db_monitor.init_app(app)
+replica_router.init_app(app)
 migrate = Migrate(app, db)
+search_index.init_app(app)
+cache.init_app(app)
+fragment_cache.init_app(app)
+assets.init_app(app)
+http_cache.init_app(app)
+job_queue.init_app(app)
+app.register_blueprint(api)
+app.cli.add_command(import_command)
+app.cli.add_command(export_command)
+app.cli.add_command(counters_cli)
+app.cli.add_command(seed_command)
+app.cli.add_command(assets_cli)
+app.cli.add_command(jobs_cli)
 
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+# Memoized and with pre-compiled patterns, see formatting.py.
+format_datetime = DatetimeFormatter(locale='en', maxsize=app.config['DATETIME_FORMAT_CACHE_SIZE'])
+app.jinja_env.filters['datetime'] = format_datetime
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+def get_search_page() -> tuple:
+    """Read the limit/offset of a search request, clamped to the configured bounds.
+
+    Returns a tuple in the form (limit, offset)
+
+    """
+    limit = request.values.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['SEARCH_MAX_PAGE_SIZE']))
+    offset = max(0, request.values.get('offset', 0, type=int))
+    return limit, offset
+
+
+def get_genre_filter() -> str:
+    """Read the optional genre a listing or search is filtered on."""
+    return request.values.get('genre') or None
+
+
+# ----------------------------------------------------------------------------#
+# Jobs.
+# ----------------------------------------------------------------------------#
+
+# Image links are fetched by the job workers, not while the user waits on the form.
+IMAGE_CHECK_TIMEOUT = 10
+
+
+class UnsafeLink(ValueError):
+    """A link the workers refuse to fetch, see check_public_url."""
+
+
+def check_public_url(url: str):
+    """Raise UnsafeLink unless url is http(s) with a host.
+
+    Links are user input, fetching them must not reach local files or the
+    hosts of our own network. The address of the host is checked when
+    connecting, see public_address.
+
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise UnsafeLink(f'Not an http(s) url: {url!r}')
+
+
+def public_address(host: str, port: int) -> str:
+    """Resolve host and return the address to connect to.
+
+    Raises UnsafeLink if any of its addresses is not public: loopback, private
+    and link-local addresses (such as cloud metadata endpoints).
+
+    """
+    addresses = [ipaddress.ip_address(sockaddr[0].split('%')[0])
+                 for *_, sockaddr in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)]
+    for address in addresses:
+        if not address.is_global or address.is_multicast:
+            raise UnsafeLink(f'{host} resolves to the non-public address {address}')
+    return str(addresses[0])
+
+
+def _create_public_connection(address, *args, **kwargs):
+    # Connect to the address just checked, resolving the host again would let
+    # its DNS answer change in between (DNS rebinding).
+    host, port = address
+    return socket.create_connection((public_address(host, port), port), *args, **kwargs)
+
+
+class PublicHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to a public address of the host, see public_address."""
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_public_connection
+
+
+class PublicHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection to a public address of the host, the certificate is still checked against the host name."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _create_public_connection
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follow redirects only to urls passing check_public_url."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# No proxies, the environment ones would connect to the host in our place, unchecked.
+image_check_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), PublicHTTPHandler,
+                                                 PublicHTTPSHandler, PublicRedirectHandler)
+
+
+@job_queue.task('images.check_link', max_attempts=3, concurrency=2)
+def check_image_link(kind: str, entity_id: int, url: str):
+    """Log a warning when the image link of a venue or artist is broken.
+
+    Links that are not http(s) or lead to a non-public address are refused
+    without being fetched. Network errors and 5xx responses raise, so the
+    job is retried later.
 
-def get_past_upcoming_shows(all_shows: list) -> tuple:
-    """Split a list of shows into past and upcoming.
-    
-    Returns a tuple in the form ([past_shows,...], [upcoming_shows,...])
-    
     """
-    # Find the split between past and upcoming shows.
-    # Shows is ordered by start_time based on query configuration in model.
-    idx_split = 0
-    curr_dt = datetime.now()
-    for show in all_shows:
-        if dateutil.parser.parse(show.start_time) > curr_dt:
-            break
-        idx_split += 1
-    past = all_shows[:idx_split]
-    upcoming = all_shows[idx_split:]
-    return past, upcoming
+    fields = {'kind': kind, 'entity_id': entity_id, 'url': url}
+    head = urllib.request.Request(url, method='HEAD', headers={'User-Agent': 'fyyur-link-check'})
+    try:
+        check_public_url(url)
+        with image_check_opener.open(head, timeout=IMAGE_CHECK_TIMEOUT) as response:
+            content_type = response.headers.get('Content-Type', '')
+    except urllib.error.HTTPError as e:
+        if e.code >= 500:
+            raise
+        app.logger.warning('broken image link', extra={'fields': {**fields, 'status': e.code}})
+        return
+    except UnsafeLink as e:
+        app.logger.warning('image link refused', extra={'fields': {**fields, 'reason': str(e)}})
+        return
+    except ValueError:
+        app.logger.warning('invalid image link', extra={'fields': fields})
+        return
+    if not content_type.startswith('image/'):
+        app.logger.warning('image link is not an image', extra={'fields': {**fields, 'content_type': content_type}})
+
+
+def enqueue_image_check(kind: str, entity):
+    """Queue the check of the image link of a new or edited venue or artist, in the current transaction."""
+    if entity.image_link and inspect(entity).attrs.image_link.history.has_changes():
+        db.session.flush()
+        job_queue.enqueue('images.check_link', kind=kind, entity_id=entity.id, url=entity.image_link)
 
 
 # ----------------------------------------------------------------------------#
@@ -68,6 +222,7 @@ def get_past_upcoming_shows(all_shows: list) -> tuple:
 # ----------------------------------------------------------------------------#
 
 @app.route('/')
+@http_cache.conditional(lambda: [])
 def index():
     return render_template('pages/home.html')
 
@@ -76,118 +231,41 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@http_cache.conditional(lambda: ['venue_areas'])
 def venues():
-    # NOTE: num_upcoming_shows should be aggregated based on number of upcoming shows per venue.
-    _data = {}
-    venues_list = Venue.query.all()
-    for venue in venues_list:
-        venue_data = {
-            'id': venue.id,
-            'name': venue.name,
-            'num_upcoming_shows': len(venue.shows)
-        }
-        if venue.state in _data:
-            if venue.city in _data[venue.state]:
-                _data[venue.state][venue.city].append(venue_data)
-            else:
-                _data[venue.state].update({
-                    venue.city: [venue_data]
-                })
-        else:
-            _data.update({
-                venue.state: {
-                    venue.city: [venue_data]
-                }
-            })
-
-    # Convert it to a list with supported format for frontend.
-    data = [{'state': k, 'city': k2, 'venues': v2} for k, v in _data.items() for k2, v2 in v.items()]
-    data = sorted(data, key=lambda x: (x['state'], x['city']))
-
-    return render_template('pages/venues.html', areas=data)
+    # Venues grouped by area, with upcoming show counts aggregated in the db.
+    limit, after, before = get_list_page()
+    genre = get_genre_filter()
+    page = cache.get_or_set('venue_areas', (limit, after, before, genre),
+                            lambda: get_venue_areas_page(limit, after=after, before=before, genre=genre))
+    return render_template('pages/venues.html', areas=page.items, page=page, limit=limit, genre=genre)
 
 
 @app.route('/venues/search', methods=['POST'])
+@replica_router.read_only
 def search_venues():
     # search for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    response = {
-        'count': 0,
-        'data': []
-    }
+    # Matches on name, city, state or genres, ranked with name matches first.
     search_term = request.form.get('search_term', '')
-    matches = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).order_by('name').all()
-    if matches:
-        # Find upcoming shows.
-        for venue in matches:
-            _, upcoming = get_past_upcoming_shows(venue.shows)
-            response['count'] += 1
-            response['data'].append({
-                'id': venue.id,
-                'name': venue.name,
-                'num_upcoming_shows': len(upcoming)
-            })
-    
+    limit, offset = get_search_page()
+    genre = get_genre_filter()
+    response = search_index.search_venues(search_term, limit, offset, genre=genre)
+
     return render_template('pages/search_venues.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+                           search_term=search_term, limit=limit, offset=offset, genre=genre)
 
 
 @app.route('/venues/<int:venue_id>')
+@http_cache.conditional(lambda venue_id: [f'venue:{venue_id}'])
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
-    venue = Venue.query.get(venue_id)
-    # past_shows, upcoming_shows = get_past_upcoming_shows(venue.shows)
-    curr_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    past_shows = (Show.query.join(Venue)
-                  .filter(Venue.id == venue.id)
-                  .filter(Show.start_time < curr_time)
-                  .order_by('start_time').all())
-    past_shows = [
-        {
-            'artist_id': show.artist.id,
-            'artist_name': show.artist.name,
-            'artist_image_link': show.artist.image_link,
-            'start_time': show.start_time
-        }
-        for show in past_shows
-    ]
-    upcoming_shows = (Show.query.join(Venue)
-                      .filter(Venue.id == venue.id)
-                      .filter(Show.start_time >= curr_time)
-                      .order_by('start_time').all())
-    upcoming_shows = [
-        {
-            'artist_id': show.artist.id,
-            'artist_name': show.artist.name,
-            'artist_image_link': show.artist.image_link,
-            'start_time': show.start_time
-        }
-        for show in upcoming_shows
-    ]
-    data = {
-        'id': venue.id,
-        'name': venue.name,
-        # This comes as a comma separated string from the db.
-        # Convert it to an array for the front end.
-        'genres': venue.genres.split(','),
-        'address': venue.address,
-        'city': venue.city,
-        'state': venue.state,
-        'phone': venue.phone,
-        'website': venue.website_link,
-        'facebook_link': venue.facebook_link,
-        'seeking_talent': venue.seeking_talent,
-        'image_link': venue.image_link,
-        'past_shows': past_shows,
-        'upcoming_shows': upcoming_shows,
-        'past_shows_count': len(past_shows),
-        'upcoming_shows_count': len(upcoming_shows)
-    }
-    if venue.seeking_talent:
-        data.update({
-            'seeking_description': venue.seeking_description
-        })
-    
+    # Page data is cached until the venue or one of its shows changes, see cache.invalidate calls.
+    data = cache.get_or_set(f'venue:{venue_id}', (),
+                            lambda: get_venue_page_data(venue_id, app.config['PAST_SHOWS_LIMIT']))
+    if data is None:
+        abort(404)
+
     return render_template('pages/show_venue.html', venue=data)
 
 
@@ -217,7 +295,7 @@ def create_venue_submission():
             state=request.form['state'],
             phone=request.form['phone'],
             # request.form['genres'] only return a single value from the multiselect.
-            genres=','.join(request.form.getlist('genres')),
+            genres=get_genres(request.form.getlist('genres')),
             image_link=request.form['image_link'],
             facebook_link=request.form['facebook_link'],
             website_link=request.form['website_link'],
@@ -226,12 +304,15 @@ def create_venue_submission():
             seeking_description=request.form['seeking_description'],
         )
         db.session.add(venue)
+        enqueue_image_check('venue', venue)
         db.session.commit()
+        search_index.invalidate('venue')
+        cache.invalidate('venue_areas')
         flash(f'Venue {venue.name} was successfully listed!', 'success')
     except Exception:
         db.session.rollback()
         flash(f'An error occurred. Venue {request.form.get("name", "UNKNOWN")} could not be listed.', 'danger')
-        print(sys.exc_info())
+        app.logger.exception('venue could not be created')
     finally:
         db.session.close()
 
@@ -243,16 +324,20 @@ def delete_venue_submission(venue_id):
     error = False
     data = {}
     try:
-        venue = Venue.query.get(venue_id)
+        venue = loader(Venue).get(venue_id)
         data['name'] = venue.name
+        # Artist pages list the shows that are deleted along with the venue.
+        artist_ids = get_venue_artist_ids(venue.id)
         db.session.delete(venue)
         db.session.commit()
+        search_index.invalidate('venue')
+        cache.invalidate(f'venue:{venue_id}', 'venue_areas', 'shows', *[f'artist:{x}' for x in artist_ids])
         flash(f'Venue {data.get("name", venue_id)} successfully deleted.', 'success')
     except Exception:
         db.session.rollback()
         error = True
         flash(f'An error occurred. Venue {data.get("name", venue_id)} could not be deleted.', 'danger')
-        print(sys.exc_info())
+        app.logger.exception('venue could not be deleted', extra={'fields': {'venue_id': venue_id}})
     finally:
         db.session.close()
 
@@ -266,95 +351,39 @@ def delete_venue_submission(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@http_cache.conditional(lambda: ['artists'])
 def artists():
-    # Note: data passed to frontend should follow this format.
-    # data = [{
-    #     "id": 4,
-    #     "name": "Guns N Petals",
-    # },...]
-    data = [{'id': x.id, 'name': x.name} for x in Artist.query.order_by('id').all()]
-    return render_template('pages/artists.html', artists=data)
+    # Artists are ArtistRow rows in the form (id, name), rendered as they are.
+    limit, after, before = get_list_page()
+    genre = get_genre_filter()
+    page = get_artists_page(limit, after=after, before=before, genre=genre)
+    return render_template('pages/artists.html', artists=page.items, page=page, limit=limit, genre=genre)
 
 
 @app.route('/artists/search', methods=['POST'])
+@replica_router.read_only
 def search_artists():
     # search for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
-    response = {
-        'count': 0,
-        'data': []
-    }
+    # Matches on name, city, state or genres, ranked with name matches first.
     search_term = request.form.get('search_term', '')
-    matches = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).order_by('name').all()
-    if matches:
-        # Find upcoming shows.
-        for artist in matches:
-            _, upcoming = get_past_upcoming_shows(artist.shows)
-            response['count'] += 1
-            response['data'].append({
-                'id': artist.id,
-                'name': artist.name,
-                'num_upcoming_shows': len(upcoming)
-            })
+    limit, offset = get_search_page()
+    genre = get_genre_filter()
+    response = search_index.search_artists(search_term, limit, offset, genre=genre)
 
     return render_template('pages/search_artists.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+                           search_term=search_term, limit=limit, offset=offset, genre=genre)
 
 
 @app.route('/artists/<int:artist_id>')
+@http_cache.conditional(lambda artist_id: [f'artist:{artist_id}'])
 def show_artist(artist_id):
     # shows the artist page with the given artist_id
-    artist = Artist.query.get(artist_id)
-    # past_shows, upcoming_shows = get_past_upcoming_shows(artist.shows)
-    curr_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    past_shows = (Show.query.join(Artist)
-                  .filter(Artist.id == artist.id)
-                  .filter(Show.start_time < curr_time)
-                  .order_by('start_time').all())
-    past_shows = [
-        {
-            'venue_id': show.venue.id,
-            'venue_name': show.venue.name,
-            'venue_image_link': show.venue.image_link,
-            'start_time': show.start_time
-        }
-        for show in past_shows
-    ]
-    upcoming_shows = (Show.query.join(Artist)
-                      .filter(Artist.id == artist.id)
-                      .filter(Show.start_time >= curr_time)
-                      .order_by('start_time').all())
-    upcoming_shows = [
-        {
-            'venue_id': show.venue.id,
-            'venue_name': show.venue.name,
-            'venue_image_link': show.venue.image_link,
-            'start_time': show.start_time
-        }
-        for show in upcoming_shows
-    ]
-    data = {
-        'id': artist.id,
-        'name': artist.name,
-        # genres comes as a comma separated field from the db.
-        # Convert it to an array for the front end.
-        'genres': artist.genres.split(','),
-        'city': artist.city,
-        'state': artist.state,
-        'phone': artist.phone,
-        'seeking_venue': artist.seeking_venue,
-        'image_link': artist.image_link,
-        'facebook_link': artist.facebook_link,
-        'website': artist.website_link,
-        'past_shows': past_shows,
-        'upcoming_shows': upcoming_shows,
-        'past_shows_count': len(past_shows),
-        'upcoming_shows_count': len(upcoming_shows)
-    }
-    if artist.seeking_venue:
-        data.update({
-            'seeking_description': artist.seeking_description
-        })
+    # Page data is cached until the artist or one of its shows changes, see cache.invalidate calls.
+    data = cache.get_or_set(f'artist:{artist_id}', (),
+                            lambda: get_artist_page_data(artist_id, app.config['PAST_SHOWS_LIMIT']))
+    if data is None:
+        abort(404)
 
     return render_template('pages/show_artist.html', artist=data)
 
@@ -363,11 +392,13 @@ def show_artist(artist_id):
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-    artist = Artist.query.get(artist_id)
+    artist = loader(Artist).get(artist_id)
+    if artist is None:
+        abort(404)
     form = ArtistForm(obj=artist)
     form.validate_on_submit()
     # Multi-select field need to be manually set, doesn't seem to get set otherwise.
-    form.genres.data = artist.genres.split(',')
+    form.genres.data = [genre.name for genre in artist.genres]
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
@@ -380,25 +411,30 @@ def edit_artist_submission(artist_id):
         return edit_artist(artist_id)
 
     try:
-        artist = Artist.query.get(artist_id)
+        artist = loader(Artist).get(artist_id)
         artist.name = request.form['name']
         artist.city = request.form['city']
         artist.state = request.form['state']
         artist.phone = request.form['phone']
         # genres is a multi-select field, need to call getlist to get all the selected values.
-        artist.genres = ','.join(request.form.getlist('genres'))
+        artist.genres = get_genres(request.form.getlist('genres'))
         artist.image_link = request.form['image_link']
         artist.facebook_link = request.form['facebook_link']
         artist.website_link = request.form['website_link']
         # seeking_venue is not present if request.form if not selected from UI.
         artist.seeking_venue = True if request.form.get('seeking_venue', False) == 'y' else False
         artist.seeking_description = request.form['seeking_description']
+        enqueue_image_check('artist', artist)
         db.session.commit()
+        search_index.invalidate('artist')
+        # Venue pages show the name and image of the artists playing there.
+        cache.invalidate(f'artist:{artist_id}', 'artists', 'shows',
+                         *[f'venue:{x}' for x in get_artist_venue_ids(artist_id)])
         flash(f'Artist {artist.name} was successfully updated!', 'success')
     except Exception:
         db.session.rollback()
         flash(f'An error occurred. Artist {request.form.get("name", artist_id)} could not be updated.', 'danger')
-        print(sys.exc_info())
+        app.logger.exception('artist could not be updated', extra={'fields': {'artist_id': artist_id}})
     finally:
         db.session.close()
 
@@ -407,11 +443,13 @@ def edit_artist_submission(artist_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-    venue = Venue.query.get(venue_id)
+    venue = loader(Venue).get(venue_id)
+    if venue is None:
+        abort(404)
     form = VenueForm(obj=venue)
     form.validate_on_submit()
     # Multi-select field need to be manually set, doesn't seem to get set otherwise.
-    form.genres.data = venue.genres.split(',')
+    form.genres.data = [genre.name for genre in venue.genres]
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
@@ -424,26 +462,31 @@ def edit_venue_submission(venue_id):
         return edit_venue(venue_id)
 
     try:
-        venue = Venue.query.get(venue_id)
+        venue = loader(Venue).get(venue_id)
         venue.name = request.form['name']
         venue.address = request.form['address']
         venue.city = request.form['city']
         venue.state = request.form['state']
         venue.phone = request.form['phone']
         # genres is a multi-select, need to call getlist to get all selected values.
-        venue.genres = ','.join(request.form.getlist('genres'))
+        venue.genres = get_genres(request.form.getlist('genres'))
         venue.image_link = request.form['image_link']
         venue.facebook_link = request.form['facebook_link']
         venue.website_link = request.form['website_link']
         # seeking_talent is not present if request.form is not selected from UI.
         venue.seeking_talent = True if request.form.get('seeking_talent', False) == 'y' else False
         venue.seeking_description = request.form['seeking_description']
+        enqueue_image_check('venue', venue)
         db.session.commit()
+        search_index.invalidate('venue')
+        # Artist pages show the name and image of the venues they play at.
+        cache.invalidate(f'venue:{venue_id}', 'venue_areas', 'shows',
+                         *[f'artist:{x}' for x in get_venue_artist_ids(venue_id)])
         flash(f'Venue {venue.name} was successfully updated!', 'success')
     except Exception:
         db.session.rollback()
         flash(f'An error occurred. Venue {request.form.get("name", venue_id)} could not be updated.', 'danger')
-        print(sys.exc_info())
+        app.logger.exception('venue could not be updated', extra={'fields': {'venue_id': venue_id}})
     finally:
         db.session.close()
 
@@ -475,7 +518,7 @@ def create_artist_submission():
             state=request.form['state'],
             phone=request.form['phone'],
             # request.form['genres'] only return a single value from the multiselect.
-            genres=','.join(request.form.getlist('genres')),
+            genres=get_genres(request.form.getlist('genres')),
             image_link=request.form['image_link'],
             facebook_link=request.form['facebook_link'],
             website_link=request.form['website_link'],
@@ -484,12 +527,15 @@ def create_artist_submission():
             seeking_description=request.form['seeking_description'],
         )
         db.session.add(artist)
+        enqueue_image_check('artist', artist)
         db.session.commit()
+        search_index.invalidate('artist')
+        cache.invalidate('artists')
         flash(f'Artist {artist.name} was successfully listed!', 'success')
     except Exception:
         db.session.rollback()
         flash(f'An error occurred. Artist {request.form.get("name", "UNKNOWN")} could not be listed.', 'danger')
-        print(sys.exc_info())
+        app.logger.exception('artist could not be created')
     finally:
         db.session.close()
 
@@ -500,17 +546,13 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@http_cache.conditional(lambda: ['shows'])
 def shows():
-    # displays list of shows at /shows
-    shows_list = Show.query.order_by('start_time').all()
-    data = [{'start_time': x.start_time,
-             'venue_id': x.venue.id,
-             'venue_name': x.venue.name,
-             'artist_id': x.artist.id,
-             'artist_name': x.artist.name,
-             'artist_image_link': x.artist.image_link,
-             } for x in shows_list]
-    return render_template('pages/shows.html', shows=data)
+    # displays list of shows at /shows, one page at a time.
+    limit, after, before = get_list_page()
+    # ShowRow rows, rendered as they are.
+    shows_list = get_shows_page(limit, after=after, before=before)
+    return render_template('pages/shows.html', shows=shows_list.items, page=shows_list, limit=limit)
 
 
 @app.route('/shows/create')
@@ -522,30 +564,57 @@ def create_shows():
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
+    form = ShowForm()
     try:
         show = Show(
-            start_time=request.form['start_time'],
+            # Let the form parse start_time so a real datetime is stored.
+            start_time=form.start_time.data,
             venue_id=request.form['venue_id'],
             artist_id=request.form['artist_id']
         )
         db.session.add(show)
         db.session.commit()
+        cache.invalidate(f'venue:{show.venue_id}', f'artist:{show.artist_id}', 'venue_areas', 'shows')
         flash('Show was successfully listed!', 'success')
     except Exception:
         db.session.rollback()
         flash('An error occurred. Show could not be listed.', 'danger')
-        print(sys.exc_info())
+        app.logger.exception('show could not be created')
     finally:
         db.session.close()
 
     return render_template('pages/home.html')
 
 
+@app.route('/cache/stats')
+def cache_stats():
+    # Hit/miss/eviction counters of this worker, for monitoring.
+    return jsonify({**cache.stats(), 'fragments': fragment_cache.stats()})
+
+
+@app.route('/db/stats')
+def db_stats():
+    # Connection pool checkout latency and saturation of this worker and replica health, for monitoring.
+    return jsonify({'pools': db_monitor.stats(), 'replicas': replica_router.stats()})
+
+
+@app.route('/metrics')
+def metrics():
+    # Per route request histograms of this worker, in the Prometheus text format.
+    return instrumentation.render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
+@app.errorhandler(InvalidCursor)
+def invalid_cursor_error(error):
+    # A cursor that cannot be decoded does not point at any page.
+    return render_template('errors/404.html'), 404
+
+
 @app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
@@ -553,10 +622,7 @@ def server_error(error):
 
 if not app.debug:
     file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
+    file_handler.setFormatter(JsonFormatter())
     file_handler.setLevel(logging.INFO)
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
@@ -0,0 +1,196 @@
+"""ASGI entry point, the async mode of the app.
+
+Run with an ASGI server, e.g. `uvicorn asgi:application --workers 4`. The
+venue and artist detail pages, html and API, are served natively on asyncio
+with their independent queries run concurrently, see aio.py. They run in a
+Flask request context through the hooks of the app, so they send the same
+ETag, Cache-Control and Server-Timing headers and record the same metrics
+as the WSGI views. Every other request is handed to the WSGI app in a thread
+by asgiref, so both modes serve the same URLs and responses. The WSGI mode
+is unchanged (`gunicorn app:app`).
+
+Requires the asgiref package, plus asyncpg on postgres or aiosqlite on sqlite.
+
+"""
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort, render_template
+from werkzeug.exceptions import HTTPException
+
+from aio import async_db
+from api import conditional_async
+from app import app
+from cache import cache
+from http_cache import http_cache
+
+async_db.init_app(app)
+
+
+# ----------------------------------------------------------------------------#
+# Async views.
+# ----------------------------------------------------------------------------#
+
+async def _venue_data(venue_id: int):
+    return await cache.get_or_set_async(
+        f'venue:{venue_id}', (),
+        lambda: async_db.get_venue_page_data(venue_id, app.config['PAST_SHOWS_LIMIT']))
+
+
+async def _artist_data(artist_id: int):
+    return await cache.get_or_set_async(
+        f'artist:{artist_id}', (),
+        lambda: async_db.get_artist_page_data(artist_id, app.config['PAST_SHOWS_LIMIT']))
+
+
+@http_cache.conditional(lambda venue_id: [f'venue:{venue_id}'])
+async def show_venue(venue_id: int):
+    # Same data, cache entries and headers as app.show_venue.
+    data = await _venue_data(venue_id)
+    if data is None:
+        abort(404)
+    return render_template('pages/show_venue.html', venue=data)
+
+
+@http_cache.conditional(lambda artist_id: [f'artist:{artist_id}'])
+async def show_artist(artist_id: int):
+    # Same data, cache entries and headers as app.show_artist.
+    data = await _artist_data(artist_id)
+    if data is None:
+        abort(404)
+    return render_template('pages/show_artist.html', artist=data)
+
+
+async def venue(venue_id: int):
+    # Same data, cache entries and ETag as api.venue.
+    async def build():
+        data = await _venue_data(venue_id)
+        if data is None:
+            abort(404)
+        return data
+
+    return await conditional_async([f'venue:{venue_id}'], (), build)
+
+
+async def artist(artist_id: int):
+    # Same data, cache entries and ETag as api.artist.
+    async def build():
+        data = await _artist_data(artist_id)
+        if data is None:
+            abort(404)
+        return data
+
+    return await conditional_async([f'artist:{artist_id}'], (), build)
+
+
+# Endpoints served natively on GET, in the form endpoint: coroutine view taking the same arguments.
+ASYNC_VIEWS = {
+    'show_venue': show_venue,
+    'show_artist': show_artist,
+    'api.venue': venue,
+    'api.artist': artist,
+}
+
+
+# ----------------------------------------------------------------------------#
+# Application.
+# ----------------------------------------------------------------------------#
+
+def build_environ(scope) -> dict:
+    """Return the WSGI environ of an http request scope without body, as asgiref builds it for the WSGI app."""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port or 0),
+        'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name in ('content-length', 'content-type'):
+            key = name.upper().replace('-', '_')
+        else:
+            key = f'HTTP_{name.upper().replace("-", "_")}'
+        value = value.decode('latin1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class AsyncApplication:
+    """ASGI application dispatching to the async views, or to the WSGI app for everything else."""
+
+    def __init__(self, wsgi_app):
+        self.app = wsgi_app
+        self.wsgi = WsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            environ = build_environ(scope)
+            try:
+                endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+            except HTTPException:
+                endpoint = None
+            if endpoint in ASYNC_VIEWS:
+                await self._serve(environ, send, ASYNC_VIEWS[endpoint])
+                return
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                async_db.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _serve(self, environ: dict, send, view):
+        # Servers running without lifespan events start the engine on the first request.
+        if async_db.engine is None:
+            async_db.start()
+        # Flask.full_dispatch_request and wsgi_app, with the view awaited. The contexts are
+        # context variables, each ASGI request runs in its own task and sees its own.
+        with self.app.request_context(environ) as ctx:
+            try:
+                try:
+                    response = self.app.preprocess_request()
+                    if response is None:
+                        response = await view(**ctx.request.view_args)
+                except Exception as e:
+                    response = self.app.handle_user_exception(e)
+                response = self.app.finalize_request(response)
+            except Exception as e:
+                response = self.app.handle_exception(e)
+            headers = response.get_wsgi_headers(environ)
+            body = b''.join(response.get_app_iter(environ))
+        await send({'type': 'http.response.start', 'status': response.status_code,
+                    'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+application = AsyncApplication(app)
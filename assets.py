@@ -0,0 +1,274 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+
+import click
+from flask import abort, current_app, request, send_from_directory, url_for
+from flask.cli import AppGroup
+
+logger = logging.getLogger('fyyur.assets')
+
+# Bundles served by the layouts, in the form name: [source paths relative to static/] in load order.
+BUNDLES = {
+    'site.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # Loaded in <head>, before the page renders.
+    'head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    # Loaded deferred at the end of <body>.
+    'site.js': [
+        'js/libs/jquery-1.11.1.min.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+}
+
+# Outputs of these types get .gz (and .br) variants when it makes them smaller.
+COMPRESSIBLE = ('.css', '.js', '.svg', '.ttf', '.otf', '.eot', '.json')
+
+MANIFEST = 'manifest.json'
+
+# Fingerprinted names never change content, clients may keep them for a year.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.MULTILINE)
+
+
+# ----------------------------------------------------------------------------#
+# Build.
+# ----------------------------------------------------------------------------#
+
+def _read(path: str) -> str:
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _fingerprint(name: str, content: bytes) -> str:
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def sources_digest(static_folder: str) -> str:
+    """Return a hash of every bundle source, to tell whether the built bundles are stale."""
+    digest = hashlib.sha256()
+    for name, sources in sorted(BUNDLES.items()):
+        digest.update(name.encode())
+        for source in sources:
+            with open(os.path.join(static_folder, source), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def minify_css(css: str) -> str:
+    """Minify css with rcssmin when installed, else strip comments and collapse whitespace."""
+    try:
+        import rcssmin
+    except ImportError:
+        css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+        css = re.sub(r'\s+', ' ', css)
+        return re.sub(r'\s*([{};,])\s*', r'\1', css).strip()
+    return rcssmin.cssmin(css)
+
+
+def minify_js(js: str) -> str:
+    """Minify js with rjsmin when installed, else return it unchanged as that needs a real tokenizer."""
+    try:
+        import rjsmin
+    except ImportError:
+        return js
+    return rjsmin.jsmin(js)
+
+
+class Builder:
+    """Write the bundles, their fingerprinted dependencies and compressed variants to dist_dir."""
+
+    def __init__(self, static_folder: str, dist_dir: str, static_url_path: str = '/static'):
+        self.static_folder = static_folder
+        self.dist_dir = dist_dir
+        self.static_url_path = static_url_path
+        # In the form output name: content, everything written by this build.
+        self.outputs = {}
+
+    def _add(self, name: str, content: bytes) -> str:
+        fingerprinted = _fingerprint(name, content)
+        self.outputs[fingerprinted] = content
+        return fingerprinted
+
+    def _rewrite_urls(self, css: str, source: str) -> str:
+        # Bundles live in dist/, so urls relative to the source are rewritten: files that
+        # exist are fingerprinted next to the bundle, others point back to static/.
+        def rewrite(match):
+            url = match.group(2)
+            if re.match(r'^([a-z]+:|/|#)', url):
+                return match.group(0)
+            path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(source), path))
+            full_path = os.path.join(self.static_folder, target)
+            if not os.path.isfile(full_path):
+                return f'url("{self.static_url_path}/{target}{suffix}")'
+            with open(full_path, 'rb') as f:
+                return f'url("{self._add(posixpath.basename(target), f.read())}{suffix}")'
+        return CSS_URL.sub(rewrite, css)
+
+    def bundle(self, name: str, sources: list) -> str:
+        """Concatenate and minify sources into a fingerprinted bundle, returns its file name."""
+        parts = []
+        for source in sources:
+            text = _read(os.path.join(self.static_folder, source))
+            if name.endswith('.css'):
+                text = self._rewrite_urls(text, source)
+                parts.append(text if source.endswith('.min.css') else minify_css(text))
+            else:
+                # Source maps are not shipped, and a missing statement terminator must not join two files.
+                text = SOURCE_MAP.sub('', text)
+                parts.append((text if source.endswith('.min.js') else minify_js(text)).rstrip() + '\n;')
+        return self._add(name, '\n'.join(parts).encode('utf-8'))
+
+    def write(self) -> dict:
+        """Build every bundle and return the manifest, also written to dist_dir."""
+        manifest = {
+            'sources': sources_digest(self.static_folder),
+            'bundles': {name: self.bundle(name, sources) for name, sources in BUNDLES.items()},
+        }
+        os.makedirs(self.dist_dir, exist_ok=True)
+        for name, content in self.outputs.items():
+            self._write(name, content)
+            if name.endswith(COMPRESSIBLE):
+                for ext, compressed in compress(content).items():
+                    self._write(name + ext, compressed)
+        self._write(MANIFEST, json.dumps(manifest, indent=2).encode())
+        return manifest
+
+    def _write(self, name: str, content: bytes):
+        # Several workers may build at once, readers only ever see complete files.
+        path = os.path.join(self.dist_dir, name)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+def compress(content: bytes) -> dict:
+    """Return the precompressed variants of content smaller than 90% of it, in the form {'.gz': bytes, '.br': bytes}.
+
+    Brotli variants need the brotli package and are skipped without it.
+
+    """
+    variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        variants['.br'] = brotli.compress(content, quality=11)
+    return {ext: data for ext, data in variants.items() if len(data) < len(content) * 0.9}
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class Assets:
+    """Flask extension serving the bundles built from BUNDLES.
+
+    Templates call asset_urls(name) for the urls of a bundle. Built bundles
+    are served from ASSETS_URL_PATH with a content hash in their name,
+    precompressed (brotli, then gzip) according to Accept-Encoding and with
+    an immutable Cache-Control, so repeat visits only fetch the html.
+
+    Bundles are built by `flask assets build`, or on start when the manifest
+    is missing or older than the sources and ASSETS_AUTO_BUILD is set. When no
+    up to date build is available the individual source files are linked
+    instead, served by the static route.
+
+    """
+
+    def __init__(self, app=None):
+        self.dist_dir = None
+        self.manifest = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist_dir = os.path.join(app.static_folder, 'dist')
+        self.manifest = self._load(app)
+        app.add_url_rule(app.config.get('ASSETS_URL_PATH', '/assets') + '/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals['asset_urls'] = self.urls
+        app.extensions['assets'] = self
+
+    def _load(self, app):
+        path = os.path.join(self.dist_dir, MANIFEST)
+        manifest = None
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+        if manifest is not None and manifest['sources'] == sources_digest(app.static_folder):
+            return manifest
+        if not app.config.get('ASSETS_AUTO_BUILD', True):
+            logger.warning('asset bundles are missing or stale, linking the source files')
+            return None
+        try:
+            return Builder(app.static_folder, self.dist_dir, app.static_url_path).write()
+        except OSError:
+            logger.exception('asset bundles could not be built, linking the source files')
+            return None
+
+    def urls(self, name: str) -> list:
+        """Return the urls to include for the bundle name."""
+        if self.manifest is None:
+            return [url_for('static', filename=source) for source in BUNDLES[name]]
+        return [url_for('assets', filename=self.manifest['bundles'][name])]
+
+    def serve(self, filename: str):
+        if filename == MANIFEST or not os.path.isfile(os.path.join(self.dist_dir, filename)):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        served, encoding = filename, None
+        for ext, candidate in (('.br', 'br'), ('.gz', 'gzip')):
+            if candidate in request.accept_encodings and os.path.isfile(os.path.join(self.dist_dir, filename + ext)):
+                served, encoding = filename + ext, candidate
+                break
+        response = send_from_directory(self.dist_dir, served, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+assets = Assets()
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+assets_cli = AppGroup('assets', help='Build the static asset bundles.')
+
+
+@assets_cli.command('build')
+def build_command():
+    """Bundle, minify, fingerprint and compress the static assets into static/dist."""
+    manifest = Builder(current_app.static_folder, assets.dist_dir, current_app.static_url_path).write()
+    assets.manifest = manifest
+    for name, built in manifest['bundles'].items():
+        size = os.path.getsize(os.path.join(assets.dist_dir, built))
+        click.echo(f'{name} -> {built} ({size} bytes)')
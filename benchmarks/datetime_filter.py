@@ -0,0 +1,65 @@
+"""Benchmark the template datetime filter.
+
+Compares the original filter (dateutil parse + babel format_datetime per call),
+babel format_datetime on datetime values, and formatting.DatetimeFormatter, on
+the start times of N shows.
+
+Usage: python benchmarks/datetime_filter.py [N]
+
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from formatting import DATETIME_FORMATS, DatetimeFormatter  # noqa: E402
+
+
+def original_filter(value, format='medium'):
+    # The filter as it was before formatting.py, start_time was a string.
+    date = dateutil.parser.parse(value)
+    return babel.dates.format_datetime(date, DATETIME_FORMATS[format], locale='en')
+
+
+def babel_filter(value, format='medium'):
+    return babel.dates.format_datetime(value, DATETIME_FORMATS[format], locale='en')
+
+
+def start_times(n: int, unique: bool) -> list:
+    """Return n show start times over a year, on the half hour unless unique."""
+    rng = random.Random(42)
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    if unique:
+        return [base + timedelta(seconds=i * 331) for i in range(n)]
+    return [base + timedelta(minutes=30 * rng.randrange(365 * 48)) for _ in range(n)]
+
+
+def timed(func, values: list) -> float:
+    start = time.perf_counter()
+    for value in values:
+        func(value, 'full')
+    return time.perf_counter() - start
+
+
+def main(n: int):
+    for label, unique in (('half-hour slots', False), ('all unique', True)):
+        values = start_times(n, unique)
+        strings = [v.strftime('%Y-%m-%d %H:%M:%S') for v in values]
+        formatter = DatetimeFormatter()
+        assert formatter(values[0], 'full') == original_filter(strings[0], 'full')
+        print(f'{n} shows, {label}:')
+        for name, func, data in (('original (parse + babel)', original_filter, strings),
+                                 ('babel on datetime', babel_filter, values),
+                                 ('DatetimeFormatter', formatter, values)):
+            elapsed = timed(func, data)
+            print(f'  {name:<26} {elapsed:8.3f}s  {elapsed / n * 1e6:8.2f}us/show')
+        print(f'  {formatter.cache_info()}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,171 @@
+"""Load test the WSGI and async (ASGI) modes of the app on the same database.
+
+Each target is hit by C concurrent keep-alive clients for D seconds, every
+request going to a random venue or artist detail page, html or API (ids 1 to
+--max-id), unless --path is given. Results are printed and written as json, in
+the form {mode: {'requests', 'errors', 'rps', 'latency_ms': {'mean', 'p50',
+'p95', 'p99', 'max'}}}.
+
+With --spawn the script starts both servers itself, with the page cache
+disabled (CACHE_BACKEND=null) so every request reaches the database:
+gunicorn app:app with W workers of T threads, and uvicorn asgi:application
+with W workers. Both use DATABASE_URL. Otherwise pass already running servers
+with --target mode=url.
+
+Usage: python benchmarks/load_test.py --spawn [--workers W] [--threads T]
+       python benchmarks/load_test.py --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001
+       [--concurrency C] [--duration D] [--max-id N] [--path /api/v1/...] [--out results.json]
+
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DETAIL_PATHS = ('/venues/{}', '/artists/{}', '/api/v1/venues/{}', '/api/v1/artists/{}')
+
+
+def client(base_url: str, paths, max_id: int, deadline: float, seed: int, latencies: list, errors: list):
+    url = urlsplit(base_url)
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+    while time.perf_counter() < deadline:
+        path = rng.choice(paths).format(rng.randint(1, max_id))
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def run(base_url: str, paths, concurrency: int, duration: float, max_id: int) -> dict:
+    """Hit base_url with concurrency clients for duration seconds and return the results of the mode."""
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(base_url, paths, max_id, deadline, i, latencies, errors))
+               for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 2) if latencies else None,
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'p99': percentile(0.99),
+            'max': round(latencies[-1] * 1000, 2) if latencies else None,
+        }
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(base_url: str, timeout: float = 30):
+    url = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((url.hostname, url.port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{base_url} did not start within {timeout}s')
+
+
+def spawn(workers: int, threads: int) -> tuple:
+    """Start gunicorn (wsgi) and uvicorn (asgi) on free ports, returns ({mode: url}, [processes])."""
+    env = dict(os.environ, CACHE_BACKEND='null')
+    wsgi_port, asgi_port = free_port(), free_port()
+    commands = {
+        'wsgi': [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+                 '--bind', f'127.0.0.1:{wsgi_port}', '--log-level', 'warning', 'app:app'],
+        'asgi': [sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--port', str(asgi_port),
+                 '--log-level', 'warning', '--no-access-log', 'asgi:application'],
+    }
+    targets = {'wsgi': f'http://127.0.0.1:{wsgi_port}', 'asgi': f'http://127.0.0.1:{asgi_port}'}
+    processes = [subprocess.Popen(command, cwd=ROOT, env=env) for command in commands.values()]
+    for url in targets.values():
+        wait_for(url)
+    return targets, processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', action='append', default=[], metavar='MODE=URL')
+    parser.add_argument('--spawn', action='store_true', help='Start gunicorn and uvicorn on DATABASE_URL.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker.')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--max-id', type=int, default=100)
+    parser.add_argument('--path', action='append', help='Path to request, {} is replaced by a random id.')
+    parser.add_argument('--out', default='load_test.json')
+    args = parser.parse_args()
+
+    targets = dict(target.split('=', 1) for target in args.target)
+    processes = []
+    if args.spawn:
+        spawned, processes = spawn(args.workers, args.threads)
+        targets.update(spawned)
+    if not targets:
+        parser.error('give --target mode=url or --spawn')
+
+    paths = args.path or DETAIL_PATHS
+    results = {}
+    try:
+        for mode, url in targets.items():
+            run(url, paths, args.concurrency, args.warmup, args.max_id)
+            results[mode] = run(url, paths, args.concurrency, args.duration, args.max_id)
+            latency = results[mode]['latency_ms']
+            print(f'{mode:<6} {results[mode]["rps"]:>9.1f} req/s  p50 {latency["p50"]}ms  '
+                  f'p95 {latency["p95"]}ms  p99 {latency["p99"]}ms  errors {results[mode]["errors"]}')
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    with open(args.out, 'w') as f:
+        json.dump({
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'paths': list(paths),
+            'results': results
+        }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
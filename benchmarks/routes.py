@@ -0,0 +1,339 @@
+"""Benchmark every route of the app through the Flask test client.
+
+Each route is requested R times against the database at DATABASE_URL and
+reported with its latency percentiles, statements per request and peak
+memory allocated while serving one request (tracemalloc, measured in a
+separate pass). The page cache is disabled unless --cache is given, so the
+numbers reflect the database work. Routes that write (create, edit, delete,
+import) only run with --writes, on throwaway rows they create themselves.
+
+Results are written as json. With --compare, routes whose p50 grew by more
+than --threshold or that run more statements than in the previous results
+are reported as regressions and the exit status is 1. The exit status is
+also 1 when a route answers with a server error.
+
+Populate the database first with `flask seed --rows N`, or pass --rows N to
+add N synthetic rows before the run.
+
+Usage: python benchmarks/routes.py [--requests R] [--rows N] [--writes] [--route endpoint] [--cache memory]
+       [--out benchmark.json] [--compare previous.json] [--threshold 0.2]
+
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+# Requests per route of the endpoints returning every row, capped to keep runs short on big datasets.
+STREAM_REQUESTS = 3
+
+# The import endpoint is only enabled with a token, the benchmark sets its own.
+IMPORT_TOKEN = 'benchmark'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50, help='Requests per route.')
+    parser.add_argument('--rows', type=int, help='Synthetic rows to add before the run, see `flask seed`.')
+    parser.add_argument('--writes', action='store_true', help='Also run the routes that write.')
+    parser.add_argument('--route', action='append', help='Endpoint to run, can be repeated. Defaults to all.')
+    parser.add_argument('--cache', default='null', help='CACHE_BACKEND to run with.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the ids and search terms requested.')
+    parser.add_argument('--out', default='benchmark.json')
+    parser.add_argument('--compare', help='Previous results to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative p50 increase reported.')
+    return parser.parse_args()
+
+
+# ----------------------------------------------------------------------------#
+# Routes.
+# ----------------------------------------------------------------------------#
+
+def venue_form(name):
+    return {'name': name, 'city': 'San Francisco', 'state': 'CA', 'address': '1015 Folsom St',
+            'phone': '415-000-0000', 'genres': ['Jazz'], 'image_link': '',
+            'facebook_link': 'https://www.facebook.com/benchmark', 'website_link': '', 'seeking_description': ''}
+
+
+def artist_form(name):
+    return {'name': name, 'city': 'San Francisco', 'state': 'CA', 'phone': '415-000-0000', 'genres': ['Jazz'],
+            'image_link': '', 'facebook_link': 'https://www.facebook.com/benchmark', 'website_link': '',
+            'seeking_description': ''}
+
+
+class Context:
+    """Ids and search terms picked from the database, drawn at random by the requests."""
+
+    def __init__(self, rng, venue_ids, artist_ids, terms):
+        self.rng = rng
+        self.venue_ids = venue_ids
+        self.artist_ids = artist_ids
+        self.terms = terms
+
+    def venue(self):
+        return self.rng.choice(self.venue_ids)
+
+    def artist(self):
+        return self.rng.choice(self.artist_ids)
+
+    def term(self):
+        return self.rng.choice(self.terms)
+
+
+def _create_scratch(client, ctx, kind):
+    # Rows created by the benchmark are named so they can be found and deleted afterwards.
+    from models import Artist, Venue
+    model, form = (Venue, venue_form) if kind == 'venue' else (Artist, artist_form)
+    client.post(f'/{kind}s/create', data=form(f'zz-benchmark-{kind}'))
+    with client.application.app_context():
+        return model.query.filter_by(name=f'zz-benchmark-{kind}').order_by(model.id.desc()).first().id
+
+
+def _asset_url(client, name: str) -> str:
+    with client.application.test_request_context():
+        return client.application.extensions['assets'].urls(name)[0]
+
+
+# Requests of each endpoint, in the form endpoint: (writes, build(ctx, client) -> (method, url, options)).
+ROUTES = {
+    'index': (False, lambda ctx, c: ('GET', '/', {})),
+    'venues': (False, lambda ctx, c: ('GET', '/venues', {})),
+    'search_venues': (False, lambda ctx, c: ('POST', '/venues/search', {'data': {'search_term': ctx.term()}})),
+    'show_venue': (False, lambda ctx, c: ('GET', f'/venues/{ctx.venue()}', {})),
+    'create_venue_form': (False, lambda ctx, c: ('GET', '/venues/create', {})),
+    'create_venue_submission': (True, lambda ctx, c: ('POST', '/venues/create',
+                                                      {'data': venue_form('zz-benchmark-venue')})),
+    'delete_venue_submission': (True, lambda ctx, c: ('DELETE', f'/venues/{_create_scratch(c, ctx, "venue")}/delete',
+                                                      {})),
+    'artists': (False, lambda ctx, c: ('GET', '/artists', {})),
+    'search_artists': (False, lambda ctx, c: ('POST', '/artists/search', {'data': {'search_term': ctx.term()}})),
+    'show_artist': (False, lambda ctx, c: ('GET', f'/artists/{ctx.artist()}', {})),
+    'edit_artist': (False, lambda ctx, c: ('GET', f'/artists/{ctx.artist()}/edit', {})),
+    'edit_artist_submission': (True, lambda ctx, c: ('POST', f'/artists/{_create_scratch(c, ctx, "artist")}/edit',
+                                                     {'data': artist_form('zz-benchmark-artist')})),
+    'edit_venue': (False, lambda ctx, c: ('GET', f'/venues/{ctx.venue()}/edit', {})),
+    'edit_venue_submission': (True, lambda ctx, c: ('POST', f'/venues/{_create_scratch(c, ctx, "venue")}/edit',
+                                                    {'data': venue_form('zz-benchmark-venue')})),
+    'create_artist_form': (False, lambda ctx, c: ('GET', '/artists/create', {})),
+    'create_artist_submission': (True, lambda ctx, c: ('POST', '/artists/create',
+                                                       {'data': artist_form('zz-benchmark-artist')})),
+    'shows': (False, lambda ctx, c: ('GET', '/shows', {})),
+    'create_shows': (False, lambda ctx, c: ('GET', '/shows/create', {})),
+    'create_show_submission': (True, lambda ctx, c: ('POST', '/shows/create', {'data': {
+        'venue_id': _create_scratch(c, ctx, 'venue'), 'artist_id': ctx.artist(),
+        'start_time': '2035-01-01 20:00:00'}})),
+    'cache_stats': (False, lambda ctx, c: ('GET', '/cache/stats', {})),
+    'db_stats': (False, lambda ctx, c: ('GET', '/db/stats', {})),
+    'metrics': (False, lambda ctx, c: ('GET', '/metrics', {})),
+    'assets': (False, lambda ctx, c: ('GET', _asset_url(c, 'site.css'), {'headers': {'Accept-Encoding': 'gzip'}})),
+    'api.venues': (False, lambda ctx, c: ('GET', '/api/v1/venues', {})),
+    'api.venues_ndjson': (False, lambda ctx, c: ('GET', '/api/v1/venues.ndjson', {})),
+    'api.venue': (False, lambda ctx, c: ('GET', f'/api/v1/venues/{ctx.venue()}', {})),
+    'api.artists': (False, lambda ctx, c: ('GET', '/api/v1/artists', {})),
+    'api.artists_ndjson': (False, lambda ctx, c: ('GET', '/api/v1/artists.ndjson', {})),
+    'api.artist': (False, lambda ctx, c: ('GET', f'/api/v1/artists/{ctx.artist()}', {})),
+    'api.shows': (False, lambda ctx, c: ('GET', '/api/v1/shows', {})),
+    'api.shows_ndjson': (False, lambda ctx, c: ('GET', '/api/v1/shows.ndjson', {})),
+    'api.import_rows': (True, lambda ctx, c: ('POST', '/api/v1/imports/artist', {
+        'headers': {'Authorization': f'Bearer {IMPORT_TOKEN}'},
+        'data': {'format': 'ndjson', 'file': (_ndjson_upload(), 'artists.ndjson')}})),
+}
+
+
+def _ndjson_upload():
+    record = {'name': 'zz-benchmark-artist', 'city': 'Austin', 'state': 'TX', 'phone': '512-000-0000',
+              'genres': ['Jazz'], 'facebook_link': 'https://www.facebook.com/benchmark'}
+    return io.BytesIO(b''.join(json.dumps(record).encode() + b'\n' for _ in range(100)))
+
+
+def delete_scratch(db):
+    from models import Artist, Venue
+    for model in (Venue, Artist):
+        for row in model.query.filter(model.name == f'zz-benchmark-{model.__tablename__.lower()}'):
+            db.session.delete(row)
+    db.session.commit()
+
+
+# ----------------------------------------------------------------------------#
+# Measurement.
+# ----------------------------------------------------------------------------#
+
+def percentile(values: list, p: float) -> float:
+    return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3)
+
+
+def consume(response) -> int:
+    # Read the body chunk by chunk like a server would, so streamed responses are not held in memory.
+    for _ in response.iter_encoded():
+        pass
+    response.close()
+    return response.status_code
+
+
+def measure(client, ctx, build, requests: int, statements: list) -> dict:
+    """Run build's request requests times and return its latency, statement and status summary."""
+    latencies, queries, statuses = [], [], {}
+    for _ in range(requests):
+        method, url, options = build(ctx, client)
+        before = statements[0]
+        started = time.perf_counter()
+        status = consume(client.open(url, method=method, **options))
+        latencies.append(time.perf_counter() - started)
+        queries.append(statements[0] - before)
+        statuses[status] = statuses.get(status, 0) + 1
+    latencies.sort()
+    return {
+        'requests': requests,
+        'status': {str(code): count for code, count in sorted(statuses.items())},
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': round(latencies[-1] * 1000, 3),
+        },
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+    }
+
+
+def peak_memory(client, ctx, build) -> int:
+    """Return the peak bytes allocated while serving one request."""
+    method, url, options = build(ctx, client)
+    tracemalloc.start()
+    try:
+        consume(client.open(url, method=method, **options))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: dict, current: dict, threshold: float) -> list:
+    """Return the regressions of current against previous, as printable lines."""
+    regressions = []
+    for endpoint, result in current['routes'].items():
+        before = previous.get('routes', {}).get(endpoint)
+        if before is None:
+            continue
+        old, new = before['latency_ms']['p50'], result['latency_ms']['p50']
+        if old and (new - old) / old > threshold:
+            regressions.append(f'{endpoint}: p50 {old}ms -> {new}ms (+{(new - old) / old:.0%})')
+        if result['queries_per_request'] > before['queries_per_request']:
+            regressions.append(f'{endpoint}: {before["queries_per_request"]} -> '
+                               f'{result["queries_per_request"]} statements per request')
+    return regressions
+
+
+def main():
+    args = parse_args()
+    os.environ['CACHE_BACKEND'] = args.cache
+    from sqlalchemy import event, func, select
+
+    from app import app
+    from models import Artist, Show, Venue
+    from shared import db
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.config['IMPORT_API_TOKEN'] = IMPORT_TOKEN
+    app.config['TESTING'] = True
+    rng = random.Random(args.seed)
+    with app.app_context():
+        if args.rows:
+            from seeding import seed
+            print(f'seeded {seed(args.rows, seed=args.seed)}')
+        counts = {model.__tablename__.lower(): db.session.execute(select(func.count(model.id))).scalar()
+                  for model in (Venue, Artist, Show)}
+        venue_ids = [x for x, in db.session.execute(select(Venue.id).order_by(func.random()).limit(1000))]
+        artist_ids = [x for x, in db.session.execute(select(Artist.id).order_by(func.random()).limit(1000))]
+        names = [x for x, in db.session.execute(select(Venue.name).order_by(func.random()).limit(50))]
+        db.session.remove()
+    if not venue_ids or not artist_ids:
+        sys.exit('The database has no venues or artists, run `flask seed` or pass --rows.')
+    # Search terms: words of existing names, so searches find something, and a miss.
+    terms = sorted({word for name in names for word in name.split() if len(word) > 2}) + ['zzzz']
+    ctx = Context(rng, venue_ids, artist_ids, terms)
+
+    statements = [0]
+
+    def count_statement(*args):
+        statements[0] += 1
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'after_cursor_execute', count_statement)
+
+    client = app.test_client()
+    covered = {endpoint for endpoint in ROUTES}
+    missing = sorted({rule.endpoint for rule in app.url_map.iter_rules()} - covered - {'static'})
+    routes = {}
+    errors = []
+    try:
+        for endpoint, (writes, build) in ROUTES.items():
+            if (writes and not args.writes) or (args.route and endpoint not in args.route):
+                continue
+            requests = min(args.requests, STREAM_REQUESTS) if endpoint.endswith('_ndjson') else args.requests
+            measure(client, ctx, build, 1, statements)  # warm up
+            result = measure(client, ctx, build, requests, statements)
+            result['peak_alloc_kb'] = round(peak_memory(client, ctx, build) / 1024, 1)
+            routes[endpoint] = result
+            if any(code.startswith('5') for code in result['status']):
+                errors.append(f'{endpoint}: {result["status"]}')
+            latency = result['latency_ms']
+            print(f'{endpoint:<26} p50 {latency["p50"]:>9.2f}ms  p95 {latency["p95"]:>9.2f}ms  '
+                  f'p99 {latency["p99"]:>9.2f}ms  {result["queries_per_request"]:>6} q/req  '
+                  f'{result["peak_alloc_kb"]:>9.1f}KB  {result["status"]}')
+    finally:
+        if args.writes:
+            with app.app_context():
+                delete_scratch(db)
+
+    results = {
+        'meta': {
+            'started': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0],
+            'cache': args.cache,
+            'requests': args.requests,
+            'counts': counts,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'routes': routes,
+        'not_covered': missing,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    if missing:
+        print(f'Routes without a benchmark: {", ".join(missing)}')
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+    for line in errors:
+        print(f'ERROR {line}')
+    sys.exit(1 if regressions or errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Measure the memory held per show row by each way of loading a listing.
+
+The first N shows (in listing order) of the database at DATABASE_URL are
+loaded as:
+
+  entities     Show ORM entities with their venue and artist joined in, tracked
+               by the session (identity map and change tracking included)
+  rows         SQLAlchemy rows of the column-only listing query
+  dicts        those rows copied into dicts, what the views used to render
+  namedtuples  ShowRow named tuples, what get_shows_page returns now
+
+and reported in bytes per row, retained once loaded and peak while loading,
+measured with tracemalloc. Results are printed and written as json, in the
+form {kind: {'rows', 'bytes_per_row', 'peak_bytes_per_row', 'seconds'}}.
+
+Populate the database first, e.g. `flask seed --shows 1000000`. Entities take
+several GB at a million rows, leave them out with --kind.
+
+Usage: python benchmarks/row_memory.py [--rows N] [--kind entities --kind rows ...] [--out row_memory.json]
+
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+KINDS = ('entities', 'rows', 'dicts', 'namedtuples')
+
+
+def loaders(limit: int) -> dict:
+    from sqlalchemy.orm import joinedload
+
+    from models import Show
+    from repository import SHOW_KEY, ShowRow, _show_rows
+
+    def rows():
+        return _show_rows().order_by(*SHOW_KEY).limit(limit).all()
+
+    return {
+        'entities': lambda: (Show.query.options(joinedload(Show.venue), joinedload(Show.artist))
+                             .order_by(*SHOW_KEY).limit(limit).all()),
+        'rows': rows,
+        'dicts': lambda: [dict(x._mapping) for x in rows()],
+        'namedtuples': lambda: [ShowRow._make(x) for x in rows()],
+    }
+
+
+def measure(load) -> dict:
+    """Load the rows and return the memory they hold per row."""
+    from shared import db
+
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    rows = load()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(rows)
+    del rows
+    db.session.expunge_all()
+    gc.collect()
+    return {
+        'rows': count,
+        'bytes_per_row': round(current / max(count, 1)),
+        'peak_bytes_per_row': round(peak / max(count, 1)),
+        'seconds': round(elapsed, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='Shows to load.')
+    parser.add_argument('--kind', action='append', choices=KINDS, help='Kind to measure, can be repeated.')
+    parser.add_argument('--out', default='row_memory.json')
+    args = parser.parse_args()
+
+    from app import app
+
+    results = {}
+    with app.app_context():
+        kinds = loaders(args.rows)
+        for kind in args.kind or KINDS:
+            results[kind] = result = measure(kinds[kind])
+            print(f'{kind:<12} {result["rows"]:>9} rows  {result["bytes_per_row"]:>6} B/row retained  '
+                  f'{result["peak_bytes_per_row"]:>6} B/row peak  {result["seconds"]}s')
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import has_request_context, request
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+class LRUBackend:
+    """In-process cache bounded by entry count, with a per-entry time to live."""
+
+    # Invalidations only reach the process that made them.
+    shared = False
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Return the value stored under key, or None if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class LocalSharedBackend:
+    """Stand-in for a shared cache server, for development and tests.
+
+    Values are pickled on the way in and out like a networked backend would, so
+    anything that cannot be shared between workers fails here too.
+
+    """
+
+    shared = True
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self.evictions = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            return None
+        return pickle.loads(item[0])
+
+    def set(self, key: str, value, ttl: float = None):
+        item = (pickle.dumps(value), time.monotonic() + (self.ttl if ttl is None else ttl))
+        with self._lock:
+            self._data[key] = item
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisBackend:
+    """Cache shared by every worker, stored in redis.
+
+    Requires the redis package, evictions are managed (and counted) by the redis server.
+
+    """
+
+    shared = True
+
+    def __init__(self, url: str, ttl: float = 300, prefix: str = 'fyyur:'):
+        import redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        value = self._client.get(self.prefix + key)
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key: str, value, ttl: float = None):
+        self._client.set(self.prefix + key, pickle.dumps(value), ex=int(self.ttl if ttl is None else ttl))
+
+    def delete(self, key: str):
+        self._client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+def create_backend(name: str, maxsize: int, ttl: float, redis_url: str = None, prefix: str = 'fyyur:'):
+    """Return the backend called name ('memory', 'shared-local', 'redis' or 'null'), None for 'null'."""
+    if name == 'memory':
+        return LRUBackend(maxsize, ttl)
+    if name == 'shared-local':
+        return LocalSharedBackend(ttl)
+    if name == 'redis':
+        return RedisBackend(redis_url, ttl, prefix)
+    if name == 'null':
+        return None
+    raise ValueError(f'Unknown cache backend {name!r}')
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class Cache:
+    """Flask extension providing a read-through cache for page data.
+
+    Entries are grouped in namespaces such as 'venue:3' or 'venue_areas'. Each
+    namespace has a random version token stored in the backend and part of every
+    key, invalidate() replaces the token so all entries of the namespace become
+    unreachable at once. A lost token (evicted or expired) is replaced the same
+    way, so stale entries can never be read back.
+
+    A backend that is not shared by the workers ('memory') cannot see the
+    invalidations of the other processes, so it is bypassed on requests served
+    by a multi-process server (wsgi.multiprocess, e.g. gunicorn with several
+    workers or the async mode): no cached data, entity tags or fragments.
+
+    Keys also include the current upcoming bucket, the time divided into
+    CACHE_BUCKET_SECONDS slots, so the past/upcoming split of cached pages is at
+    most one bucket old.
+
+    Configuration: CACHE_BACKEND ('memory', 'shared-local', 'redis' or 'null'),
+    CACHE_MAXSIZE, CACHE_TTL, CACHE_BUCKET_SECONDS and CACHE_REDIS_URL.
+
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.bucket_seconds = 60
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = create_backend(app.config.get('CACHE_BACKEND', 'memory'), app.config.get('CACHE_MAXSIZE', 1024),
+                                      app.config.get('CACHE_TTL', 300), app.config.get('CACHE_REDIS_URL'))
+        self.bucket_seconds = app.config.get('CACHE_BUCKET_SECONDS', 60)
+        app.extensions['cache'] = self
+
+    def is_active(self) -> bool:
+        """Return whether cached data and entity tags are used for the current request, see the class docs."""
+        if self.backend is None:
+            return False
+        return self.backend.shared or not (has_request_context() and request.environ.get('wsgi.multiprocess'))
+
+    def upcoming_bucket(self) -> int:
+        """Return the current slot of time used to key upcoming-sensitive data."""
+        return int(time.time() // self.bucket_seconds)
+
+    def _version(self, namespace: str) -> str:
+        version_key = f'version:{namespace}'
+        version = self.backend.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            # Versions must outlive the entries they guard.
+            self.backend.set(version_key, version, ttl=self.backend.ttl * 2)
+        return version
+
+    def _key(self, namespace: str, args: tuple) -> str:
+        return f'{namespace}:{self._version(namespace)}:{self.upcoming_bucket()}:{args!r}'
+
+    def get_or_set(self, namespace: str, args: tuple, compute):
+        """Return the cached value for namespace/args, calling compute() on a miss.
+
+        A compute() result of None is returned but not cached.
+
+        """
+        if not self.is_active():
+            return compute()
+        key = self._key(namespace, args)
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = compute()
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    async def get_or_set_async(self, namespace: str, args: tuple, compute):
+        """Like get_or_set for a coroutine function compute, used by the async mode (see asgi.py).
+
+        Backend calls are not awaited, they are in-process or a single fast
+        round trip to redis.
+
+        """
+        if not self.is_active():
+            return await compute()
+        key = self._key(namespace, args)
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await compute()
+        if value is not None:
+            self.backend.set(key, value)
+        return value
+
+    def etag(self, namespaces: list, args: tuple = ()) -> str:
+        """Return an entity tag for data derived from namespaces and args.
+
+        The tag only depends on the namespace versions and the upcoming bucket, so
+        it can be compared with If-None-Match without querying the database. It
+        changes whenever one of the namespaces is invalidated. Returns None when
+        caching is disabled or inactive (see is_active), as nothing tracks changes then.
+
+        """
+        if not self.is_active():
+            return None
+        versions = ':'.join(self._version(namespace) for namespace in namespaces)
+        key = f'{versions}:{self.upcoming_bucket()}:{args!r}'
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def invalidate(self, *namespaces: str):
+        """Drop every entry cached under the given namespaces."""
+        if self.backend is None:
+            return
+        for namespace in namespaces:
+            self.backend.set(f'version:{namespace}', uuid.uuid4().hex, ttl=self.backend.ttl * 2)
+
+    def stats(self) -> dict:
+        """Return the hit/miss/eviction counters of this process."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions if self.backend is not None else 0
+        }
+
+
+cache = Cache()
@@ -0,0 +1,187 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from cache import cache
+from jobs import job_queue
+from models import Venue, Artist, Show
+from repository import is_upcoming, upcoming_boundary
+from shared import db
+
+# Entities with materialized show counters, in the form kind: (model, show foreign key).
+COUNTED = {
+    'venue': (Venue, Show.venue_id),
+    'artist': (Artist, Show.artist_id),
+}
+
+# Ids refreshed per UPDATE statement.
+BATCH_SIZE = 1000
+
+
+# ----------------------------------------------------------------------------#
+# Counters.
+# ----------------------------------------------------------------------------#
+
+def _computed(model, show_fk, now):
+    """Return the correlated subqueries computing the counters of model rows from the shows."""
+    upcoming = select(func.count(Show.id)).where(show_fk == model.id, is_upcoming(now))
+    past = select(func.count(Show.id)).where(show_fk == model.id, ~is_upcoming(now))
+    next_show = select(func.min(Show.start_time)).where(show_fk == model.id, is_upcoming(now))
+    return upcoming.scalar_subquery(), past.scalar_subquery(), next_show.scalar_subquery()
+
+
+def _refresh(model, show_fk, ids: list, now) -> int:
+    ids = sorted(set(ids))
+    upcoming, past, next_show = _computed(model, show_fk, now)
+    for i in range(0, len(ids), BATCH_SIZE):
+        batch = ids[i:i + BATCH_SIZE]
+        # Under READ COMMITTED the subqueries of the UPDATE see the shows committed when it
+        # starts. Locking the rows first, in id order, makes a concurrent refresh of the same
+        # rows wait for this transaction to commit, its UPDATE then starts with a snapshot
+        # including our shows.
+        db.session.execute(select(model.id).where(model.id.in_(batch)).order_by(model.id).with_for_update())
+        db.session.execute(update(model)
+                           .where(model.id.in_(batch))
+                           .values(upcoming_shows_count=upcoming, past_shows_count=past, next_show_at=next_show)
+                           .execution_options(synchronize_session=False))
+    return len(ids)
+
+
+def refresh_counters(venue_ids=(), artist_ids=(), now=None):
+    """Recompute the show counters of the given venues and artists, in the current transaction.
+
+    Counters are recomputed from the Show table, under a lock on the venue and
+    artist rows so that concurrent writers adding shows to the same rows do
+    not overwrite each other's counts.
+
+    """
+    if now is None:
+        now = upcoming_boundary()
+    _refresh(Venue, Show.venue_id, venue_ids, now)
+    _refresh(Artist, Show.artist_id, artist_ids, now)
+
+
+def roll_over(now=None) -> int:
+    """Move shows that started since the last run from upcoming to past.
+
+    Only venues and artists whose next_show_at has passed are refreshed, found
+    with the next_show_at index. Returns the number of rows refreshed.
+
+    """
+    if now is None:
+        now = upcoming_boundary()
+    refreshed = 0
+    for model, show_fk in COUNTED.values():
+        ids = [x for x, in db.session.query(model.id).filter(model.next_show_at < now)]
+        refreshed += _refresh(model, show_fk, ids, now)
+    db.session.commit()
+    if refreshed:
+        cache.invalidate('venue_areas')
+    return refreshed
+
+
+@job_queue.task('counters.roll', concurrency=1, every=60)
+def roll_over_job():
+    """roll_over run by the job workers, instead of a cron running `flask counters roll`."""
+    roll_over()
+
+
+def check_counters(now=None) -> list:
+    """Compare the stored counters with the Show table.
+
+    Returns a list of the mismatches in the form
+    [(kind, id, (stored counters), (actual counters)),...]
+    where counters are (upcoming_shows_count, past_shows_count, next_show_at).
+
+    """
+    if now is None:
+        now = upcoming_boundary()
+    mismatches = []
+    for kind, (model, show_fk) in COUNTED.items():
+        upcoming, past, next_show = _computed(model, show_fk, now)
+        rows = (db.session.query(model.id, model.upcoming_shows_count, model.past_shows_count, model.next_show_at,
+                                 upcoming, past, next_show)
+                .filter((model.upcoming_shows_count != upcoming)
+                        | (model.past_shows_count != past)
+                        | model.next_show_at.is_distinct_from(next_show))
+                .order_by(model.id))
+        mismatches += [(kind, row[0], tuple(row[1:4]), tuple(row[4:])) for row in rows]
+    return mismatches
+
+
+# ----------------------------------------------------------------------------#
+# Session hooks.
+# ----------------------------------------------------------------------------#
+
+def _show_owner_ids(show):
+    """Return the current and previous (venue ids, artist ids) of a show."""
+    state = inspect(show)
+    venue_ids = {show.venue_id, *state.attrs.venue_id.history.deleted}
+    artist_ids = {show.artist_id, *state.attrs.artist_id.history.deleted}
+    return venue_ids - {None}, artist_ids - {None}
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_changed_shows(session, flush_context):
+    # Shows added, changed or deleted (including by the venue/artist cascades)
+    # are collected here and their owners refreshed right before commit.
+    venue_ids, artist_ids = session.info.setdefault('counter_ids', (set(), set()))
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Show):
+            venues, artists = _show_owner_ids(obj)
+            venue_ids |= venues
+            artist_ids |= artists
+
+
+@event.listens_for(Session, 'before_commit')
+def refresh_changed_counters(session):
+    # commit() only flushes after this hook, flush now so every change is collected.
+    session.flush()
+    venue_ids, artist_ids = session.info.pop('counter_ids', (None, None))
+    if venue_ids or artist_ids:
+        refresh_counters(venue_ids, artist_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changed_shows(session):
+    session.info.pop('counter_ids', None)
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+counters_cli = AppGroup('counters', help='Maintain the materialized venue and artist show counters.')
+
+
+@counters_cli.command('roll')
+def roll_command():
+    """Move shows that have started from upcoming to past, the job workers run it every minute."""
+    click.echo(f'Refreshed {roll_over()} venues and artists.')
+
+
+@counters_cli.command('check')
+@click.option('--fix', is_flag=True, help='Recompute the counters that do not match.')
+def check_command(fix):
+    """Report venues and artists whose counters do not match their shows.
+
+    Rows whose next show started since the last roll over are reported too,
+    nothing is written unless --fix is given.
+
+    """
+    now = upcoming_boundary()
+    mismatches = check_counters(now)
+    for kind, entity_id, stored, actual in mismatches:
+        click.echo(f'{kind} {entity_id}: stored {stored}, actual {actual}')
+    if fix and mismatches:
+        refresh_counters([x for kind, x, _, _ in mismatches if kind == 'venue'],
+                         [x for kind, x, _, _ in mismatches if kind == 'artist'], now)
+        db.session.commit()
+        cache.invalidate('venue_areas')
+        click.echo(f'Fixed {len(mismatches)} counters.')
+    elif not mismatches:
+        click.echo('All counters match.')
@@ -0,0 +1,186 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from routing import REPLICA_BIND_PREFIX
+from shared import db
+
+
+# ----------------------------------------------------------------------------#
+# Pool.
+# ----------------------------------------------------------------------------#
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait and how full the pool gets.
+
+    Counters are per process, each gunicorn worker has its own pool.
+
+    """
+
+    def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kw):
+        super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kw)
+        self.max_connections = pool_size + max(max_overflow, 0)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.invalidations = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.peak_checked_out = 0
+        # Recent waits, for percentiles.
+        self._waits = deque(maxlen=1024)
+        self._lock = threading.Lock()
+        event.listen(self, 'invalidate', self._on_invalidate)
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise
+        wait = time.perf_counter() - started
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.peak_checked_out = max(self.peak_checked_out, self.checkedout())
+            self._waits.append(wait)
+        return connection
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Return the checkout latency (in milliseconds) and saturation counters of the pool."""
+        with self._lock:
+            waits = sorted(self._waits)
+            checkouts, total_wait = self.checkouts, self.total_wait
+            stats = {
+                'checkouts': checkouts,
+                'timeouts': self.timeouts,
+                'invalidations': self.invalidations,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'peak_checked_out': self.peak_checked_out,
+            }
+
+        def percentile(p):
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000, 3) if waits else 0.0
+
+        checked_out = self.checkedout()
+        stats.update({
+            'mean_wait_ms': round(total_wait / checkouts * 1000, 3) if checkouts else 0.0,
+            'p50_wait_ms': percentile(0.50),
+            'p95_wait_ms': percentile(0.95),
+            'p99_wait_ms': percentile(0.99),
+            'size': self.size(),
+            'checked_in': self.checkedin(),
+            'checked_out': checked_out,
+            'overflow': self.overflow(),
+            'max_connections': self.max_connections,
+            'saturation': round(checked_out / self.max_connections, 3) if self.max_connections else 0.0,
+        })
+        return stats
+
+
+# ----------------------------------------------------------------------------#
+# Engine configuration.
+# ----------------------------------------------------------------------------#
+
+def engine_options(config, uri: str, base: dict = None) -> dict:
+    """Build the engine options of the database at uri from the DB_* settings, see config.py.
+
+    SQLite keeps the defaults Flask-SQLAlchemy picks for it. With DB_PGBOUNCER
+    the app does not pool connections itself, PgBouncer does, and the statement
+    timeout is set per transaction since transaction pooling does not carry
+    session settings over.
+
+    """
+    options = dict(base or {})
+    if uri.startswith('sqlite'):
+        return options
+    if config['DB_PGBOUNCER']:
+        options['poolclass'] = NullPool
+        return options
+
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    })
+    if config['DB_STATEMENT_TIMEOUT_MS']:
+        connect_args = dict(options.get('connect_args', {}))
+        connect_args['options'] = f'-c statement_timeout={int(config["DB_STATEMENT_TIMEOUT_MS"])}'
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure_engines(config):
+    """Set SQLALCHEMY_ENGINE_OPTIONS and add a SQLALCHEMY_BINDS entry per replica in DB_REPLICA_URIS.
+
+    Must run before db.init_app, Flask-SQLAlchemy does not apply
+    SQLALCHEMY_ENGINE_OPTIONS to binds so each replica gets its own copy.
+
+    """
+    base = config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    for i, uri in enumerate(config['DB_REPLICA_URIS']):
+        binds[f'{REPLICA_BIND_PREFIX}{i}'] = {'url': uri, **engine_options(config, uri, base)}
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config, config['SQLALCHEMY_DATABASE_URI'], base)
+    config['SQLALCHEMY_BINDS'] = binds
+
+
+def set_local_statement_timeout(timeout_ms: int):
+    def on_begin(conn):
+        conn.exec_driver_sql(f'SET LOCAL statement_timeout = {int(timeout_ms)}')
+    return on_begin
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class DatabaseMonitor:
+    """Flask extension exposing the pool metrics of every engine of db.
+
+    init_app must run after db.init_app, the engines are created there.
+
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        timeout_ms = app.config.get('DB_STATEMENT_TIMEOUT_MS')
+        if app.config.get('DB_PGBOUNCER') and timeout_ms:
+            with app.app_context():
+                for engine in db.engines.values():
+                    event.listen(engine, 'begin', set_local_statement_timeout(timeout_ms))
+        app.extensions['database_monitor'] = self
+
+    def stats(self) -> dict:
+        """Return the pool metrics of each engine, keyed by bind key ('default' for the main one)."""
+        stats = {}
+        with self.app.app_context():
+            for key, engine in db.engines.items():
+                pool = engine.pool
+                name = key or 'default'
+                stats[name] = pool.stats() if isinstance(pool, TimedQueuePool) else {'pool': type(pool).__name__}
+        return stats
+
+
+db_monitor = DatabaseMonitor()
@@ -0,0 +1,308 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import csv
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import Boolean, DateTime, Integer, func, select
+
+from models import Venue, Artist, Show, Genre, venue_genres, artist_genres
+from shared import db
+
+# Exportable tables, in the form kind: (model, genre association foreign key or None).
+# Venues and artists get a genres column with the comma joined genre names.
+EXPORTABLE = {
+    'genre': (Genre, None),
+    'venue': (Venue, venue_genres.c.venue_id),
+    'artist': (Artist, artist_genres.c.artist_id),
+    'show': (Show, None),
+}
+
+FORMATS = ('csv', 'parquet')
+
+STATE_FILE = 'state.json'
+
+
+# ----------------------------------------------------------------------------#
+# Writers.
+# ----------------------------------------------------------------------------#
+
+class _ChunkedWriter:
+    """Write rows to numbered files of at most chunk_rows rows each."""
+
+    extension = None
+
+    def __init__(self, directory: str, kind: str, columns: list, chunk_rows: int):
+        self.directory = directory
+        self.kind = kind
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.files = []
+        self._rows_in_chunk = 0
+        self._open = False
+
+    def write(self, rows: list):
+        while rows:
+            if not self._open:
+                path = os.path.join(self.directory, f'{self.kind}-{len(self.files):05d}.{self.extension}')
+                self._start(path)
+                self.files.append(os.path.basename(path))
+                self._open = True
+            room = self.chunk_rows - self._rows_in_chunk
+            self._write(rows[:room])
+            self._rows_in_chunk += len(rows[:room])
+            rows = rows[room:]
+            if self._rows_in_chunk >= self.chunk_rows:
+                self.close()
+
+    def close(self):
+        if self._open:
+            self._finish()
+            self._open = False
+            self._rows_in_chunk = 0
+
+    def _start(self, path: str):
+        raise NotImplementedError
+
+    def _write(self, rows: list):
+        raise NotImplementedError
+
+    def _finish(self):
+        raise NotImplementedError
+
+
+class CsvWriter(_ChunkedWriter):
+    """Gzip compressed csv with a header line, datetimes as ISO 8601."""
+
+    extension = 'csv.gz'
+
+    def _start(self, path):
+        self._file = gzip.open(path, 'wt', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow([column.name for column in self.columns])
+
+    def _write(self, rows):
+        self._writer.writerows([v.isoformat() if isinstance(v, datetime) else v for v in row] for row in rows)
+
+    def _finish(self):
+        self._file.close()
+
+
+class ParquetWriter(_ChunkedWriter):
+    """Zstd compressed parquet, with a schema derived from the column types.
+
+    Requires the pyarrow package.
+
+    """
+
+    extension = 'parquet'
+
+    def __init__(self, directory, kind, columns, chunk_rows):
+        import pyarrow
+        import pyarrow.parquet
+        super().__init__(directory, kind, columns, chunk_rows)
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.schema = pyarrow.schema([(column.name, self._arrow_type(column.type)) for column in columns])
+
+    def _arrow_type(self, sql_type):
+        if isinstance(sql_type, Boolean):
+            return self._pa.bool_()
+        if isinstance(sql_type, Integer):
+            return self._pa.int64()
+        if isinstance(sql_type, DateTime):
+            return self._pa.timestamp('us', tz='UTC' if sql_type.timezone else None)
+        return self._pa.string()
+
+    def _start(self, path):
+        self._writer = self._pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def _write(self, rows):
+        arrays = [self._pa.array([row[i] for row in rows], type=field.type)
+                  for i, field in enumerate(self.schema)]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def _finish(self):
+        self._writer.close()
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+
+# ----------------------------------------------------------------------------#
+# Export.
+# ----------------------------------------------------------------------------#
+
+class _GenresColumn:
+    """Stand-in for the derived genres column, typed like a string column."""
+
+    name = 'genres'
+    type = Genre.name.type
+
+
+def _genres(conn, genre_fk, ids: list) -> dict:
+    """Return the comma joined genre names of the given venue or artist ids, as {id: names}."""
+    genres = {}
+    rows = (select(genre_fk, Genre.name)
+            .join(Genre, Genre.id == genre_fk.table.c.genre_id)
+            .where(genre_fk.in_(ids))
+            .order_by(Genre.name))
+    for entity_id, name in conn.execute(rows):
+        genres[entity_id] = f'{genres[entity_id]},{name}' if entity_id in genres else name
+    return genres
+
+
+def export_table(engine, kind: str, directory: str, formats: list, since: datetime = None,
+                 chunk_rows: int = 500000, batch_size: int = 5000) -> dict:
+    """Export the rows of kind changed since the given time, or all rows when since is None.
+
+    Rows are read through a server-side cursor batch_size at a time and written
+    to every format as they arrive, so memory use does not depend on the size of
+    the table. Each format gets numbered files of at most chunk_rows rows.
+
+    Returns the manifest entry of the table, in the form
+    {'rows': int, 'since': iso timestamp or None, 'files': [file names,...]}
+
+    """
+    model, genre_fk = EXPORTABLE[kind]
+    table = model.__table__
+    columns = list(table.columns) + ([_GenresColumn()] if genre_fk is not None else [])
+    query = select(table).order_by(table.c.id)
+    # Tables without updated_at (genres) are small and always exported in full.
+    if since is not None and 'updated_at' in table.c:
+        query = query.where(table.c.updated_at >= since)
+
+    writers = [WRITERS[fmt](directory, kind, columns, chunk_rows) for fmt in formats]
+    rows = 0
+    try:
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+            for partition in result.partitions(batch_size):
+                partition = [tuple(row) for row in partition]
+                if genre_fk is not None:
+                    genres = _genres(conn, genre_fk, [row[0] for row in partition])
+                    partition = [row + (genres.get(row[0]),) for row in partition]
+                for writer in writers:
+                    writer.write(partition)
+                rows += len(partition)
+    finally:
+        for writer in writers:
+            writer.close()
+    return {
+        'rows': rows,
+        'since': since.isoformat() if since is not None and 'updated_at' in table.c else None,
+        'files': [name for writer in writers for name in writer.files]
+    }
+
+
+def _read_state(out_dir: str) -> dict:
+    path = os.path.join(out_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _create_run_dir(out_dir: str, started: datetime) -> str:
+    """Create and return a new directory for a run started at started.
+
+    The clock may be coarse (sqlite has whole seconds), a run of the same
+    instant gets a -1, -2... suffix rather than sharing its directory.
+
+    """
+    name = started.strftime('%Y%m%dT%H%M%S%f')
+    attempt = 0
+    while True:
+        run_dir = os.path.join(out_dir, f'{name}-{attempt}' if attempt else name)
+        try:
+            os.makedirs(run_dir)
+            return run_dir
+        except FileExistsError:
+            attempt += 1
+
+
+def export_snapshot(out_dir: str, kinds: list = None, formats: list = ('csv',), incremental: bool = False,
+                    jobs: int = 4, chunk_rows: int = 500000, batch_size: int = 5000,
+                    overlap: timedelta = timedelta(minutes=5)) -> dict:
+    """Export tables to a new run directory under out_dir, one thread per table.
+
+    The run starts at the database clock and is recorded in out_dir/state.json.
+    An incremental run exports the rows updated since the previous run started,
+    minus overlap to catch transactions that committed late. Rows may therefore
+    appear in two runs, consumers keep the one with the latest updated_at.
+    Deleted rows are not tracked, a full export is needed to drop them.
+
+    Returns the manifest of the run, also written to its manifest.json.
+
+    """
+    kinds = kinds or list(EXPORTABLE)
+    engine = db.engine
+    state = _read_state(out_dir)
+    with engine.connect() as conn:
+        started = conn.execute(select(func.now())).scalar()
+    run_dir = _create_run_dir(out_dir, started)
+
+    clock = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for kind in kinds:
+            since = None
+            if incremental and kind in state:
+                since = datetime.fromisoformat(state[kind]) - overlap
+            futures[kind] = executor.submit(export_table, engine, kind, run_dir, list(formats), since,
+                                            chunk_rows, batch_size)
+        tables = {kind: future.result() for kind, future in futures.items()}
+
+    manifest = {
+        'started': started.isoformat(),
+        'incremental': incremental,
+        'seconds': round(time.perf_counter() - clock, 3),
+        'tables': tables
+    }
+    with open(os.path.join(run_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    state.update({kind: started.isoformat() for kind in kinds})
+    with open(os.path.join(out_dir, STATE_FILE), 'w') as f:
+        json.dump(state, f, indent=2)
+    manifest['directory'] = run_dir
+    return manifest
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+@click.command('export')
+@click.argument('out_dir', type=click.Path(file_okay=False))
+@click.option('--table', 'kinds', multiple=True, type=click.Choice(sorted(EXPORTABLE)),
+              help='Table to export, can be repeated. Defaults to all of them.')
+@click.option('--format', 'formats', multiple=True, type=click.Choice(FORMATS), default=['csv'],
+              show_default=True, help='Output format, can be repeated.')
+@click.option('--incremental', is_flag=True, help='Only export rows updated since the previous run.')
+@click.option('--jobs', default=4, show_default=True, help='Tables exported in parallel.')
+@with_appcontext
+def export_command(out_dir, kinds, formats, incremental, jobs):
+    """Export venues, artists, shows and genres to compressed csv or parquet files."""
+    if 'parquet' in formats:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise click.ClickException('The parquet format requires the pyarrow package.')
+    config = current_app.config
+    manifest = export_snapshot(out_dir, list(kinds), formats, incremental=incremental, jobs=jobs,
+                               chunk_rows=config['EXPORT_CHUNK_ROWS'], batch_size=config['EXPORT_BATCH_SIZE'],
+                               overlap=timedelta(seconds=config['EXPORT_OVERLAP_SECONDS']))
+    for kind, table in manifest['tables'].items():
+        click.echo(f'{kind}: {table["rows"]} rows in {len(table["files"])} files')
+    click.echo(f'Exported to {manifest["directory"]} in {manifest["seconds"]:.2f}s.')
@@ -5,9 +5,10 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # Requests every route once, fails on a server error (see benchmarks/routes.py).
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python benchmarks/routes.py --requests 1 --out benchmark.json", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
@@ -39,8 +40,9 @@ def heroku():
 
 
 def heroku_test():
+    # Read-only routes only, the write routes are not run without --writes.
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python benchmarks/routes.py --requests 1 --out /tmp/benchmark.json"
     )
 
 
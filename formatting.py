@@ -0,0 +1,51 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import parse_pattern
+
+
+# ----------------------------------------------------------------------------#
+# Datetime formatting.
+# ----------------------------------------------------------------------------#
+
+# Named formats accepted by the datetime filter, any other format is used as a babel pattern.
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+class DatetimeFormatter:
+    """Format datetimes for templates with pre-compiled babel patterns.
+
+    Equivalent to babel.dates.format_datetime(value, pattern, locale=locale) but
+    the locale and the named patterns are parsed once, datetime values are used
+    as is and strings are only parsed as a fallback. Results are memoized in a
+    bounded LRU, show listings repeat the same start times a lot.
+
+    """
+
+    def __init__(self, locale: str = 'en', maxsize: int = 4096):
+        self.locale = Locale.parse(locale)
+        self.patterns = {name: parse_pattern(pattern) for name, pattern in DATETIME_FORMATS.items()}
+        self._format = lru_cache(maxsize=maxsize)(self._format_uncached)
+
+    def _format_uncached(self, value, format: str) -> str:
+        if not isinstance(value, datetime):
+            value = dateutil.parser.parse(value)
+        pattern = self.patterns.get(format)
+        if pattern is None:
+            pattern = parse_pattern(format)
+        return pattern.apply(value, self.locale)
+
+    def __call__(self, value, format: str = 'medium') -> str:
+        return self._format(value, format)
+
+    def cache_info(self):
+        """Return the hit/miss statistics of the LRU."""
+        return self._format.cache_info()
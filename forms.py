@@ -1,8 +1,51 @@
+import re
 from datetime import datetime
 
 from flask_wtf import FlaskForm
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, URL, Regexp
+from wtforms.validators import DataRequired, Optional, URL, Regexp
+
+from cache import cache
+from models import Genre
+
+
+def get_genre_choices() -> list:
+    """Return the genre choices for the forms, cached in the 'genres' namespace.
+
+    An empty Genre table is not cached, so genres seeded after the process
+    started show up on the next form.
+
+    """
+    def load():
+        return [(name, name) for name, in Genre.query.with_entities(Genre.name).order_by(Genre.name)] or None
+    return cache.get_or_set('genres', (), load) or []
+
+
+@event.listens_for(Session, 'after_flush')
+def collect_genre_changes(session, flush_context):
+    if any(isinstance(x, Genre) for x in (*session.new, *session.dirty, *session.deleted)):
+        session.info['genres_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_genre_choices(session):
+    if session.info.pop('genres_changed', False):
+        cache.invalidate('genres')
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_genre_changes(session):
+    session.info.pop('genres_changed', None)
+
+
+class GenreChoicesMixin:
+    """Fill the genres multi-select with get_genre_choices()."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.genres.choices = get_genre_choices()
 
 
 class ShowForm(FlaskForm):
@@ -21,7 +64,7 @@ class ShowForm(FlaskForm):
     )
 
 
-class VenueForm(FlaskForm):
+class VenueForm(GenreChoicesMixin, FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -95,32 +138,18 @@ class VenueForm(FlaskForm):
                    message="Invalid phone number, must be in the form: XXX-XXX-XXXX")]
     )
     image_link = StringField(
-        'image_link'
+        # Fetched by the images.check_link job, only http(s) links are accepted.
+        'image_link',
+        validators=[
+            Optional(),
+            URL(message='Invalid image link'),
+            Regexp(r'^https?://', flags=re.IGNORECASE, message='The image link must be an http or https url')
+        ]
     )
     genres = SelectMultipleField(
-        # TODO implement enum restriction
+        # Choices come from the Genre table, see GenreChoicesMixin.
         'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        choices=[]
     )
     facebook_link = StringField(
         'facebook_link',
@@ -140,7 +169,7 @@ class VenueForm(FlaskForm):
     )
 
 
-class ArtistForm(FlaskForm):
+class ArtistForm(GenreChoicesMixin, FlaskForm):
     name = StringField(
         'name', validators=[DataRequired()]
     )
@@ -211,31 +240,18 @@ class ArtistForm(FlaskForm):
                    message='Invalid phone number, must be in the form: XXX-XXX-XXXX')]
     )
     image_link = StringField(
-        'image_link'
+        # Fetched by the images.check_link job, only http(s) links are accepted.
+        'image_link',
+        validators=[
+            Optional(),
+            URL(message='Invalid image link'),
+            Regexp(r'^https?://', flags=re.IGNORECASE, message='The image link must be an http or https url')
+        ]
     )
     genres = SelectMultipleField(
+        # Choices come from the Genre table, see GenreChoicesMixin.
         'genres', validators=[DataRequired()],
-        choices=[
-            ('Alternative', 'Alternative'),
-            ('Blues', 'Blues'),
-            ('Classical', 'Classical'),
-            ('Country', 'Country'),
-            ('Electronic', 'Electronic'),
-            ('Folk', 'Folk'),
-            ('Funk', 'Funk'),
-            ('Hip-Hop', 'Hip-Hop'),
-            ('Heavy Metal', 'Heavy Metal'),
-            ('Instrumental', 'Instrumental'),
-            ('Jazz', 'Jazz'),
-            ('Musical Theatre', 'Musical Theatre'),
-            ('Pop', 'Pop'),
-            ('Punk', 'Punk'),
-            ('R&B', 'R&B'),
-            ('Reggae', 'Reggae'),
-            ('Rock n Roll', 'Rock n Roll'),
-            ('Soul', 'Soul'),
-            ('Other', 'Other'),
-        ]
+        choices=[]
     )
     facebook_link = StringField(
         # TODO implement enum restriction
@@ -255,4 +271,3 @@ class ArtistForm(FlaskForm):
     seeking_description = StringField(
         'seeking_description'
     )
-
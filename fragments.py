@@ -0,0 +1,117 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import cache, create_backend
+
+
+# ----------------------------------------------------------------------------#
+# Template tag.
+# ----------------------------------------------------------------------------#
+
+class FragmentCacheExtension(Extension):
+    """Jinja extension adding the {% cache key[, ttl] %}...{% endcache %} block.
+
+    The body is rendered once per key and the output reused until the entry
+    expires (after ttl seconds, FRAGMENT_CACHE_TTL by default) or is evicted. The
+    key is any expression, usually a tuple of a name, the entity id and a version
+    so that changing the underlying rows changes the key:
+
+        {% cache ('venue-upcoming', venue.id, cache_version('venue:%d' % venue.id)) %}
+
+    Without a FragmentCache the body is rendered every time.
+
+    """
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, ttl, caller):
+        fragment_cache = self.environment.fragment_cache
+        # Fragment keys are versioned by the page data cache, see cache_version.
+        if fragment_cache is None or fragment_cache.backend is None or not cache.is_active():
+            return caller()
+        return fragment_cache.get_or_render(key, ttl, caller)
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class FragmentCache:
+    """Flask extension caching rendered template fragments, see FragmentCacheExtension.
+
+    Fragments are stored in their own backend, the same kinds as the page data
+    cache: 'memory' (per process LRU), 'shared-local', 'redis' or 'null'. Keys
+    are versioned with cache_version(*namespaces), a template global returning the
+    entity tag of the page data cache namespaces, so cache.invalidate() makes the
+    fragments of those namespaces unreachable too. Fragment caching is therefore
+    off when the page data cache is, or is inactive for the request (see
+    Cache.is_active), as nothing would track changes.
+
+    Configuration: FRAGMENT_CACHE_BACKEND, FRAGMENT_CACHE_MAXSIZE,
+    FRAGMENT_CACHE_TTL and CACHE_REDIS_URL.
+
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('FRAGMENT_CACHE_BACKEND', 'memory')
+        if app.config.get('CACHE_BACKEND', 'memory') == 'null':
+            name = 'null'
+        self.backend = create_backend(name, app.config.get('FRAGMENT_CACHE_MAXSIZE', 4096),
+                                      app.config.get('FRAGMENT_CACHE_TTL', 300), app.config.get('CACHE_REDIS_URL'))
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.fragment_cache = self
+        app.jinja_env.globals['cache_version'] = cache_version
+        app.extensions['fragment_cache'] = self
+
+    def get_or_render(self, key, ttl, render) -> Markup:
+        """Return the cached output for key, calling render() on a miss."""
+        key = f'fragment:{key!r}'
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return Markup(value)
+        self.misses += 1
+        value = render()
+        self.backend.set(key, str(value), ttl)
+        return Markup(value)
+
+    def stats(self) -> dict:
+        """Return the hit/miss/eviction counters of this process."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions if self.backend is not None else 0
+        }
+
+
+def cache_version(*namespaces: str) -> str:
+    """Return a version of the page data cache namespaces, changed by cache.invalidate, for fragment keys."""
+    return cache.etag(list(namespaces))
+
+
+fragment_cache = FragmentCache()
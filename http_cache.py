@@ -0,0 +1,119 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import functools
+import hashlib
+import inspect
+import json
+import os
+
+from flask import current_app, make_response, request, session
+
+from cache import cache
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class ResponseCache:
+    """Flask extension answering conditional GETs of the html read views.
+
+    A view decorated with conditional(namespaces) gets an ETag derived, like
+    the API ones, from the page data cache namespaces it depends on (see
+    Cache.etag): their versions, the upcoming bucket, the request path and a
+    digest of the templates and asset bundles, so a deploy changing the html
+    changes it too. A matching If-None-Match gets a 304 before the view runs,
+    without querying the database or rendering.
+
+    Responses are marked public with max-age=0, browsers revalidate each time,
+    and s-maxage/stale-while-revalidate so a fronting cache can absorb reads.
+    Pages showing flashed messages are personal, they skip validation and are
+    marked private, and every response varies on Cookie for that reason.
+
+    Configuration: HTML_CACHE_S_MAXAGE and HTML_CACHE_STALE_WHILE_REVALIDATE.
+    init_app must run after assets.init_app.
+
+    """
+
+    def __init__(self, app=None):
+        self.release = ''
+        self.s_maxage = 10
+        self.stale_while_revalidate = 30
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.release = release_digest(app)
+        self.s_maxage = app.config.get('HTML_CACHE_S_MAXAGE', 10)
+        self.stale_while_revalidate = app.config.get('HTML_CACHE_STALE_WHILE_REVALIDATE', 30)
+        app.extensions['http_cache'] = self
+
+    def conditional(self, namespaces):
+        """Decorate a GET view whose html only changes with the given cache namespaces.
+
+        namespaces is called with the view arguments and returns the list of
+        namespaces, e.g. lambda venue_id: [f'venue:{venue_id}']. Coroutine views
+        (the async mode, see asgi.py) get a coroutine wrapper.
+
+        """
+        def decorator(view):
+            if inspect.iscoroutinefunction(view):
+                @functools.wraps(view)
+                async def async_wrapper(**kwargs):
+                    personal, etag, response = self._validate(namespaces(**kwargs))
+                    if response is None:
+                        response = make_response(await view(**kwargs))
+                    return self._finish(response, personal, etag)
+                return async_wrapper
+
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                personal, etag, response = self._validate(namespaces(**kwargs))
+                if response is None:
+                    response = make_response(view(**kwargs))
+                return self._finish(response, personal, etag)
+            return wrapper
+        return decorator
+
+    def _validate(self, namespaces: list) -> tuple:
+        """Check the request before the view runs, which consumes the flashed messages.
+
+        Returns a tuple in the form (personal, etag or None, 304 response or None)
+
+        """
+        if '_flashes' in session:
+            return True, None, None
+        etag = cache.etag(namespaces, (self.release, request.full_path))
+        if etag is not None and etag in request.if_none_match:
+            return False, etag, current_app.response_class(status=304)
+        return False, etag, None
+
+    def _finish(self, response, personal: bool, etag: str):
+        if personal:
+            response.headers['Cache-Control'] = 'private, no-cache'
+        elif response.status_code in (200, 304):
+            # Errors such as a 404 get no validators, shared caches must not keep them.
+            if etag is not None:
+                response.set_etag(etag)
+            response.headers['Cache-Control'] = (f'public, max-age=0, s-maxage={self.s_maxage}, '
+                                                 f'stale-while-revalidate={self.stale_while_revalidate}')
+        response.vary.add('Cookie')
+        return response
+
+
+def release_digest(app) -> str:
+    """Return a hash of the templates and the built asset bundles, which the html depends on besides the data."""
+    digest = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            digest.update(name.encode())
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(f.read())
+    assets = app.extensions.get('assets')
+    if assets is not None:
+        digest.update(json.dumps(assets.manifest, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+http_cache = ResponseCache()
@@ -0,0 +1,390 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import csv
+import io
+import json
+import time
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select
+from werkzeug.datastructures import MultiDict
+
+from cache import cache
+from counters import refresh_counters
+from forms import VenueForm, ArtistForm, ShowForm
+from models import Venue, Artist, Show, Genre, venue_genres, artist_genres
+from search import search_index
+from shared import db
+
+# Importable entities, in the form kind: (model, form validating a row, genre association table
+# and its foreign key column or None).
+IMPORTABLE = {
+    'venue': (Venue, VenueForm, venue_genres, 'venue_id'),
+    'artist': (Artist, ArtistForm, artist_genres, 'artist_id'),
+    'show': (Show, ShowForm, None, None),
+}
+
+FORMATS = ('csv', 'ndjson')
+
+
+# ----------------------------------------------------------------------------#
+# Readers.
+# ----------------------------------------------------------------------------#
+
+def detect_format(filename: str) -> str:
+    """Guess the input format from a file name, defaulting to csv."""
+    return 'ndjson' if filename.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+class UnreadableRecord(dict):
+    """A row read_records could not decode, rejected by import_records with its errors."""
+
+    def __init__(self, record: dict, errors: dict):
+        super().__init__(record)
+        self.errors = errors
+
+
+def _is_utf8(*texts) -> bool:
+    # Streams are opened with errors='surrogateescape', invalid bytes decode to lone surrogates.
+    try:
+        for text in texts:
+            if isinstance(text, str):
+                text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def read_records(stream, fmt: str):
+    """Iterate over the records of a text stream, one dict per row.
+
+    csv input has a header line and genres as a comma separated cell, ndjson
+    input has one object per line with genres as a list. Keys starting with an
+    underscore are ignored, so an error report can be fixed and imported again.
+
+    Rows that are not valid UTF-8 (with the stream opened with
+    errors='surrogateescape') or, in ndjson, not a JSON object are yielded as
+    UnreadableRecord, an ndjson line keeping its text in the _line field.
+
+    """
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            record = {k: v for k, v in record.items() if k is not None and not k.startswith('_')}
+            if not _is_utf8(*record, *record.values()):
+                yield UnreadableRecord(record, {'encoding': ['Not valid UTF-8.']})
+                continue
+            if record.get('genres'):
+                record['genres'] = [genre.strip() for genre in record['genres'].split(',')]
+            yield record
+    elif fmt == 'ndjson':
+        for line in stream:
+            if not line.strip():
+                continue
+            unreadable = {'_line': line.rstrip('\r\n')}
+            if not _is_utf8(line):
+                yield UnreadableRecord(unreadable, {'encoding': ['Not valid UTF-8.']})
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield UnreadableRecord(unreadable, {'json': [str(e)]})
+                continue
+            if not isinstance(record, dict):
+                yield UnreadableRecord(unreadable, {'json': ['Must be an object.']})
+                continue
+            yield {k: v for k, v in record.items() if not k.startswith('_')}
+    else:
+        raise ValueError(f'Unknown import format {fmt!r}')
+
+
+def _formdata(record: dict) -> MultiDict:
+    """Convert a record to the form data a browser would post for it."""
+    formdata = MultiDict()
+    for key, value in record.items():
+        for item in value if isinstance(value, list) else [value]:
+            # Checkboxes post 'y' when checked and nothing otherwise.
+            if isinstance(item, bool):
+                item = 'y' if item else ''
+            formdata.add(key, '' if item is None else str(item))
+    return formdata
+
+
+# ----------------------------------------------------------------------------#
+# Error reports.
+# ----------------------------------------------------------------------------#
+
+class ErrorReport:
+    """Write rejected rows in the input format, with their row number and errors.
+
+    Rows keep their original fields so the report can be corrected and imported
+    again, the _row and _errors fields are ignored by read_records.
+
+    """
+
+    def __init__(self, stream, fmt: str):
+        self.stream = stream
+        self.fmt = fmt
+        self.count = 0
+        self._writer = None
+
+    def write(self, row: int, record: dict, errors: dict):
+        self.count += 1
+        if self.fmt == 'ndjson':
+            self.stream.write(json.dumps({**record, '_row': row, '_errors': errors}) + '\n')
+            return
+        if self._writer is None:
+            self._writer = csv.DictWriter(self.stream, list(record) + ['_row', '_errors'], extrasaction='ignore')
+            self._writer.writeheader()
+        record = {k: ','.join(v) if isinstance(v, list) else v for k, v in record.items()}
+        self._writer.writerow({**record, '_row': row, '_errors': json.dumps(errors)})
+
+    def flush(self):
+        self.stream.flush()
+
+
+class ErrorList:
+    """Collect rejected rows in memory, for the upload endpoint."""
+
+    def __init__(self, limit: int = 1000):
+        self.limit = limit
+        self.count = 0
+        self.errors = []
+
+    def write(self, row: int, record: dict, errors: dict):
+        self.count += 1
+        if len(self.errors) < self.limit:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def flush(self):
+        pass
+
+
+# ----------------------------------------------------------------------------#
+# Import.
+# ----------------------------------------------------------------------------#
+
+class ImportResult:
+    """Counters of an import run.
+
+    last_committed_row is the number of the last input row covered by a commit,
+    pass it as skip to resume an interrupted import.
+
+    """
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = 0
+        self.last_committed_row = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        processed = self.imported + self.rejected
+        return processed / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'imported': self.imported,
+            'rejected': self.rejected,
+            'last_committed_row': self.last_committed_row,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1)
+        }
+
+
+def _validate(kind: str, record: dict):
+    """Validate a record with the form of kind.
+
+    Returns a tuple in the form (column values, genre names, errors)
+
+    """
+    _, form_class, genre_table, _ = IMPORTABLE[kind]
+    form = form_class(formdata=_formdata(record), meta={'csrf': False})
+    if not form.validate():
+        return None, None, form.errors
+    values = {name: value for name, value in form.data.items() if name != 'genres'}
+    if kind == 'show':
+        try:
+            values['venue_id'] = int(values['venue_id'])
+            values['artist_id'] = int(values['artist_id'])
+        except ValueError:
+            return None, None, {'venue_id/artist_id': ['Must be an integer id.']}
+    return values, form.data.get('genres') if genre_table is not None else None, None
+
+
+def _missing_references(batch: list) -> dict:
+    """Return the show rows of batch whose venue or artist does not exist, as {index: errors}."""
+    venue_ids = {values['venue_id'] for _, _, values, _ in batch}
+    artist_ids = {values['artist_id'] for _, _, values, _ in batch}
+    venue_ids &= {x for x, in db.session.query(Venue.id).filter(Venue.id.in_(venue_ids))}
+    artist_ids &= {x for x, in db.session.query(Artist.id).filter(Artist.id.in_(artist_ids))}
+    missing = {}
+    for i, (_, _, values, _) in enumerate(batch):
+        errors = {}
+        if values['venue_id'] not in venue_ids:
+            errors['venue_id'] = ['No venue with this id.']
+        if values['artist_id'] not in artist_ids:
+            errors['artist_id'] = ['No artist with this id.']
+        if errors:
+            missing[i] = errors
+    return missing
+
+
+def _allocate_ids(model, count: int) -> list:
+    """Reserve count primary keys from the sequence behind model.id (postgres only)."""
+    sequence = func.pg_get_serial_sequence(f'"{model.__tablename__}"', 'id')
+    series = func.generate_series(1, count).table_valued('n')
+    return [x for x, in db.session.execute(select(func.nextval(sequence)).select_from(series))]
+
+
+def _insert_batch(kind: str, batch: list, genre_ids: dict) -> list:
+    """Insert the validated rows of batch and return their ids.
+
+    Rows are written with multi-row inserts. On postgres, ids are reserved from
+    the sequence up front so genre associations can be inserted the same way,
+    other databases flush ORM objects to learn them.
+
+    """
+    model, _, genre_table, genre_fk = IMPORTABLE[kind]
+    rows = [values for _, _, values, _ in batch]
+    if genre_table is None:
+        db.session.execute(insert(model.__table__), rows)
+        # Core inserts bypass the session hooks that maintain the show counters.
+        refresh_counters({values['venue_id'] for values in rows}, {values['artist_id'] for values in rows})
+        return []
+
+    if db.engine.dialect.name == 'postgresql':
+        ids = _allocate_ids(model, len(rows))
+        db.session.execute(insert(model.__table__), [{**values, 'id': x} for values, x in zip(rows, ids)])
+    else:
+        objects = [model(**values) for values in rows]
+        db.session.add_all(objects)
+        db.session.flush()
+        ids = [obj.id for obj in objects]
+    links = [{genre_fk: x, 'genre_id': genre_ids[name]}
+             for x, (_, _, _, genres) in zip(ids, batch) for name in genres]
+    if links:
+        db.session.execute(insert(genre_table), links)
+    return ids
+
+
+def _invalidate(kind: str, batch: list):
+    """Drop the search index and cached pages the committed batch made stale."""
+    if kind == 'show':
+        venue_ids = {values['venue_id'] for _, _, values, _ in batch}
+        artist_ids = {values['artist_id'] for _, _, values, _ in batch}
+        cache.invalidate('venue_areas', 'shows', *[f'venue:{x}' for x in venue_ids],
+                         *[f'artist:{x}' for x in artist_ids])
+    else:
+        search_index.invalidate(kind)
+        cache.invalidate('venue_areas' if kind == 'venue' else 'artists')
+
+
+def import_records(kind: str, records, batch_size: int = 1000, report=None, skip: int = 0) -> ImportResult:
+    """Validate and insert records of kind, committing every batch_size valid rows.
+
+    Rows are validated with the same form as the create pages (ShowForm rows
+    must also reference an existing venue and artist), UnreadableRecord rows
+    are rejected with the errors of the reader. Rejected rows are written
+    to report, see ErrorReport, and do not stop the import. A batch that fails in
+    the database is rolled back and all of its rows are reported.
+
+    The first skip rows are read but not imported, to resume from the
+    last_committed_row of an interrupted run.
+
+    """
+    if kind not in IMPORTABLE:
+        raise ValueError(f'Unknown import kind {kind!r}')
+    result = ImportResult()
+    result.last_committed_row = skip
+    genre_ids = {name: x for x, name in db.session.query(Genre.id, Genre.name)}
+    started = time.perf_counter()
+
+    def reject(row, record, errors):
+        result.rejected += 1
+        if report is not None:
+            report.write(row, record, errors)
+
+    def commit(batch, last_row):
+        if kind == 'show' and batch:
+            missing = _missing_references(batch)
+            for i in sorted(missing):
+                reject(batch[i][0], batch[i][1], missing[i])
+            batch = [item for i, item in enumerate(batch) if i not in missing]
+        try:
+            if batch:
+                _insert_batch(kind, batch, genre_ids)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            for row, record, _, _ in batch:
+                reject(row, record, {'database': [str(getattr(e, 'orig', e))]})
+        else:
+            result.imported += len(batch)
+            if batch:
+                _invalidate(kind, batch)
+        result.last_committed_row = last_row
+        if report is not None:
+            report.flush()
+
+    batch = []
+    row = 0
+    for row, record in enumerate(records, start=1):
+        if row <= skip:
+            continue
+        if isinstance(record, UnreadableRecord):
+            values, genres, errors = None, None, record.errors
+        else:
+            values, genres, errors = _validate(kind, record)
+        if errors:
+            reject(row, record, errors)
+        else:
+            batch.append((row, record, values, genres or []))
+        if len(batch) >= batch_size:
+            commit(batch, row)
+            batch = []
+    commit(batch, max(row, skip))
+
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+@click.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTABLE)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS),
+              help='Input format, guessed from the extension by default.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows inserted and committed at a time.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Where to write rejected rows, defaults to PATH with an .errors suffix.')
+@click.option('--skip', default=0, help='Skip the first SKIP rows, to resume an interrupted import.')
+@with_appcontext
+def import_command(kind, path, fmt, batch_size, errors_path, skip):
+    """Bulk import venues, artists or shows from a csv or ndjson file."""
+    fmt = fmt or detect_format(path)
+    errors_path = errors_path or f'{path}.errors.{fmt}'
+    # Invalid bytes are kept as surrogates, read_records rejects their rows and the report writes them back.
+    with open(path, newline='', encoding='utf-8', errors='surrogateescape') as stream, \
+            open(errors_path, 'w', newline='', encoding='utf-8', errors='surrogateescape') as errors_stream:
+        report = ErrorReport(errors_stream, fmt)
+        result = import_records(kind, read_records(stream, fmt), batch_size=batch_size, report=report, skip=skip)
+    click.echo(f'Imported {result.imported} {kind} rows, rejected {result.rejected} '
+               f'in {result.seconds:.2f}s ({result.rows_per_second:.0f} rows/s).')
+    if result.rejected:
+        click.echo(f'Rejected rows were written to {errors_path}, fix and import them again.')
+    click.echo(f'Last committed row: {result.last_committed_row}, pass --skip to resume from there.')
+
+
+def import_upload(kind: str, upload, fmt: str = None, batch_size: int = 1000) -> dict:
+    """Import an uploaded file (a werkzeug FileStorage) and return the result with its errors."""
+    fmt = fmt or detect_format(upload.filename or '')
+    stream = io.TextIOWrapper(upload.stream, encoding='utf-8', errors='surrogateescape', newline='')
+    report = ErrorList()
+    result = import_records(kind, read_records(stream, fmt), batch_size=batch_size, report=report)
+    return {**result.to_dict(), 'errors': report.errors}
@@ -0,0 +1,270 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import json
+import logging
+import threading
+import time
+import traceback
+from datetime import datetime, timezone
+
+from flask import g, has_app_context, has_request_context, request
+from flask.logging import default_handler
+from jinja2 import Template
+from sqlalchemy import event
+
+from shared import db
+
+request_logger = logging.getLogger('fyyur.request')
+sql_logger = logging.getLogger('fyyur.sql')
+
+# Histogram buckets, in seconds, bytes and statements.
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Statement parameters longer than this are truncated in the slow query log.
+MAX_PARAMETERS_LENGTH = 1000
+
+
+# ----------------------------------------------------------------------------#
+# Structured logs.
+# ----------------------------------------------------------------------------#
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one json object per line.
+
+    Every record has ts, level, logger and message, plus method, path and route
+    when logged during a request. Fields passed as extra={'fields': {...}} are
+    merged in, and exceptions are added as a formatted traceback.
+
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if has_request_context():
+            entry.update({
+                'method': request.method,
+                'path': request.path,
+                'route': route_name(),
+            })
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(app):
+    """Send the app and fyyur.* logs to stderr as json lines, at the LOG_LEVEL level."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    level = app.config.get('LOG_LEVEL', 'INFO')
+    app.logger.removeHandler(default_handler)
+    for logger in (app.logger, logging.getLogger('fyyur')):
+        logger.addHandler(handler)
+        logger.setLevel(level)
+    # The app logger is not under fyyur, keep its records from reaching the root logger twice.
+    logging.getLogger('fyyur').propagate = False
+
+
+def route_name() -> str:
+    """Return the endpoint of the current request, the label of its metrics."""
+    return request.url_rule.endpoint if request.url_rule is not None else 'unmatched'
+
+
+# ----------------------------------------------------------------------------#
+# Metrics.
+# ----------------------------------------------------------------------------#
+
+def _labels(names: tuple, values: tuple) -> str:
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+class Histogram:
+    """Cumulative histogram per label values, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ('route',)):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        # In the form label values: [bucket counts..., +Inf count, sum].
+        self._series = {}
+
+    def observe(self, values: tuple, amount: float):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if amount <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += amount
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for values, series in sorted(self._series.items()):
+            labels = _labels(self.labels, values)
+            for bound, count in zip((*self.buckets, '+Inf'), series):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {series[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {series[-2]}')
+        return lines
+
+
+class Counter:
+    """Counter per label values, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, labels: tuple = ('route',)):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+
+    def inc(self, values: tuple, amount: float = 1):
+        self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for values, count in sorted(self._series.items()):
+            lines.append(f'{self.name}{{{_labels(self.labels, values)}}} {count}' if values else f'{self.name} {count}')
+        return lines
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class TimedTemplate(Template):
+    """Template adding its render time to the current request, nested includes are part of it."""
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats = g.get('request_stats') if has_app_context() else None
+            if stats is not None:
+                stats['template_time'] += time.perf_counter() - started
+
+
+class Instrumentation:
+    """Flask extension recording the cost of each request and the slow statements.
+
+    Per request: wall time, time spent in the database and number of
+    statements (over every engine of db), template render time and response
+    size. They are exported as histograms per route on render_metrics(),
+    returned in a Server-Timing header, and requests slower than
+    SLOW_REQUEST_MS are logged with the breakdown. Statements slower than
+    SLOW_QUERY_MS are logged with their parameters, inside requests or not.
+
+    Metrics are per process, like the cache and pool stats, each gunicorn
+    worker exposes its own. init_app must run after db.init_app.
+
+    """
+
+    def __init__(self, app=None):
+        self.slow_request = 1.0
+        self.slow_query = 0.2
+        self._lock = threading.Lock()
+        self.request_duration = Histogram('fyyur_request_duration_seconds', 'Wall time of requests.',
+                                          TIME_BUCKETS)
+        self.db_duration = Histogram('fyyur_request_db_seconds', 'Time spent in database statements per request.',
+                                     TIME_BUCKETS)
+        self.query_count = Histogram('fyyur_request_queries', 'Database statements per request.', QUERY_BUCKETS)
+        self.template_duration = Histogram('fyyur_request_template_seconds', 'Template render time per request.',
+                                           TIME_BUCKETS)
+        self.response_size = Histogram('fyyur_response_size_bytes', 'Size of response bodies.', SIZE_BUCKETS)
+        self.requests = Counter('fyyur_requests_total', 'Requests by route and status code.', ('route', 'status'))
+        self.slow_queries = Counter('fyyur_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', ())
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_request = app.config.get('SLOW_REQUEST_MS', 1000) / 1000
+        self.slow_query = app.config.get('SLOW_QUERY_MS', 200) / 1000
+        app.jinja_env.template_class = TimedTemplate
+        with app.app_context():
+            for engine in db.engines.values():
+                self.watch(engine)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['instrumentation'] = self
+
+    def watch(self, engine):
+        """Record the statements of engine, also used for the asyncio engine (its sync_engine) of aio.py."""
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        stats = g.get('request_stats') if has_app_context() else None
+        if stats is not None:
+            stats['db_time'] += elapsed
+            stats['queries'] += 1
+        if elapsed >= self.slow_query:
+            with self._lock:
+                self.slow_queries.inc(())
+            sql_logger.warning('slow query', extra={'fields': {
+                'duration_ms': round(elapsed * 1000, 3),
+                'statement': statement,
+                'parameters': repr(parameters)[:MAX_PARAMETERS_LENGTH],
+                'executemany': executemany,
+            }})
+
+    def _before_request(self):
+        g.request_stats = {'started': time.perf_counter(), 'db_time': 0.0, 'queries': 0, 'template_time': 0.0}
+
+    def _after_request(self, response):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - stats['started']
+        route = route_name()
+        # Streamed bodies have no length yet, their size is not recorded.
+        size = None if response.is_streamed else response.calculate_content_length()
+        with self._lock:
+            self.request_duration.observe((route,), elapsed)
+            self.db_duration.observe((route,), stats['db_time'])
+            self.query_count.observe((route,), stats['queries'])
+            self.template_duration.observe((route,), stats['template_time'])
+            if size is not None:
+                self.response_size.observe((route,), size)
+            self.requests.inc((route, response.status_code))
+
+        response.headers['Server-Timing'] = (f'db;dur={stats["db_time"] * 1000:.1f}, '
+                                             f'tpl;dur={stats["template_time"] * 1000:.1f}, '
+                                             f'total;dur={elapsed * 1000:.1f}')
+        fields = {
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'db_ms': round(stats['db_time'] * 1000, 3),
+            'queries': stats['queries'],
+            'template_ms': round(stats['template_time'] * 1000, 3),
+            'size': size,
+        }
+        level = logging.WARNING if elapsed >= self.slow_request else logging.DEBUG
+        request_logger.log(level, 'slow request' if level == logging.WARNING else 'request', extra={'fields': fields})
+        return response
+
+    def render_metrics(self) -> str:
+        """Return the request metrics of this process in the Prometheus text exposition format."""
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.request_duration, self.db_duration, self.query_count,
+                           self.template_duration, self.response_size, self.slow_queries):
+                lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+
+instrumentation = Instrumentation()
@@ -0,0 +1,573 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from models import Job
+from shared import db
+
+logger = logging.getLogger('fyyur.jobs')
+
+# A claimed job, as handed to the worker running it.
+ClaimedJob = namedtuple('ClaimedJob', 'id task payload attempts max_attempts')
+
+# First key of the advisory locks serializing the claims of tasks with a concurrency limit.
+CONCURRENCY_LOCK = 0x6a6f6273
+
+# Jobs skipped per claim because their task is at its concurrency limit, before giving up for a poll.
+MAX_CLAIM_TRIES = 10
+
+
+# ----------------------------------------------------------------------------#
+# Tasks.
+# ----------------------------------------------------------------------------#
+
+class Task:
+    """A function run by the workers, registered with JobQueue.task.
+
+    Jobs are attempted up to max_attempts times, concurrency caps how many jobs
+    of the task run at once over every worker (None for no cap), and tasks with
+    every seconds are enqueued once per period by the workers.
+
+    """
+
+    def __init__(self, name: str, func, max_attempts: int = None, concurrency: int = None, every: float = None):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.concurrency = concurrency
+        self.every = every
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+class DatabaseQueue:
+    """Durable queue in the Job table, workers claim jobs with FOR UPDATE SKIP LOCKED.
+
+    Jobs are inserted in the transaction of the caller, so they only exist if
+    its changes are committed. Workers claim the next due job without waiting
+    on the rows other workers are claiming, and tasks with a concurrency limit
+    are claimed under an advisory lock so the limit holds over every worker.
+    Needs postgres.
+
+    """
+
+    def put(self, task: str, payload: dict, max_attempts: int, run_at: datetime = None, key: str = None):
+        values = {'task': task, 'payload': payload, 'max_attempts': max_attempts, 'key': key}
+        if run_at is not None:
+            values['run_at'] = run_at
+        db.session.execute(insert(Job).values(**values).on_conflict_do_nothing(index_elements=['key']))
+
+    def claim(self, worker_id: str, tasks: dict):
+        """Mark the next due job running and return it as a ClaimedJob, or None when nothing is due."""
+        skipped = set()
+        for _ in range(MAX_CLAIM_TRIES):
+            query = (select(Job)
+                     .where(Job.status == 'queued', Job.run_at <= func.now())
+                     .order_by(Job.run_at, Job.id)
+                     .limit(1)
+                     .with_for_update(skip_locked=True))
+            if skipped:
+                query = query.where(Job.task.notin_(skipped))
+            job = db.session.execute(query).scalar()
+            if job is None:
+                db.session.rollback()
+                return None
+            task = tasks.get(job.task)
+            if task is not None and task.concurrency:
+                db.session.execute(select(func.pg_advisory_xact_lock(CONCURRENCY_LOCK, func.hashtext(job.task))))
+                running = db.session.execute(select(func.count(Job.id))
+                                             .where(Job.task == job.task, Job.status == 'running')).scalar()
+                if running >= task.concurrency:
+                    db.session.rollback()
+                    skipped.add(job.task)
+                    continue
+            job.status = 'running'
+            job.attempts += 1
+            job.locked_by = worker_id
+            job.locked_at = func.now()
+            claimed = ClaimedJob(job.id, job.task, job.payload, job.attempts, job.max_attempts)
+            db.session.commit()
+            return claimed
+        db.session.rollback()
+        return None
+
+    def _update(self, query, **values) -> int:
+        # Jobs are not kept in the session, the now() criteria cannot be evaluated in python anyway.
+        return db.session.execute(query.values(**values).execution_options(synchronize_session=False)).rowcount
+
+    def _finish(self, job_id: int, **values):
+        self._update(update(Job).where(Job.id == job_id), locked_by=None, locked_at=None, **values)
+        db.session.commit()
+
+    def complete(self, job_id: int):
+        self._finish(job_id, status='done', finished_at=func.now(), last_error=None)
+
+    def retry(self, job_id: int, run_at: datetime, error: str):
+        self._finish(job_id, status='queued', run_at=run_at, last_error=error)
+
+    def fail(self, job_id: int, error: str):
+        self._finish(job_id, status='failed', finished_at=func.now(), last_error=error)
+
+    def heartbeat(self, worker_id: str, job_ids: list):
+        """Renew the lease of the jobs worker_id is running, so requeue_stale leaves them alone."""
+        self._update(update(Job).where(Job.id.in_(job_ids), Job.status == 'running', Job.locked_by == worker_id),
+                     locked_at=func.now())
+        db.session.commit()
+
+    def requeue_stale(self, timeout: float) -> int:
+        """Requeue the running jobs whose lease was not renewed for timeout seconds, their worker died.
+
+        Returns their number.
+
+        """
+        stale = (Job.status == 'running') & (Job.locked_at < func.now() - timedelta(seconds=timeout))
+        failed = self._update(update(Job).where(stale, Job.attempts >= Job.max_attempts), status='failed',
+                              finished_at=func.now(), locked_by=None, locked_at=None, last_error='timed out')
+        queued = self._update(update(Job).where(stale), status='queued', locked_by=None, locked_at=None,
+                              last_error='timed out')
+        db.session.commit()
+        return failed + queued
+
+    def prune(self, older_than: datetime) -> int:
+        """Delete the jobs done before older_than, returns their number."""
+        deleted = db.session.execute(delete(Job).where(Job.status == 'done', Job.finished_at < older_than)
+                                     .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        return deleted
+
+    def retry_failed(self, task: str = None) -> int:
+        """Queue the failed jobs (of task) again with fresh attempts, returns their number."""
+        query = update(Job).where(Job.status == 'failed')
+        if task is not None:
+            query = query.where(Job.task == task)
+        count = self._update(query, status='queued', attempts=0, run_at=func.now(), finished_at=None)
+        db.session.commit()
+        return count
+
+    def stats(self) -> dict:
+        """Return the number of jobs, in the form {task: {status: count}}."""
+        stats = {}
+        for task, status, count in db.session.execute(select(Job.task, Job.status, func.count(Job.id))
+                                                      .group_by(Job.task, Job.status)):
+            stats.setdefault(task, {})[status] = count
+        return stats
+
+
+class LocalQueue:
+    """In-process queue, for tests and databases without SKIP LOCKED (sqlite).
+
+    Jobs are kept in memory and seen only by this process, they are lost when
+    it exits. Like the database queue, jobs enqueued in a transaction are only
+    queued once it commits, and dropped if it rolls back.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # In the form id: job dict with the columns of the Job table.
+        self._jobs = {}
+        self._keys = set()
+        self._next_id = 1
+
+    def put(self, task: str, payload: dict, max_attempts: int, run_at: datetime = None, key: str = None):
+        job = {'task': task, 'payload': payload, 'max_attempts': max_attempts, 'run_at': run_at or _utcnow(),
+               'key': key, 'status': 'queued', 'attempts': 0, 'locked_by': None, 'locked_at': None,
+               'last_error': None, 'finished_at': None}
+        db.session.info.setdefault('local_jobs', []).append((self, job))
+
+    def push(self, job: dict):
+        """Queue a job of a committed transaction."""
+        with self._lock:
+            if job['key'] is not None:
+                if job['key'] in self._keys:
+                    return
+                self._keys.add(job['key'])
+            job['id'] = self._next_id
+            self._next_id += 1
+            self._jobs[job['id']] = job
+
+    def claim(self, worker_id: str, tasks: dict):
+        now = _utcnow()
+        with self._lock:
+            running = {}
+            for job in self._jobs.values():
+                if job['status'] == 'running':
+                    running[job['task']] = running.get(job['task'], 0) + 1
+            due = sorted((job['run_at'], job_id) for job_id, job in self._jobs.items()
+                         if job['status'] == 'queued' and job['run_at'] <= now)
+            for _, job_id in due:
+                job = self._jobs[job_id]
+                task = tasks.get(job['task'])
+                if task is not None and task.concurrency and running.get(job['task'], 0) >= task.concurrency:
+                    continue
+                job.update(status='running', attempts=job['attempts'] + 1, locked_by=worker_id, locked_at=now)
+                return ClaimedJob(job_id, job['task'], job['payload'], job['attempts'], job['max_attempts'])
+        return None
+
+    def _finish(self, job_id: int, **values):
+        with self._lock:
+            self._jobs[job_id].update(locked_by=None, locked_at=None, **values)
+
+    def complete(self, job_id: int):
+        self._finish(job_id, status='done', finished_at=_utcnow(), last_error=None)
+
+    def retry(self, job_id: int, run_at: datetime, error: str):
+        self._finish(job_id, status='queued', run_at=run_at, last_error=error)
+
+    def fail(self, job_id: int, error: str):
+        self._finish(job_id, status='failed', finished_at=_utcnow(), last_error=error)
+
+    def heartbeat(self, worker_id: str, job_ids: list):
+        now = _utcnow()
+        with self._lock:
+            for job_id in job_ids:
+                job = self._jobs.get(job_id)
+                if job is not None and job['status'] == 'running' and job['locked_by'] == worker_id:
+                    job['locked_at'] = now
+
+    def requeue_stale(self, timeout: float) -> int:
+        limit = _utcnow() - timedelta(seconds=timeout)
+        count = 0
+        with self._lock:
+            for job in self._jobs.values():
+                if job['status'] == 'running' and job['locked_at'] < limit:
+                    status = 'failed' if job['attempts'] >= job['max_attempts'] else 'queued'
+                    job.update(status=status, locked_by=None, locked_at=None, last_error='timed out')
+                    count += 1
+        return count
+
+    def prune(self, older_than: datetime) -> int:
+        with self._lock:
+            done = [job_id for job_id, job in self._jobs.items()
+                    if job['status'] == 'done' and job['finished_at'] < older_than]
+            for job_id in done:
+                # Like the unique index of the Job table, a key is free again once its job is deleted.
+                self._keys.discard(self._jobs.pop(job_id)['key'])
+        return len(done)
+
+    def retry_failed(self, task: str = None) -> int:
+        count = 0
+        with self._lock:
+            for job in self._jobs.values():
+                if job['status'] == 'failed' and task in (None, job['task']):
+                    job.update(status='queued', attempts=0, run_at=_utcnow(), finished_at=None)
+                    count += 1
+        return count
+
+    def stats(self) -> dict:
+        stats = {}
+        with self._lock:
+            for job in self._jobs.values():
+                counts = stats.setdefault(job['task'], {})
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+        return stats
+
+
+@event.listens_for(Session, 'after_commit')
+def push_local_jobs(session):
+    for queue, job in session.info.pop('local_jobs', ()):
+        queue.push(job)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_local_jobs(session):
+    session.info.pop('local_jobs', None)
+
+
+BACKENDS = {
+    'database': DatabaseQueue,
+    'local': LocalQueue,
+}
+
+
+# ----------------------------------------------------------------------------#
+# Worker.
+# ----------------------------------------------------------------------------#
+
+class Worker:
+    """Run the jobs of a queue in concurrency threads until stopped.
+
+    Each thread claims a due job, runs its task in a fresh app context and
+    records the outcome. A task raising is retried after an exponential
+    backoff with jitter (JOB_RETRY_BASE_SECONDS doubled per attempt, at most
+    JOB_RETRY_MAX_SECONDS) until its max_attempts, then marked failed. The
+    housekeeping thread renews the lease of the running jobs every
+    JOB_TIMEOUT_SECONDS / 4, requeues the jobs whose worker died (lease not
+    renewed for JOB_TIMEOUT_SECONDS) and enqueues the periodic tasks.
+
+    """
+
+    def __init__(self, app, job_queue, concurrency: int = 1):
+        self.app = app
+        self.job_queue = job_queue
+        self.concurrency = concurrency
+        self.id = f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+        self.stopping = threading.Event()
+        self._threads = []
+        # Ids of the jobs being run by the threads, their lease is renewed by heartbeat().
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._heartbeat_at = 0.0
+
+    def start(self):
+        """Start the job threads and the housekeeping thread, in the background."""
+        self._threads = [threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                         for i in range(self.concurrency)]
+        self._threads.append(threading.Thread(target=self._housekeep, name='job-housekeeping', daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, wait: bool = True):
+        """Stop claiming jobs, then wait for the running ones to finish."""
+        self.stopping.set()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                ran = self.run_one()
+            except Exception:
+                # E.g. the database went away while claiming or recording a job. The app
+                # context ended with the error, which rolled its session back. A job left
+                # running is requeued once it times out.
+                logger.exception('job worker failed')
+                ran = False
+            if not ran:
+                self.stopping.wait(self.job_queue.poll_seconds)
+
+    def _housekeep(self):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    if time.monotonic() - self._heartbeat_at >= self.job_queue.timeout / 4:
+                        self.heartbeat()
+                    self.housekeep()
+            except Exception:
+                logger.exception('job queue housekeeping failed')
+            self.stopping.wait(self.job_queue.poll_seconds)
+
+    def heartbeat(self):
+        """Renew the lease of the jobs this worker is running."""
+        self._heartbeat_at = time.monotonic()
+        with self._running_lock:
+            job_ids = list(self._running)
+        if job_ids:
+            self.job_queue.backend.heartbeat(self.id, job_ids)
+
+    def housekeep(self):
+        """Requeue jobs of dead workers and enqueue the periodic tasks due."""
+        requeued = self.job_queue.backend.requeue_stale(self.job_queue.timeout)
+        if requeued:
+            logger.warning('requeued timed out jobs', extra={'fields': {'jobs': requeued}})
+        now = time.time()
+        for task in self.job_queue.tasks.values():
+            if task.every:
+                # Every worker tries, the key lets one job per period through.
+                self.job_queue.enqueue(task.name, _key=f'{task.name}@{int(now // task.every)}')
+        db.session.commit()
+
+    def run_one(self) -> bool:
+        """Claim and run one due job, returns whether there was one."""
+        with self.app.app_context():
+            job = self.job_queue.backend.claim(self.id, self.job_queue.tasks)
+        if job is None:
+            return False
+        started = time.perf_counter()
+        with self._running_lock:
+            self._running.add(job.id)
+        try:
+            self._execute(job, started)
+        finally:
+            with self._running_lock:
+                self._running.discard(job.id)
+        return True
+
+    def _execute(self, job: ClaimedJob, started: float):
+        with self.app.app_context():
+            try:
+                task = self.job_queue.tasks.get(job.task)
+                if task is None:
+                    raise LookupError(f'Unknown task {job.task!r}')
+                task.func(**job.payload)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._failed(job, traceback.format_exc(), time.perf_counter() - started)
+            else:
+                self.job_queue.backend.complete(job.id)
+                logger.info('job done', extra={'fields': {
+                    'job_id': job.id, 'task': job.task, 'attempt': job.attempts,
+                    'duration_ms': round((time.perf_counter() - started) * 1000, 3)}})
+
+    def _failed(self, job: ClaimedJob, error: str, elapsed: float):
+        fields = {'job_id': job.id, 'task': job.task, 'attempt': job.attempts,
+                  'duration_ms': round(elapsed * 1000, 3), 'error': error.rstrip().splitlines()[-1]}
+        if job.attempts < job.max_attempts:
+            delay = self.job_queue.backoff(job.attempts)
+            self.job_queue.backend.retry(job.id, _utcnow() + timedelta(seconds=delay), error)
+            logger.warning('job failed, retrying', extra={'fields': {**fields, 'retry_in': round(delay, 1)}})
+        else:
+            self.job_queue.backend.fail(job.id, error)
+            logger.error('job failed', extra={'fields': fields})
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class JobQueue:
+    """Flask extension queueing work to run outside of requests.
+
+    Tasks are functions registered with the task decorator, enqueue(name,
+    **kwargs) queues a call with json serializable arguments in the current
+    transaction. Jobs are run by `flask jobs worker` processes.
+
+    JOB_QUEUE_BACKEND is one of the BACKENDS keys, or 'auto' to use the
+    database queue on postgres and the local queue otherwise. The local
+    queue is run by JOB_LOCAL_THREADS threads of the process itself, started
+    with its first request, or by drain() when 0 (tests).
+
+    Configuration: JOB_QUEUE_BACKEND, JOB_LOCAL_THREADS, JOB_POLL_SECONDS,
+    JOB_TIMEOUT_SECONDS, JOB_MAX_ATTEMPTS, JOB_RETRY_BASE_SECONDS,
+    JOB_RETRY_MAX_SECONDS and JOB_RETENTION_DAYS.
+
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.tasks = {}
+        self.poll_seconds = 1
+        self.timeout = 600
+        self.max_attempts = 5
+        self.retry_base = 10
+        self.retry_max = 3600
+        self.retention = timedelta(days=7)
+        self._local_worker = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('JOB_QUEUE_BACKEND', 'auto')
+        if name == 'auto':
+            name = 'database' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres') else 'local'
+        self.backend = BACKENDS[name]()
+        self.poll_seconds = app.config.get('JOB_POLL_SECONDS', 1)
+        self.timeout = app.config.get('JOB_TIMEOUT_SECONDS', 600)
+        self.max_attempts = app.config.get('JOB_MAX_ATTEMPTS', 5)
+        self.retry_base = app.config.get('JOB_RETRY_BASE_SECONDS', 10)
+        self.retry_max = app.config.get('JOB_RETRY_MAX_SECONDS', 3600)
+        self.retention = timedelta(days=app.config.get('JOB_RETENTION_DAYS', 7))
+        if isinstance(self.backend, LocalQueue) and app.config.get('JOB_LOCAL_THREADS', 1):
+            app.before_request(self._start_local_worker)
+        app.extensions['job_queue'] = self
+
+    def task(self, name: str, max_attempts: int = None, concurrency: int = None, every: float = None):
+        """Register the decorated function as the task name, see Task."""
+        def decorator(func):
+            self.tasks[name] = Task(name, func, max_attempts, concurrency, every)
+            return func
+        return decorator
+
+    def enqueue(self, name: str, _run_at: datetime = None, _key: str = None, **kwargs):
+        """Queue a call of the task name with kwargs, in the current transaction.
+
+        The job runs once the transaction commits, not before _run_at when
+        given. Nothing is queued when a job with the same _key already exists.
+
+        """
+        task = self.tasks.get(name)
+        max_attempts = task.max_attempts if task is not None and task.max_attempts else self.max_attempts
+        self.backend.put(name, kwargs, max_attempts, run_at=_run_at, key=_key)
+
+    def backoff(self, attempts: int) -> float:
+        """Return the delay in seconds before retrying a job that failed attempts times."""
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1)) * random.uniform(0.5, 1)
+
+    def drain(self):
+        """Run every due job in this thread until none is left, for tests on the local queue."""
+        worker = Worker(current_app._get_current_object(), self)
+        while worker.run_one():
+            pass
+
+    def _start_local_worker(self):
+        if self._local_worker is None:
+            with self._lock:
+                if self._local_worker is None:
+                    self._local_worker = Worker(current_app._get_current_object(), self,
+                                                current_app.config.get('JOB_LOCAL_THREADS', 1))
+                    self._local_worker.start()
+
+
+job_queue = JobQueue()
+
+
+@job_queue.task('jobs.prune', concurrency=1, every=3600)
+def prune_jobs():
+    """Delete the jobs done more than JOB_RETENTION_DAYS ago."""
+    job_queue.backend.prune(_utcnow() - job_queue.retention)
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+jobs_cli = AppGroup('jobs', help='Run and inspect the background job queue.')
+
+
+@jobs_cli.command('worker')
+@click.option('--concurrency', type=int, default=4, show_default=True, help='Jobs run at once by this process.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+def worker_command(concurrency, burst):
+    """Run queued jobs until interrupted."""
+    worker = Worker(current_app._get_current_object(), job_queue, concurrency)
+    if burst:
+        worker.housekeep()
+        job_queue.drain()
+        return
+    worker.start()
+    click.echo(f'Worker {worker.id} running {concurrency} jobs at once, Ctrl+C to stop.')
+    try:
+        while not worker.stopping.wait(1):
+            pass
+    except KeyboardInterrupt:
+        click.echo('Stopping, waiting for the running jobs.')
+        worker.stop()
+
+
+@jobs_cli.command('status')
+def status_command():
+    """Show the number of jobs per task and status."""
+    for task, counts in sorted(job_queue.backend.stats().items()):
+        click.echo(f'{task}: ' + ', '.join(f'{status} {count}' for status, count in sorted(counts.items())))
+
+
+@jobs_cli.command('retry')
+@click.option('--task', help='Only the failed jobs of this task.')
+def retry_command(task):
+    """Queue the failed jobs again."""
+    click.echo(f'Queued {job_queue.backend.retry_failed(task)} failed jobs again.')
@@ -0,0 +1,92 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+from flask import g
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.util import identity_key
+
+from models import Artist, Venue
+from shared import db
+
+# Relationships loaded along with each model, in the same query. Every page or
+# form showing a venue or an artist shows its genres, and deleting one has to
+# load them to clear the association table.
+LOAD_OPTIONS = {
+    Venue: (joinedload(Venue.genres),),
+    Artist: (joinedload(Artist.genres),),
+}
+
+# Ids per IN (...) list, keeps statements and their parameters bounded.
+MAX_BATCH_SIZE = 1000
+
+
+# ----------------------------------------------------------------------------#
+# Loader.
+# ----------------------------------------------------------------------------#
+
+class BatchLoader:
+    """Load the rows of one model by primary key, batched and memoized for a request.
+
+    Ids announced with want() are collected until a row is needed, then every
+    pending id is resolved at once with SELECT ... WHERE id IN (...) and the
+    LOAD_OPTIONS of the model. Rows already in the session identity map are
+    taken from it without a query. Unknown ids resolve to None, and rows
+    detached since (the views close the session) are loaded again.
+
+    Use loader(model) for the instance of the current request.
+
+    """
+
+    def __init__(self, model, options: tuple = ()):
+        self.model = model
+        self.options = options
+        self._pending = set()
+        # In the form id: row, or None for ids that do not exist.
+        self._loaded = {}
+
+    def want(self, ids):
+        """Queue ids to be loaded with the next batch."""
+        self._pending.update(int(x) for x in ids)
+
+    def get(self, entity_id):
+        """Return the row with the given id or None, loading it with every pending id."""
+        return self.get_many([entity_id])[0]
+
+    def get_many(self, ids) -> list:
+        """Return the rows with the given ids (None for unknown ones), in the same order."""
+        ids = [int(x) for x in ids]
+        self.want(ids)
+        self._resolve()
+        return [self._loaded[x] for x in ids]
+
+    def _resolve(self):
+        pending = {x for x in self._pending if not self._is_loaded(x)}
+        self._pending.clear()
+        session = db.session()
+        for entity_id in list(pending):
+            row = session.identity_map.get(identity_key(self.model, entity_id))
+            if row is not None:
+                self._loaded[entity_id] = row
+                pending.discard(entity_id)
+        pending = sorted(pending)
+        for start in range(0, len(pending), MAX_BATCH_SIZE):
+            batch = pending[start:start + MAX_BATCH_SIZE]
+            self._loaded.update(dict.fromkeys(batch))
+            rows = session.execute(select(self.model).where(self.model.id.in_(batch)).options(*self.options))
+            for row in rows.unique().scalars():
+                self._loaded[row.id] = row
+
+    def _is_loaded(self, entity_id: int) -> bool:
+        if entity_id not in self._loaded:
+            return False
+        row = self._loaded[entity_id]
+        return row is None or row in db.session
+
+
+def loader(model) -> BatchLoader:
+    """Return the BatchLoader of model for the current app context (one per request)."""
+    loaders = g.setdefault('loaders', {})
+    if model not in loaders:
+        loaders[model] = BatchLoader(model, LOAD_OPTIONS.get(model, ()))
+    return loaders[model]
@@ -0,0 +1,44 @@
+"""Add materialized show counters to venues and artists
+
+Revision ID: 5d8e2f1a9c47
+Revises: 9b1e6d4f3a72
+Create Date: 2026-10-18 17:21:09.318562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8e2f1a9c47'
+down_revision = '9b1e6d4f3a72'
+branch_labels = None
+depends_on = None
+
+TABLES = (('Venue', 'venue_id'), ('Artist', 'artist_id'))
+
+
+def upgrade():
+    for table, show_fk in TABLES:
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('next_show_at', sa.DateTime(timezone=True), nullable=True))
+        op.create_index(f'ix_{table}_next_show_at', table, ['next_show_at'], unique=False)
+        # Same split as repository.is_upcoming, a show starting now is upcoming.
+        op.execute(f'''
+            UPDATE "{table}" SET
+                upcoming_shows_count = (SELECT count(*) FROM "Show" s
+                                        WHERE s.{show_fk} = "{table}".id AND s.start_time >= now()),
+                past_shows_count = (SELECT count(*) FROM "Show" s
+                                    WHERE s.{show_fk} = "{table}".id AND s.start_time < now()),
+                next_show_at = (SELECT min(s.start_time) FROM "Show" s
+                                WHERE s.{show_fk} = "{table}".id AND s.start_time >= now())
+        ''')
+
+
+def downgrade():
+    for table, _ in TABLES:
+        op.drop_index(f'ix_{table}_next_show_at', table_name=table)
+        op.drop_column(table, 'next_show_at')
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,32 @@
+"""Add updated_at timestamps for incremental exports
+
+Revision ID: 9b1e6d4f3a72
+Revises: f2b7c3e8a614
+Create Date: 2026-10-18 16:02:37.504113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b1e6d4f3a72'
+down_revision = 'f2b7c3e8a614'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    for table in TABLES:
+        # Existing rows count as modified now, the first incremental export includes them all.
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False,
+                                       server_default=sa.func.now()))
+        op.create_index(f'ix_{table}_updated_at_id', table, ['updated_at', 'id'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_updated_at_id', table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,39 @@
+"""Convert show start_time to timestamptz and index it per venue and artist
+
+Revision ID: a3c5e1f0b2d4
+Revises: 761055c254f0
+Create Date: 2026-10-18 09:12:41.530218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c5e1f0b2d4'
+down_revision = '761055c254f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing values are ISO-ish strings, let postgres parse them during the type change.
+    op.alter_column('Show', 'start_time',
+               existing_type=sa.VARCHAR(length=50),
+               type_=sa.DateTime(timezone=True),
+               existing_nullable=False,
+               postgresql_using='start_time::timestamp with time zone')
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.alter_column('Show', 'start_time',
+               existing_type=sa.DateTime(timezone=True),
+               type_=sa.VARCHAR(length=50),
+               existing_nullable=False,
+               postgresql_using="to_char(start_time, 'YYYY-MM-DD HH24:MI:SS')")
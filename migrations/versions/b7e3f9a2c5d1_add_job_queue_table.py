@@ -0,0 +1,42 @@
+"""Add the Job table of the background job queue
+
+Revision ID: b7e3f9a2c5d1
+Revises: 5d8e2f1a9c47
+Create Date: 2026-10-18 21:04:37.582130
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f9a2c5d1'
+down_revision = '5d8e2f1a9c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Job',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('task', sa.String(length=120), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False, server_default='queued'),
+    sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+    sa.Column('key', sa.String(length=200), nullable=True),
+    sa.Column('locked_by', sa.String(length=200), nullable=True),
+    sa.Column('locked_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+    sa.Column('finished_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key')
+    )
+    op.create_index('ix_Job_status_run_at', 'Job', ['status', 'run_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Job_status_run_at', table_name='Job')
+    op.drop_table('Job')
@@ -0,0 +1,33 @@
+"""Add trigram search indexes on venue and artist fields
+
+Revision ID: c81f4b7d9e20
+Revises: a3c5e1f0b2d4
+Create Date: 2026-10-18 11:02:17.904412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4b7d9e20'
+down_revision = 'a3c5e1f0b2d4'
+branch_labels = None
+depends_on = None
+
+SEARCH_FIELDS = ('name', 'city', 'state', 'genres')
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        for field in SEARCH_FIELDS:
+            op.create_index(f'ix_{table}_{field}_trgm', table, [field], unique=False,
+                            postgresql_using='gin', postgresql_ops={field: 'gin_trgm_ops'})
+
+
+def downgrade():
+    # The pg_trgm extension is left installed, other database objects may use it.
+    for table in ('Venue', 'Artist'):
+        for field in SEARCH_FIELDS:
+            op.drop_index(f'ix_{table}_{field}_trgm', table_name=table)
@@ -0,0 +1,46 @@
+"""Add indexes on the sort keys of the paginated listings
+
+Revision ID: e4d2a9c71b35
+Revises: c81f4b7d9e20
+Create Date: 2026-10-18 13:45:52.118930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4d2a9c71b35'
+down_revision = 'c81f4b7d9e20'
+branch_labels = None
+depends_on = None
+
+
+# Sort key columns made NOT NULL, in the form table: columns. A row value comparison with a NULL
+# member is never true, so keyset pagination would skip rows with NULL keys.
+SORT_KEY_COLUMNS = {
+    'Venue': ['state', 'city', 'name'],
+    'Artist': ['name'],
+}
+
+
+def upgrade():
+    for table, columns in SORT_KEY_COLUMNS.items():
+        for column in columns:
+            op.execute(sa.text(f'UPDATE "{table}" SET {column} = \'\' WHERE {column} IS NULL'))
+            op.alter_column(table, column, existing_type=sa.String(), nullable=False)
+    op.create_index('ix_Venue_state_city_name_id', 'Venue', ['state', 'city', 'name', 'id'], unique=False)
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    # (start_time, id) also serves everything the single column index did.
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+    op.drop_index('ix_Show_start_time', table_name='Show')
+
+
+def downgrade():
+    op.create_index('ix_Show_start_time', 'Show', ['start_time'], unique=False)
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+    op.drop_index('ix_Venue_state_city_name_id', table_name='Venue')
+    for table, columns in SORT_KEY_COLUMNS.items():
+        for column in columns:
+            op.alter_column(table, column, existing_type=sa.String(), nullable=True)
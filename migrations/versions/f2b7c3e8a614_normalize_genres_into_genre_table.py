@@ -0,0 +1,85 @@
+"""Normalize genres into a Genre table with venue and artist associations
+
+Revision ID: f2b7c3e8a614
+Revises: e4d2a9c71b35
+Create Date: 2026-10-18 15:20:33.671205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b7c3e8a614'
+down_revision = 'e4d2a9c71b35'
+branch_labels = None
+depends_on = None
+
+# Choices the forms offered when genres were free text, seeded even if unused.
+GENRES = (
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+)
+
+
+def upgrade():
+    genre = op.create_table('Genre',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.create_table('VenueGenre',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'genre_id')
+    )
+    op.create_index('ix_VenueGenre_genre_id_venue_id', 'VenueGenre', ['genre_id', 'venue_id'], unique=False)
+    op.create_table('ArtistGenre',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'genre_id')
+    )
+    op.create_index('ix_ArtistGenre_genre_id_artist_id', 'ArtistGenre', ['genre_id', 'artist_id'], unique=False)
+
+    # Split the comma separated strings, keeping every genre already in use.
+    op.bulk_insert(genre, [{'name': name} for name in GENRES])
+    for table in ('Venue', 'Artist'):
+        op.execute(f'''
+            INSERT INTO "Genre" (name)
+            SELECT DISTINCT trim(g) FROM "{table}", unnest(string_to_array("{table}".genres, ',')) AS g
+            WHERE trim(g) <> ''
+            ON CONFLICT (name) DO NOTHING
+        ''')
+        op.execute(f'''
+            INSERT INTO "{table}Genre" ({table.lower()}_id, genre_id)
+            SELECT DISTINCT t.id, "Genre".id
+            FROM "{table}" t, unnest(string_to_array(t.genres, ',')) AS g
+            JOIN "Genre" ON "Genre".name = trim(g)
+        ''')
+        op.drop_index(f'ix_{table}_genres_trgm', table_name=table)
+        op.drop_column(table, 'genres')
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('genres', sa.VARCHAR(length=120), autoincrement=False, nullable=True))
+        op.execute(f'''
+            UPDATE "{table}" t SET genres = (
+                SELECT string_agg("Genre".name, ',' ORDER BY "Genre".name)
+                FROM "{table}Genre" JOIN "Genre" ON "Genre".id = "{table}Genre".genre_id
+                WHERE "{table}Genre".{table.lower()}_id = t.id
+            )
+        ''')
+        op.create_index(f'ix_{table}_genres_trgm', table, ['genres'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'genres': 'gin_trgm_ops'})
+    op.drop_index('ix_ArtistGenre_genre_id_artist_id', table_name='ArtistGenre')
+    op.drop_table('ArtistGenre')
+    op.drop_index('ix_VenueGenre_genre_id_venue_id', table_name='VenueGenre')
+    op.drop_table('VenueGenre')
+    op.drop_table('Genre')
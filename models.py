@@ -1,19 +1,60 @@
 # ----------------------------------------------------------------------------#
 # Imports
 # ----------------------------------------------------------------------------#
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
 from shared import db
 
 
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+    def __repr__(self):
+        return f'Genre(id={self.id},name={self.name})'
+
+
+# Many-to-many associations, the (genre_id, ...) indexes serve genre filters.
+venue_genres = db.Table(
+    'VenueGenre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_VenueGenre_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+
+artist_genres = db.Table(
+    'ArtistGenre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_ArtistGenre_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # pg_trgm indexes serve the substring searches in search.py.
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_state_trgm', 'state', postgresql_using='gin', postgresql_ops={'state': 'gin_trgm_ops'}),
+        # Sort key of the paginated venues listing.
+        db.Index('ix_Venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+        # Incremental exports select rows changed since the last run.
+        db.Index('ix_Venue_updated_at_id', 'updated_at', 'id'),
+        # The counters roll-over job selects rows whose next show has started.
+        db.Index('ix_Venue_next_show_at', 'next_show_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
@@ -21,7 +62,13 @@ class Venue(db.Model):
     website_link = db.Column(db.String(500))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String)
-    genres = db.Column(db.String(120))
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=db.func.now(), onupdate=db.func.now())
+    # Materialized from the Show table, see counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime(timezone=True))
+    genres = db.relationship('Genre', secondary=venue_genres, order_by='Genre.name')
     shows = db.relationship('Show', backref='venue', lazy=True, order_by='Show.start_time',
                             cascade='all, delete, delete-orphan')
 
@@ -31,18 +78,36 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        # pg_trgm indexes serve the substring searches in search.py.
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_city_trgm', 'city', postgresql_using='gin', postgresql_ops={'city': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_state_trgm', 'state', postgresql_using='gin', postgresql_ops={'state': 'gin_trgm_ops'}),
+        # Sort key of the paginated artists listing.
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        # Incremental exports select rows changed since the last run.
+        db.Index('ix_Artist_updated_at_id', 'updated_at', 'id'),
+        # The counters roll-over job selects rows whose next show has started.
+        db.Index('ix_Artist_next_show_at', 'next_show_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
+    genres = db.relationship('Genre', secondary=artist_genres, order_by='Genre.name')
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(500))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=db.func.now(), onupdate=db.func.now())
+    # Materialized from the Show table, see counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_show_at = db.Column(db.DateTime(timezone=True))
     shows = db.relationship('Show', backref='artist', lazy=True, order_by='Show.start_time',
                             cascade='all, delete, delete-orphan')
 
@@ -52,11 +117,59 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        # Past/upcoming range filters on a venue or artist page are served by these.
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        # Sort key of the paginated shows listing.
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        # Incremental exports select rows changed since the last run.
+        db.Index('ix_Show_updated_at_id', 'updated_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.String(50), nullable=False)
+    start_time = db.Column(db.DateTime(timezone=True), nullable=False)
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), nullable=False)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=db.func.now(), onupdate=db.func.now())
 
     def __repr__(self):
         return f'Show(id={self.id},venue_id={self.venue_id},artist_id={self.artist_id},start_time={self.start_time})'
+
+
+class Job(db.Model):
+    """A background job of the database queue, see jobs.py."""
+    __tablename__ = 'Job'
+    __table_args__ = (
+        # Workers claim the next due queued job, and look for running jobs past their timeout.
+        db.Index('ix_Job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    task = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    # queued, running, done or failed.
+    status = db.Column(db.String(16), nullable=False, default='queued', server_default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    max_attempts = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    # Enqueuing a job whose key already exists does nothing, e.g. one run of a periodic task per slot.
+    key = db.Column(db.String(200), unique=True)
+    locked_by = db.Column(db.String(200))
+    locked_at = db.Column(db.DateTime(timezone=True))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    finished_at = db.Column(db.DateTime(timezone=True))
+
+    def __repr__(self):
+        return f'Job(id={self.id},task={self.task},status={self.status})'
+
+
+@event.listens_for(Session, 'before_flush')
+def touch_updated_at(session, flush_context, instances):
+    # Changing only the genres of a venue or artist writes to the association
+    # table, bump updated_at so incremental exports still pick the row up.
+    for obj in session.dirty:
+        if isinstance(obj, (Venue, Artist)) and session.is_modified(obj):
+            obj.updated_at = db.func.now()
@@ -0,0 +1,121 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import base64
+import json
+from datetime import datetime
+
+from flask import current_app, request
+from sqlalchemy import tuple_
+
+
+# ----------------------------------------------------------------------------#
+# Keyset pagination.
+# ----------------------------------------------------------------------------#
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+class Page:
+    """One page of a keyset paginated listing.
+
+    next_cursor/prev_cursor are opaque strings to pass back as the after/before
+    request arguments, or None when there is nothing further in that direction.
+
+    """
+
+    def __init__(self, items: list, next_cursor: str = None, prev_cursor: str = None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values: tuple) -> str:
+    """Encode the sort key of a row as an opaque url-safe cursor."""
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def _decode_value(column, value):
+    """Convert a cursor value back to the python type of column, raising TypeError on a mismatch."""
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    # bool is an int, but never a valid key.
+    if not isinstance(value, python_type) or isinstance(value, bool):
+        raise TypeError(f'Expected {python_type.__name__} for {column.key}')
+    return value
+
+
+def decode_cursor(cursor: str, key_columns: list) -> tuple:
+    """Decode a cursor made by encode_cursor back to typed sort key values.
+
+    Raises InvalidCursor if the cursor is malformed or does not match key_columns.
+
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(key_columns):
+            raise ValueError
+        return tuple(_decode_value(column, v) for column, v in zip(key_columns, values))
+    except (TypeError, ValueError):
+        raise InvalidCursor(f'Invalid cursor {cursor!r}')
+
+
+def keyset_paginate(query, key_columns: list, key, limit: int, after: str = None,
+                    before: str = None, row_type=None) -> Page:
+    """Return the page of query that follows the after cursor or precedes the before cursor.
+
+    key_columns is the unique sort key of the listing, e.g. [Show.start_time, Show.id],
+    and key is a function returning those values for an item of the query. Pages
+    are fetched with a row value comparison on the key, so every page costs the
+    same as the first one as long as an index covers key_columns, whose columns
+    must be NOT NULL (a row value comparison with a NULL is never true). When row_type
+    is given (a namedtuple), result rows are converted to it.
+
+    """
+    backwards = before is not None and after is None
+    cursor = before if backwards else after
+    if cursor is not None:
+        values = decode_cursor(cursor, key_columns)
+        if backwards:
+            query = query.filter(tuple_(*key_columns) < values)
+        else:
+            query = query.filter(tuple_(*key_columns) > values)
+
+    order = [c.desc() for c in key_columns] if backwards else list(key_columns)
+    # Fetch one extra row to know whether there is a further page.
+    items = query.order_by(None).order_by(*order).limit(limit + 1).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+    if row_type is not None:
+        items = [row_type._make(x) for x in items]
+    if backwards:
+        items.reverse()
+
+    if not items:
+        return Page(items)
+    first, last = encode_cursor(key(items[0])), encode_cursor(key(items[-1]))
+    if backwards:
+        return Page(items, next_cursor=last, prev_cursor=first if has_more else None)
+    return Page(items, next_cursor=last if has_more else None,
+                prev_cursor=first if cursor is not None else None)
+
+
+def get_list_page() -> tuple:
+    """Read the page size and after/before cursors of a listing request.
+
+    Returns a tuple in the form (limit, after, before)
+
+    """
+    limit = request.args.get('limit', current_app.config['LIST_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['LIST_MAX_PAGE_SIZE']))
+    return limit, request.args.get('after'), request.args.get('before')
@@ -0,0 +1,368 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import selectinload
+
+from models import Venue, Artist, Show, Genre
+from pagination import Page, keyset_paginate
+from shared import db
+
+# Rows of the listings. Listings select only the columns they show and keep their
+# rows in these plain named tuples: no ORM entity is hydrated or tracked by the
+# session. Per show row (benchmarks/row_memory.py), a page holds about 27% less than the query
+# rows turned into dicts (457 vs 625 B/row) and about 11% less than the rows themselves (513 B/row).
+ArtistRow = namedtuple('ArtistRow', 'id name')
+ShowRow = namedtuple('ShowRow', 'id start_time venue_id venue_name artist_id artist_name artist_image_link')
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+def upcoming_boundary() -> datetime:
+    """Return the instant that separates past shows from upcoming shows."""
+    return datetime.now(timezone.utc)
+
+
+def is_upcoming(now: datetime):
+    """Return the condition of the shows upcoming at now, shows starting exactly at now included.
+
+    Past shows are ~is_upcoming(now). Every page, counter and query splitting
+    shows uses it so a show is never past on one and upcoming on another.
+
+    """
+    return Show.start_time >= now
+
+
+def get_genres(names: list) -> list:
+    """Return the Genre rows with the given names, unknown names are ignored."""
+    if not names:
+        return []
+    return Genre.query.filter(Genre.name.in_(names)).order_by(Genre.name).all()
+
+
+def detail_statement(model, show_fk, other_model, other_fk, entity_id: int, past_shows_limit: int,
+                     now: datetime):
+    """Build the single query loading an entity, its shows and their counterpart.
+
+    Every show is flagged is_upcoming in the query so the rows can be
+    partitioned in one pass by assemble_detail. Only the most recent
+    past_shows_limit past shows are joined while past/upcoming counts are
+    aggregated over all of them. Genres are not loaded, the sync and async
+    callers each fetch them their own way.
+
+    """
+    upcoming = is_upcoming(now)
+    shows = (select(show_fk.label('entity_id'), Show.start_time, other_fk.label('other_id'),
+                    upcoming.label('is_upcoming'),
+                    func.row_number().over(partition_by=upcoming,
+                                           order_by=Show.start_time.desc()).label('recency'))
+             .where(show_fk == entity_id)
+             .subquery())
+    past_shows_count = (select(func.count(Show.id))
+                        .where(show_fk == model.id, ~upcoming)
+                        .correlate(model).scalar_subquery())
+    upcoming_shows_count = (select(func.count(Show.id))
+                            .where(show_fk == model.id, upcoming)
+                            .correlate(model).scalar_subquery())
+    return (select(model,
+                   past_shows_count.label('past_shows_count'),
+                   upcoming_shows_count.label('upcoming_shows_count'),
+                   shows.c.start_time, shows.c.is_upcoming,
+                   other_model.id, other_model.name, other_model.image_link)
+            .outerjoin(shows, and_(shows.c.entity_id == model.id,
+                                   or_(shows.c.is_upcoming, shows.c.recency <= past_shows_limit)))
+            .outerjoin(other_model, other_model.id == shows.c.other_id)
+            .where(model.id == entity_id)
+            .order_by(shows.c.start_time))
+
+
+def assemble_detail(rows: list, prefix: str) -> dict:
+    """Partition the rows of detail_statement into past and upcoming shows.
+
+    Returns None if there are no rows (the entity does not exist), otherwise a dict in the form
+    {'entity': model instance, 'past_shows': [...], 'upcoming_shows': [...],
+     'past_shows_count': int, 'upcoming_shows_count': int}
+    where each show is {'<prefix>_id', '<prefix>_name', '<prefix>_image_link', 'start_time'}.
+
+    """
+    if not rows:
+        return None
+
+    detail = {
+        'entity': rows[0][0],
+        'past_shows': [],
+        'upcoming_shows': [],
+        'past_shows_count': rows[0].past_shows_count,
+        'upcoming_shows_count': rows[0].upcoming_shows_count
+    }
+    for _, _, _, start_time, upcoming, other_id, other_name, other_image_link in rows:
+        # A single row without a show is returned when nothing matched the outer join.
+        if start_time is None:
+            continue
+        detail['upcoming_shows' if upcoming else 'past_shows'].append({
+            f'{prefix}_id': other_id,
+            f'{prefix}_name': other_name,
+            f'{prefix}_image_link': other_image_link,
+            'start_time': start_time
+        })
+    return detail
+
+
+def genre_names_statement(genre_fk, entity_id: int):
+    """Build the query of the sorted genre names of a venue or artist, genre_fk is the association column."""
+    return (select(Genre.name)
+            .join(genre_fk.table, genre_fk.table.c.genre_id == Genre.id)
+            .where(genre_fk == entity_id)
+            .order_by(Genre.name))
+
+
+def _get_detail(model, show_fk, other_model, other_fk, prefix: str, entity_id: int,
+                past_shows_limit: int, now: datetime) -> dict:
+    """Load an entity, its shows and their counterpart in a single query, genres selectin loaded.
+
+    Returns None if the entity does not exist, otherwise the dict of assemble_detail.
+
+    """
+    if now is None:
+        now = upcoming_boundary()
+    statement = detail_statement(model, show_fk, other_model, other_fk, entity_id, past_shows_limit, now)
+    rows = db.session.execute(statement.options(selectinload(model.genres))).all()
+    return assemble_detail(rows, prefix)
+
+
+# ----------------------------------------------------------------------------#
+# Venues.
+# ----------------------------------------------------------------------------#
+
+# Sort keys of the paginated listings, each ends with id so the order is total.
+VENUE_AREA_KEY = [Venue.state, Venue.city, Venue.name, Venue.id]
+ARTIST_KEY = [Artist.name, Artist.id]
+SHOW_KEY = [Show.start_time, Show.id]
+
+
+def _venue_area_rows(genre: str = None):
+    """Query venues with their upcoming show counts, one row per venue."""
+    query = (db.session.query(Venue.state, Venue.city, Venue.id, Venue.name,
+                              Venue.upcoming_shows_count.label('num_upcoming_shows'))
+             .order_by(*VENUE_AREA_KEY))
+    if genre is not None:
+        query = query.filter(Venue.genres.any(Genre.name == genre))
+    return query
+
+
+def _group_areas(rows: list) -> list:
+    """Group venue rows sorted by area into the format used by the venues page."""
+    # Rows arrive sorted by area, so a new area starts whenever state/city changes.
+    areas = []
+    for state, city, venue_id, name, num_upcoming_shows in rows:
+        if not areas or (areas[-1]['state'], areas[-1]['city']) != (state, city):
+            areas.append({'state': state, 'city': city, 'venues': []})
+        areas[-1]['venues'].append({
+            'id': venue_id,
+            'name': name,
+            'num_upcoming_shows': num_upcoming_shows
+        })
+    return areas
+
+
+def get_venue_areas(genre: str = None) -> list:
+    """Return all venues grouped by area with their upcoming show counts.
+
+    Counts are read from the materialized Venue.upcoming_shows_count column,
+    see counters.py, so no shows are scanned.
+
+    Returns a list in the form
+    [{'state': ..., 'city': ..., 'venues': [{'id', 'name', 'num_upcoming_shows'},...]},...]
+    ordered by state, city and venue name. When genre is given only venues
+    with that genre are listed.
+
+    """
+    return _group_areas(_venue_area_rows(genre).all())
+
+
+def get_venue_areas_page(limit: int, after: str = None, before: str = None, genre: str = None) -> Page:
+    """Return a page of at most limit venues, grouped by area like get_venue_areas.
+
+    An area that straddles two pages is listed on both.
+
+    """
+    page = keyset_paginate(_venue_area_rows(genre), VENUE_AREA_KEY,
+                           lambda row: (row.state, row.city, row.name, row.id),
+                           limit, after=after, before=before)
+    page.items = _group_areas(page.items)
+    return page
+
+
+def iter_venues(genre: str = None, batch_size: int = 1000):
+    """Iterate over every venue in area order, as rows of get_venue_areas before grouping.
+
+    Rows are fetched batch_size at a time through a server-side cursor, so
+    memory use does not grow with the number of venues.
+
+    """
+    return _venue_area_rows(genre).yield_per(batch_size)
+
+
+def get_venue_detail(venue_id: int, past_shows_limit: int, now: datetime = None) -> dict:
+    """Load a venue with its shows and the artist playing each one, see _get_detail."""
+    return _get_detail(Venue, Show.venue_id, Artist, Show.artist_id, 'artist',
+                       venue_id, past_shows_limit, now)
+
+
+def venue_page_data(venue, genres: list, detail: dict) -> dict:
+    """Format a venue, its genre names and its detail (see assemble_detail) as the venue page data."""
+    data = {
+        'id': venue.id,
+        'name': venue.name,
+        'genres': genres,
+        'address': venue.address,
+        'city': venue.city,
+        'state': venue.state,
+        'phone': venue.phone,
+        'website': venue.website_link,
+        'facebook_link': venue.facebook_link,
+        'seeking_talent': venue.seeking_talent,
+        'image_link': venue.image_link,
+        'past_shows': detail['past_shows'],
+        'upcoming_shows': detail['upcoming_shows'],
+        'past_shows_count': detail['past_shows_count'],
+        'upcoming_shows_count': detail['upcoming_shows_count']
+    }
+    if venue.seeking_talent:
+        data.update({
+            'seeking_description': venue.seeking_description
+        })
+    return data
+
+
+def get_venue_page_data(venue_id: int, past_shows_limit: int) -> dict:
+    """Build the data of the venue page, or None if the venue does not exist."""
+    detail = get_venue_detail(venue_id, past_shows_limit)
+    if detail is None:
+        return None
+    venue = detail['entity']
+    return venue_page_data(venue, [genre.name for genre in venue.genres], detail)
+
+
+def get_venue_artist_ids(venue_id: int) -> list:
+    """Return the ids of the artists with a show at the venue."""
+    return [x for x, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+
+
+# ----------------------------------------------------------------------------#
+# Artists.
+# ----------------------------------------------------------------------------#
+
+def _artist_rows(genre: str = None):
+    """Query the id and name of artists, only those with genre when given."""
+    query = db.session.query(Artist.id, Artist.name)
+    if genre is not None:
+        query = query.filter(Artist.genres.any(Genre.name == genre))
+    return query
+
+
+def get_artists_page(limit: int, after: str = None, before: str = None, genre: str = None) -> Page:
+    """Return a page of at most limit artists ordered by name, as ArtistRow rows.
+
+    When genre is given only artists with that genre are listed.
+
+    """
+    return keyset_paginate(_artist_rows(genre), ARTIST_KEY,
+                           lambda row: (row.name, row.id),
+                           limit, after=after, before=before, row_type=ArtistRow)
+
+
+def iter_artists(genre: str = None, batch_size: int = 1000):
+    """Iterate over every artist ordered by name, as (id, name) rows like get_artists_page.
+
+    Rows are fetched batch_size at a time through a server-side cursor, so
+    memory use does not grow with the number of artists.
+
+    """
+    return _artist_rows(genre).order_by(*ARTIST_KEY).yield_per(batch_size)
+
+
+def get_artist_detail(artist_id: int, past_shows_limit: int, now: datetime = None) -> dict:
+    """Load an artist with its shows and the venue of each one, see _get_detail."""
+    return _get_detail(Artist, Show.artist_id, Venue, Show.venue_id, 'venue',
+                       artist_id, past_shows_limit, now)
+
+
+def artist_page_data(artist, genres: list, detail: dict) -> dict:
+    """Format an artist, its genre names and its detail (see assemble_detail) as the artist page data."""
+    data = {
+        'id': artist.id,
+        'name': artist.name,
+        'genres': genres,
+        'city': artist.city,
+        'state': artist.state,
+        'phone': artist.phone,
+        'seeking_venue': artist.seeking_venue,
+        'image_link': artist.image_link,
+        'facebook_link': artist.facebook_link,
+        'website': artist.website_link,
+        'past_shows': detail['past_shows'],
+        'upcoming_shows': detail['upcoming_shows'],
+        'past_shows_count': detail['past_shows_count'],
+        'upcoming_shows_count': detail['upcoming_shows_count']
+    }
+    if artist.seeking_venue:
+        data.update({
+            'seeking_description': artist.seeking_description
+        })
+    return data
+
+
+def get_artist_page_data(artist_id: int, past_shows_limit: int) -> dict:
+    """Build the data of the artist page, or None if the artist does not exist."""
+    detail = get_artist_detail(artist_id, past_shows_limit)
+    if detail is None:
+        return None
+    artist = detail['entity']
+    return artist_page_data(artist, [genre.name for genre in artist.genres], detail)
+
+
+def get_artist_venue_ids(artist_id: int) -> list:
+    """Return the ids of the venues the artist has a show at."""
+    return [x for x, in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+
+
+# ----------------------------------------------------------------------------#
+# Shows.
+# ----------------------------------------------------------------------------#
+
+def _show_rows():
+    """Query shows joined with the name of their venue and the name and image of their artist."""
+    return (db.session.query(Show.id, Show.start_time,
+                             Show.venue_id, Venue.name.label('venue_name'),
+                             Show.artist_id, Artist.name.label('artist_name'),
+                             Artist.image_link.label('artist_image_link'))
+            .join(Venue, Venue.id == Show.venue_id)
+            .join(Artist, Artist.id == Show.artist_id))
+
+
+def get_shows_page(limit: int, after: str = None, before: str = None) -> Page:
+    """Return a page of at most limit shows ordered by start time.
+
+    Venue and artist are joined in the same query and only the columns the shows
+    page needs are selected, as ShowRow rows.
+
+    """
+    return keyset_paginate(_show_rows(), SHOW_KEY,
+                           lambda row: (row.start_time, row.id),
+                           limit, after=after, before=before, row_type=ShowRow)
+
+
+def iter_shows(batch_size: int = 1000):
+    """Iterate over every show, in the same rows and order as get_shows_page.
+
+    Rows are fetched batch_size at a time through a server-side cursor, so
+    memory use does not grow with the number of shows.
+
+    """
+    return _show_rows().order_by(*SHOW_KEY).yield_per(batch_size)
@@ -0,0 +1,181 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import threading
+import time
+
+from flask import current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.sql.dml import UpdateBase
+
+# Replicas are configured as SQLALCHEMY_BINDS with keys starting with this, see database.configure_engines.
+REPLICA_BIND_PREFIX = 'replica'
+
+# Requests with these methods do not write and may be served by a replica, as well as the
+# views marked with ReplicaRouter.read_only whatever their method (e.g. the POST searches).
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Cookie holding the time until which a client reads from the primary, after it wrote something.
+PIN_COOKIE = 'fyyur_primary_until'
+
+# Replication lag in seconds, 0 when the replica replayed everything it received and
+# NULL when the database is not a replica.
+LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+# ----------------------------------------------------------------------------#
+# Session.
+# ----------------------------------------------------------------------------#
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica when the request allows it.
+
+    ReplicaRouter sets info['use_replica'] for read-only requests. The first
+    query then picks a healthy replica, used for the rest of the request so all
+    reads see the same snapshot. Flushes and DML statements always go to the
+    primary and switch the rest of the request to the primary as well, and set
+    info['wrote'] so the client gets pinned to the primary.
+
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        writing = self._flushing or isinstance(clause, UpdateBase)
+        if writing:
+            self.info['wrote'] = True
+        if bind is None and self.info.get('use_replica'):
+            if writing:
+                self.info['use_replica'] = False
+            else:
+                if 'replica' not in self.info:
+                    router = current_app.extensions.get('replica_router')
+                    self.info['replica'] = router.choose() if router is not None else None
+                if self.info['replica'] is not None:
+                    return self.info['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# ----------------------------------------------------------------------------#
+# Replicas.
+# ----------------------------------------------------------------------------#
+
+class Replica:
+    """A replica engine with a cached health status, re-checked every check_interval seconds.
+
+    A replica is healthy when it answers and, on postgres, lags the primary by
+    at most max_lag seconds (0 disables the lag check).
+
+    """
+
+    def __init__(self, key: str, engine, check_interval: float = 5, max_lag: float = 0):
+        self.key = key
+        self.engine = engine
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.healthy = True
+        self.lag = None
+        self.checked_at = None
+
+    def is_healthy(self) -> bool:
+        if self.checked_at is None or time.monotonic() - self.checked_at >= self.check_interval:
+            self.check()
+        return self.healthy
+
+    def check(self):
+        # Set first so concurrent requests do not all run the check.
+        self.checked_at = time.monotonic()
+        try:
+            with self.engine.connect() as conn:
+                if self.max_lag and conn.dialect.name == 'postgresql':
+                    self.lag = conn.execute(LAG_QUERY).scalar()
+                    self.healthy = self.lag is None or self.lag <= self.max_lag
+                else:
+                    conn.execute(text('SELECT 1'))
+                    self.healthy = True
+        except Exception:
+            self.healthy = False
+
+
+class ReplicaRouter:
+    """Flask extension routing read-only requests to the replica binds, round-robin.
+
+    Requests with a safe method and views decorated with read_only are
+    read-only. Requests that wrote to the database pin the client to the
+    primary for DB_REPLICA_PIN_SECONDS, through a cookie, so the redirect that
+    follows a form submission reads its own writes. When no replica is healthy
+    reads go to the primary. init_app must run after db.init_app.
+
+    """
+
+    def __init__(self, app=None):
+        self.db = None
+        self.replicas = []
+        self.pin_seconds = 10
+        self._next = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.db = app.extensions['sqlalchemy']
+        with app.app_context():
+            engines = self.db.engines
+        self.replicas = [
+            Replica(key, engine, app.config['DB_REPLICA_CHECK_INTERVAL'], app.config['DB_REPLICA_MAX_LAG'])
+            for key, engine in sorted(engines.items(), key=lambda item: str(item[0]))
+            if key is not None and key.startswith(REPLICA_BIND_PREFIX)
+        ]
+        self.pin_seconds = app.config['DB_REPLICA_PIN_SECONDS']
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['replica_router'] = self
+
+    def read_only(self, view):
+        """Decorate a view that never writes, so it reads from a replica whatever its method."""
+        view.replica_reads = True
+        return view
+
+    def _is_read_only(self) -> bool:
+        if request.method in SAFE_METHODS:
+            return True
+        view = current_app.view_functions.get(request.endpoint)
+        return getattr(view, 'replica_reads', False)
+
+    def choose(self):
+        """Return the engine of the next healthy replica, or None to use the primary."""
+        for _ in range(len(self.replicas)):
+            with self._lock:
+                replica = self.replicas[self._next % len(self.replicas)]
+                self._next += 1
+            if replica.is_healthy():
+                return replica.engine
+        return None
+
+    def _pinned(self) -> bool:
+        try:
+            return float(request.cookies.get(PIN_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _before_request(self):
+        if self.replicas and self._is_read_only() and not self._pinned():
+            self.db.session.info['use_replica'] = True
+
+    def _after_request(self, response):
+        if self.db.session.info.get('wrote') and self.pin_seconds:
+            response.set_cookie(PIN_COOKIE, str(int(time.time() + self.pin_seconds)),
+                                max_age=self.pin_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def stats(self) -> dict:
+        """Return the health of each replica, keyed by bind key."""
+        return {
+            replica.key: {'healthy': replica.healthy, 'lag_seconds': replica.lag}
+            for replica in self.replicas
+        }
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,256 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import threading
+from collections import namedtuple
+
+from sqlalchemy import and_, func, or_
+
+from models import Venue, Artist, Genre, venue_genres, artist_genres
+from shared import db
+
+# Searchable entities, in the form kind: (model, genre association foreign key, fields to match).
+# Genre names are matched as well. The name field is listed first and carries the most weight
+# when ranking.
+SEARCHABLE = {
+    'venue': (Venue, venue_genres.c.venue_id, ('name', 'city', 'state')),
+    'artist': (Artist, artist_genres.c.artist_id, ('name', 'city', 'state')),
+}
+
+SearchResult = namedtuple('SearchResult', 'id name num_upcoming_shows')
+
+
+def _like_pattern(search_term: str) -> str:
+    """Build a substring ILIKE pattern, escaping the LIKE wildcards in the term."""
+    escaped = search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _page(total: int, rows: list) -> dict:
+    """Build the response format shared by all backends."""
+    return {
+        'count': total,
+        'data': [SearchResult(row[0], row[1], row[2]) for row in rows]
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+class SearchBackend:
+    """Base class for venue and artist search backends.
+
+    search() returns a dict in the form
+    {'count': total_matches, 'data': [SearchResult(id, name, num_upcoming_shows),...]}
+    where data holds at most limit rows starting at offset, best match first.
+    When genre is given only entities with that genre are matched. Upcoming
+    show counts are the materialized counters, see counters.py.
+
+    """
+
+    def search(self, kind: str, search_term: str, limit: int, offset: int = 0, genre: str = None) -> dict:
+        raise NotImplementedError
+
+    def invalidate(self, kind: str):
+        """Called after rows of kind were created, updated or deleted."""
+        pass
+
+
+class PostgresTrigramBackend(SearchBackend):
+    """Search in postgres, backed by the pg_trgm GIN indexes on each searchable field.
+
+    Substring ILIKE filters are answered from the trigram indexes and results are
+    ranked by trigram similarity, with name matches weighted above the other fields.
+
+    """
+
+    def search(self, kind, search_term, limit, offset=0, genre=None):
+        model, genre_fk, fields = SEARCHABLE[kind]
+        columns = [getattr(model, field) for field in fields]
+        pattern = _like_pattern(search_term)
+        match = or_(*[column.ilike(pattern, escape='\\') for column in columns],
+                    model.genres.any(Genre.name.ilike(pattern, escape='\\')))
+        if genre is not None:
+            match = and_(match, model.genres.any(Genre.name == genre))
+        genre_similarity = (db.session.query(func.max(func.similarity(Genre.name, search_term)))
+                            .join(genre_fk.table, genre_fk.table.c.genre_id == Genre.id)
+                            .filter(genre_fk == model.id)
+                            .correlate(model)
+                            .scalar_subquery())
+        # greatest() skips the NULLs similarity() returns for empty fields.
+        rank = func.greatest(func.similarity(columns[0], search_term),
+                             *[func.similarity(column, search_term) * 0.5 for column in columns[1:]],
+                             genre_similarity * 0.5)
+        rows = (db.session.query(model.id, model.name,
+                                 model.upcoming_shows_count.label('num_upcoming_shows'),
+                                 func.count().over().label('total'))
+                .filter(match)
+                .order_by(rank.desc(), model.name, model.id)
+                .limit(limit)
+                .offset(offset)
+                .all())
+        if rows:
+            total = rows[0].total
+        elif offset:
+            # Paged past the end, the window count is not available so count separately.
+            total = db.session.query(func.count(model.id)).filter(match).scalar()
+        else:
+            total = 0
+        return _page(total, rows)
+
+
+def _substring_trigrams(text: str) -> set:
+    """Return every trigram of text, any string containing text contains all of them."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _word_trigrams(text: str) -> set:
+    """Return the trigrams of text the way pg_trgm does, padding each word."""
+    trigrams = set()
+    for word in ''.join(c if c.isalnum() else ' ' for c in text.lower()).split():
+        trigrams |= _substring_trigrams(f'  {word} ')
+    return trigrams
+
+
+def similarity(a: str, b: str) -> float:
+    """Trigram similarity of two strings, as computed by pg_trgm's similarity()."""
+    ta, tb = _word_trigrams(a or ''), _word_trigrams(b or '')
+    if not ta or not tb:
+        return 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+class _TrigramIndex:
+    """In-memory inverted trigram index over the searchable fields of one model."""
+
+    def __init__(self, docs: dict):
+        # docs is in the form {id: (name, (lowercased field values,...), {genre names})}
+        # where the last field value holds the comma joined genres.
+        self.docs = docs
+        self.postings = {}
+        for doc_id, (_, values, _) in docs.items():
+            for value in values:
+                for trigram in _substring_trigrams(value):
+                    self.postings.setdefault(trigram, set()).add(doc_id)
+
+    def candidates(self, term: str):
+        """Return the ids of docs that may contain term, using the postings when possible."""
+        trigrams = _substring_trigrams(term)
+        if not trigrams:
+            return self.docs.keys()
+        postings = sorted((self.postings.get(t, set()) for t in trigrams), key=len)
+        return set.intersection(*postings)
+
+
+class InMemoryBackend(SearchBackend):
+    """Pure python trigram search, for databases without pg_trgm such as SQLite.
+
+    Each process keeps its own index per kind. It is built from the database on
+    first use and dropped by invalidate(), so it is only suited to a single
+    process (development, tests, small deployments).
+
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        # In the form kind: number of invalidations, an index built from rows read
+        # before an invalidation is discarded instead of stored.
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def _get_index(self, kind: str) -> _TrigramIndex:
+        index = self._indexes.get(kind)
+        if index is None:
+            with self._lock:
+                generation = self._generations.get(kind, 0)
+            model, genre_fk, fields = SEARCHABLE[kind]
+            rows = db.session.query(model.id, *[getattr(model, field) for field in fields]).all()
+            genres = {}
+            for doc_id, name in (db.session.query(genre_fk, Genre.name)
+                                 .join(Genre, Genre.id == genre_fk.table.c.genre_id)):
+                genres.setdefault(doc_id, set()).add(name)
+            index = _TrigramIndex({
+                row[0]: (row[1],
+                         tuple((value or '').lower() for value in row[1:])
+                         + (','.join(sorted(genres.get(row[0], ()))).lower(),),
+                         genres.get(row[0], set()))
+                for row in rows
+            })
+            with self._lock:
+                if self._generations.get(kind, 0) == generation:
+                    self._indexes[kind] = index
+        return index
+
+    def invalidate(self, kind):
+        with self._lock:
+            self._generations[kind] = self._generations.get(kind, 0) + 1
+            self._indexes.pop(kind, None)
+
+    def search(self, kind, search_term, limit, offset=0, genre=None):
+        model, _, _ = SEARCHABLE[kind]
+        index = self._get_index(kind)
+        term = search_term.lower()
+        ranked = []
+        for doc_id in index.candidates(term):
+            name, values, genres = index.docs[doc_id]
+            if genre is not None and genre not in genres:
+                continue
+            if not any(term in value for value in values):
+                continue
+            rank = max([similarity(values[0], term)]
+                       + [similarity(value, term) * 0.5 for value in values[1:-1]]
+                       + [similarity(g, term) * 0.5 for g in genres])
+            ranked.append((-rank, name or '', doc_id))
+        ranked.sort()
+
+        page = ranked[offset:offset + limit]
+        ids = [doc_id for _, _, doc_id in page]
+        counts = {}
+        if ids:
+            counts = dict(db.session.query(model.id, model.upcoming_shows_count).filter(model.id.in_(ids)))
+        return _page(len(ranked), [(doc_id, name, counts.get(doc_id, 0)) for _, name, doc_id in page])
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+BACKENDS = {
+    'postgres': PostgresTrigramBackend,
+    'memory': InMemoryBackend,
+}
+
+
+class SearchIndex:
+    """Flask extension that selects and fronts the configured search backend.
+
+    SEARCH_BACKEND is one of the BACKENDS keys, or 'auto' to use postgres
+    when the database is postgres and the in-memory index otherwise.
+
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        name = app.config.get('SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            uri = app.config['SQLALCHEMY_DATABASE_URI']
+            name = 'postgres' if uri.startswith('postgres') else 'memory'
+        self.backend = BACKENDS[name]()
+        app.extensions['search_index'] = self
+
+    def search_venues(self, search_term: str, limit: int, offset: int = 0, genre: str = None) -> dict:
+        return self.backend.search('venue', search_term, limit, offset, genre=genre)
+
+    def search_artists(self, search_term: str, limit: int, offset: int = 0, genre: str = None) -> dict:
+        return self.backend.search('artist', search_term, limit, offset, genre=genre)
+
+    def invalidate(self, kind: str):
+        self.backend.invalidate(kind)
+
+
+search_index = SearchIndex()
@@ -0,0 +1,363 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+import bisect
+import csv
+import io
+import itertools
+import math
+import random
+import time
+from datetime import timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, select, text
+
+from cache import cache
+from counters import refresh_counters
+from forms import VenueForm
+from models import Venue, Artist, Show, Genre, venue_genres, artist_genres
+from repository import upcoming_boundary
+from search import search_index
+from shared import db
+
+# Share of the requested rows that are venues and artists, the rest are shows.
+VENUE_SHARE = 0.03
+ARTIST_SHARE = 0.07
+
+# Relative population of the most populated states, every other state weighs 0.5.
+STATE_WEIGHTS = {
+    'CA': 11.7, 'TX': 9.0, 'FL': 6.7, 'NY': 5.9, 'PA': 3.9, 'IL': 3.8, 'OH': 3.5, 'GA': 3.3,
+    'NC': 3.2, 'MI': 3.0, 'NJ': 2.8, 'VA': 2.6, 'WA': 2.3, 'AZ': 2.2, 'TN': 2.1, 'MA': 2.1,
+    'IN': 2.0, 'MD': 1.8, 'MO': 1.8, 'WI': 1.8, 'CO': 1.8, 'MN': 1.7, 'SC': 1.6, 'AL': 1.5,
+    'LA': 1.4, 'KY': 1.4, 'OR': 1.3,
+}
+
+# Largest cities of some states, most populated first. Other states get generic town names.
+CITIES = {
+    'CA': ('Los Angeles', 'San Diego', 'San Jose', 'San Francisco', 'Fresno', 'Sacramento', 'Oakland'),
+    'TX': ('Houston', 'San Antonio', 'Dallas', 'Austin', 'Fort Worth', 'El Paso'),
+    'FL': ('Jacksonville', 'Miami', 'Tampa', 'Orlando', 'St. Petersburg'),
+    'NY': ('New York', 'Buffalo', 'Rochester', 'Yonkers', 'Syracuse', 'Albany'),
+    'PA': ('Philadelphia', 'Pittsburgh', 'Allentown', 'Erie'),
+    'IL': ('Chicago', 'Aurora', 'Naperville', 'Joliet', 'Rockford'),
+    'GA': ('Atlanta', 'Augusta', 'Columbus', 'Savannah', 'Athens'),
+    'TN': ('Nashville', 'Memphis', 'Knoxville', 'Chattanooga'),
+    'WA': ('Seattle', 'Spokane', 'Tacoma', 'Vancouver'),
+    'LA': ('New Orleans', 'Baton Rouge', 'Shreveport', 'Lafayette'),
+}
+TOWNS = ('Springfield', 'Franklin', 'Greenville', 'Clinton', 'Madison', 'Salem', 'Fairview', 'Georgetown',
+         'Arlington', 'Ashland', 'Marion', 'Jackson', 'Oxford', 'Burlington', 'Manchester', 'Milton')
+
+VENUE_WORDS = (('The',), ('Blue', 'Velvet', 'Golden', 'Rusty', 'Electric', 'Silver', 'Crimson', 'Little', 'Old',
+                          'Midnight', 'Red', 'Lucky', 'Wild', 'Grand', 'Copper'),
+               ('Room', 'Lounge', 'Hall', 'Tavern', 'Theatre', 'Club', 'Saloon', 'Cellar', 'Garden', 'Ballroom',
+                'Barn', 'Stage', 'Den', 'Palace', 'Warehouse'))
+ARTIST_WORDS = (('The', 'Los', 'DJ', 'Lil', 'Big', 'Young', 'Saint', 'Sister', 'Brother', 'Captain'),
+                ('Wild', 'Quiet', 'Neon', 'Gentle', 'Howling', 'Broken', 'Velvet', 'Paper', 'Iron', 'Lonesome',
+                 'Electric', 'Sunday', 'Midnight', 'Golden', 'Stray'),
+                ('Sax', 'Petals', 'Wolves', 'Hearts', 'Rivers', 'Ghosts', 'Kings', 'Echoes', 'Strangers',
+                 'Horses', 'Daughters', 'Machines', 'Lights', 'Pilots', 'Birds'),
+                ('', '', '', ' Band', ' Trio', ' Quartet', ' Collective', ' Orchestra', ' Project'))
+STREETS = ('Main St', 'Oak St', 'Maple Ave', 'Broadway', 'Market St', 'Church St', 'Elm St', 'Park Ave',
+           '2nd St', 'Washington Ave', 'Lake St', 'Hill Rd')
+
+# Show start hours (local evening) and their weights, on the hour or half hour.
+SHOW_HOURS = (17, 18, 19, 20, 21, 22, 23)
+SHOW_HOUR_WEIGHTS = (1, 3, 6, 9, 7, 4, 2)
+# Relative number of shows per weekday, Monday first.
+WEEKDAY_WEIGHTS = (0.5, 0.6, 0.8, 1.0, 1.8, 2.0, 1.0)
+# Shows span this many days before and after now, past shows are the majority.
+PAST_DAYS = 730
+UPCOMING_DAYS = 365
+
+# Genres per venue and per artist, and how often each number of genres occurs.
+VENUE_GENRE_COUNTS = ((1, 2, 3, 4), (40, 35, 18, 7))
+ARTIST_GENRE_COUNTS = ((1, 2, 3), (55, 35, 10))
+
+DEFAULT_GENRES = (
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+)
+
+
+# ----------------------------------------------------------------------------#
+# Distributions.
+# ----------------------------------------------------------------------------#
+
+class Weighted:
+    """Draw items with the given relative weights, in O(log n) per draw."""
+
+    def __init__(self, items, weights):
+        self.items = list(items)
+        self.cum_weights = list(itertools.accumulate(weights))
+        self.total = self.cum_weights[-1]
+
+    def draw(self, rng: random.Random):
+        return self.items[bisect.bisect(self.cum_weights, rng.random() * self.total)]
+
+    def sample(self, rng: random.Random, k: int) -> list:
+        """Draw k distinct items, k at most the number of items."""
+        chosen = []
+        while len(chosen) < k:
+            item = self.draw(rng)
+            if item not in chosen:
+                chosen.append(item)
+        return chosen
+
+
+def zipf_weights(n: int, s: float = 1.0) -> list:
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def popularity(rng: random.Random, n: int) -> list:
+    """Return n log-normal weights, so a few venues or artists get most of the shows."""
+    return [rng.lognormvariate(0, 1.2) for _ in range(n)]
+
+
+class Generator:
+    """Seeded generator of venue, artist and show rows with realistic distributions.
+
+    States follow their population, cities within a state a Zipf law, genre
+    popularity a Zipf law over a seeded order of the genres. Shows go to venues
+    and artists with log-normal popularity, mostly in the past, in the evening
+    and more often at the end of the week. The same seed gives the same rows.
+
+    """
+
+    def __init__(self, seed: int, genres: list, states: list, now):
+        self.rng = random.Random(seed)
+        self.now = now
+        self.states = Weighted(states, [STATE_WEIGHTS.get(state, 0.5) for state in states])
+        self.cities = {
+            state: Weighted(CITIES.get(state, TOWNS), zipf_weights(len(CITIES.get(state, TOWNS))))
+            for state in states
+        }
+        genres = list(genres)
+        self.rng.shuffle(genres)
+        self.genres = Weighted(genres, zipf_weights(len(genres), 0.8))
+        self.hours = Weighted(SHOW_HOURS, SHOW_HOUR_WEIGHTS)
+        self.weekday_max = max(WEEKDAY_WEIGHTS)
+
+    def _place(self) -> tuple:
+        state = self.states.draw(self.rng)
+        return state, self.cities[state].draw(self.rng)
+
+    def _phone(self) -> str:
+        rng = self.rng
+        return f'{rng.randint(201, 989)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}'
+
+    def _genres(self, counts: tuple) -> list:
+        return self.genres.sample(self.rng, self.rng.choices(*counts)[0])
+
+    def venue(self, venue_id: int) -> tuple:
+        """Return (column values, genre names) of a venue."""
+        rng = self.rng
+        state, city = self._place()
+        name = ' '.join(rng.choice(words) for words in VENUE_WORDS[rng.random() < 0.4:])
+        slug = f'{name.lower().replace(" ", "")}{venue_id}'
+        seeking = rng.random() < 0.3
+        return {
+            'id': venue_id,
+            'name': name,
+            'city': city,
+            'state': state,
+            'address': f'{rng.randint(1, 9999)} {rng.choice(STREETS)}',
+            'phone': self._phone(),
+            'image_link': f'https://images.example.com/venues/{venue_id}.jpg' if rng.random() < 0.8 else None,
+            'facebook_link': f'https://www.facebook.com/{slug}' if rng.random() < 0.7 else None,
+            'website_link': f'https://www.{slug}.com' if rng.random() < 0.5 else None,
+            'seeking_talent': seeking,
+            'seeking_description': 'We are looking for local acts on weeknights.' if seeking else None,
+        }, self._genres(VENUE_GENRE_COUNTS)
+
+    def artist(self, artist_id: int) -> tuple:
+        """Return (column values, genre names) of an artist."""
+        rng = self.rng
+        state, city = self._place()
+        words = ARTIST_WORDS[rng.random() < 0.5:]
+        name = ' '.join(rng.choice(part) for part in words[:-1]) + rng.choice(words[-1])
+        slug = f'{name.lower().replace(" ", "")}{artist_id}'
+        seeking = rng.random() < 0.4
+        return {
+            'id': artist_id,
+            'name': name,
+            'city': city,
+            'state': state,
+            'phone': self._phone(),
+            'image_link': f'https://images.example.com/artists/{artist_id}.jpg' if rng.random() < 0.9 else None,
+            'facebook_link': f'https://www.facebook.com/{slug}' if rng.random() < 0.8 else None,
+            'website_link': f'https://{slug}.bandcamp.com' if rng.random() < 0.4 else None,
+            'seeking_venue': seeking,
+            'seeking_description': 'Looking for shows in the area.' if seeking else None,
+        }, self._genres(ARTIST_GENRE_COUNTS)
+
+    def start_time(self):
+        rng = self.rng
+        while True:
+            day = self.now + timedelta(days=rng.randint(-PAST_DAYS, UPCOMING_DAYS))
+            if rng.random() * self.weekday_max < WEEKDAY_WEIGHTS[day.weekday()]:
+                break
+        return day.replace(hour=self.hours.draw(rng), minute=rng.choice((0, 0, 0, 30)), second=0, microsecond=0)
+
+    def shows(self, venues: Weighted, artists: Weighted, count: int):
+        """Yield count show rows as (start_time, venue_id, artist_id)."""
+        for _ in range(count):
+            yield self.start_time(), venues.draw(self.rng), artists.draw(self.rng)
+
+
+# ----------------------------------------------------------------------------#
+# Loading.
+# ----------------------------------------------------------------------------#
+
+def _copy(table, columns: list, rows: list):
+    """Write rows (tuples in the order of columns) with COPY, postgres only."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if value is None else value for value in row])
+    buffer.seek(0)
+    names = ', '.join(f'"{name}"' for name in columns)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert(f'COPY "{table.name}" ({names}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')', buffer)
+    cursor.close()
+
+
+def _write(table, columns: list, rows: list):
+    """Insert rows (tuples in the order of columns) with COPY on postgres, multi-row inserts elsewhere."""
+    if not rows:
+        return
+    if db.engine.dialect.name == 'postgresql':
+        _copy(table, columns, rows)
+    else:
+        db.session.execute(insert(table), [dict(zip(columns, row)) for row in rows])
+
+
+def _next_id(model) -> int:
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def _reset_sequence(model):
+    # Explicit ids do not advance the postgres sequence, move it past them.
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(f'SELECT setval(pg_get_serial_sequence(\'"{model.__tablename__}"\', \'id\'), '
+                                f'(SELECT max(id) FROM "{model.__tablename__}"))'))
+
+
+def _ensure_genres() -> dict:
+    """Return the genre ids by name, creating the default genres in an empty Genre table."""
+    genre_ids = dict(db.session.execute(select(Genre.name, Genre.id)).all())
+    if not genre_ids:
+        db.session.execute(insert(Genre), [{'name': name} for name in DEFAULT_GENRES])
+        genre_ids = dict(db.session.execute(select(Genre.name, Genre.id)).all())
+        # Core inserts bypass the session hooks invalidating the form choices.
+        db.session.commit()
+        cache.invalidate('genres')
+    return genre_ids
+
+
+def _load_entities(model, genre_table, genre_fk: str, make, count: int, genre_ids: dict, batch_size: int,
+                   progress) -> range:
+    first = _next_id(model)
+    columns = None
+    for start in range(first, first + count, batch_size):
+        rows, links = [], []
+        for entity_id in range(start, min(start + batch_size, first + count)):
+            values, genres = make(entity_id)
+            columns = columns or list(values)
+            rows.append(tuple(values[column] for column in columns))
+            links += [(entity_id, genre_ids[name]) for name in genres]
+        _write(model.__table__, columns, rows)
+        _write(genre_table, [genre_fk, 'genre_id'], links)
+        db.session.commit()
+        progress(model.__tablename__, len(rows))
+    _reset_sequence(model)
+    db.session.commit()
+    return range(first, first + count)
+
+
+def seed(rows: int = None, venues: int = None, artists: int = None, shows: int = None, seed: int = 42,
+         batch_size: int = 10000, progress=lambda table, count: None) -> dict:
+    """Add synthetic venues, artists and shows to the database.
+
+    rows is split between venues, artists and shows (VENUE_SHARE, ARTIST_SHARE,
+    the rest shows), explicit counts take precedence. Rows are written
+    batch_size at a time, with COPY on postgres, and committed per batch.
+    The show counters are then recomputed and, on postgres, the tables
+    analyzed. progress(table, count) is called after every batch.
+
+    Returns the counts in the form {'venues': int, 'artists': int, 'shows': int, 'seconds': float}
+
+    """
+    rows = rows or 0
+    venues = venues if venues is not None else max(1, round(rows * VENUE_SHARE))
+    artists = artists if artists is not None else max(1, round(rows * ARTIST_SHARE))
+    shows = shows if shows is not None else max(0, rows - venues - artists)
+    if shows and not (venues and artists):
+        raise ValueError('Shows need at least one new venue and one new artist')
+    started = time.perf_counter()
+
+    genre_ids = _ensure_genres()
+    states = [value for value, _ in VenueForm.state.kwargs['choices']]
+    now = upcoming_boundary()
+    generator = Generator(seed, sorted(genre_ids), states, now)
+
+    venue_ids = _load_entities(Venue, venue_genres, 'venue_id', generator.venue, venues, genre_ids,
+                               batch_size, progress)
+    artist_ids = _load_entities(Artist, artist_genres, 'artist_id', generator.artist, artists, genre_ids,
+                                batch_size, progress)
+
+    rng = generator.rng
+    venue_draw = Weighted(venue_ids, popularity(rng, len(venue_ids)))
+    artist_draw = Weighted(artist_ids, popularity(rng, len(artist_ids)))
+    show_rows = generator.shows(venue_draw, artist_draw, shows)
+    columns = ['start_time', 'venue_id', 'artist_id']
+    for _ in range(math.ceil(shows / batch_size)):
+        batch = list(itertools.islice(show_rows, batch_size))
+        _write(Show.__table__, columns, batch)
+        db.session.commit()
+        progress(Show.__tablename__, len(batch))
+
+    # Core inserts bypass the session hooks that maintain the show counters.
+    refresh_counters(venue_ids, artist_ids, now)
+    db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as conn:
+            conn.execution_options(isolation_level='AUTOCOMMIT').execute(text('ANALYZE'))
+    search_index.invalidate('venue')
+    search_index.invalidate('artist')
+    cache.invalidate('venue_areas', 'artists', 'shows')
+    return {
+        'venues': venues,
+        'artists': artists,
+        'shows': shows,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+# ----------------------------------------------------------------------------#
+# CLI.
+# ----------------------------------------------------------------------------#
+
+@click.command('seed')
+@click.option('--rows', type=int, default=1000, show_default=True,
+              help=f'Rows to add, {VENUE_SHARE:.0%} venues, {ARTIST_SHARE:.0%} artists and the rest shows.')
+@click.option('--venues', type=int, help='Venues to add, instead of a share of --rows.')
+@click.option('--artists', type=int, help='Artists to add, instead of a share of --rows.')
+@click.option('--shows', type=int, help='Shows to add, instead of a share of --rows.')
+@click.option('--seed', 'seed_value', type=int, default=42, show_default=True, help='Random seed.')
+@click.option('--batch-size', type=int, default=10000, show_default=True, help='Rows written per commit.')
+@with_appcontext
+def seed_command(rows, venues, artists, shows, seed_value, batch_size):
+    """Add seeded synthetic venues, artists and shows, from 10^3 to 10^7 rows."""
+    written = {}
+
+    def progress(table, count):
+        written[table] = written.get(table, 0) + count
+        click.echo(f'\r{table}: {written[table]} rows', nl=False)
+
+    counts = seed(rows, venues, artists, shows, seed_value, batch_size, progress)
+    click.echo(f'\nAdded {counts["venues"]} venues, {counts["artists"]} artists and {counts["shows"]} shows '
+               f'in {counts["seconds"]:.1f}s.')
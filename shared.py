@@ -3,4 +3,7 @@
 # ----------------------------------------------------------------------------#
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from routing import RoutingSession
+
+# Reads of read-only requests may go to a replica, see routing.py.
+db = SQLAlchemy(session_options={'class_': RoutingSession})
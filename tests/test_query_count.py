@@ -0,0 +1,87 @@
+"""Upper bounds on the statements run to render the listings and detail pages.
+
+The pages select only the columns they show and join the related venue or
+artist, a lazy load per show (N+1) would run dozens to hundreds of statements
+for the shows created here. Runs against a throwaway SQLite database.
+
+Usage: python -m pytest tests
+
+"""
+import os
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+DB_FILE = os.path.join(tempfile.mkdtemp(), 'fyyur.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{DB_FILE}'
+
+# Statements per page, whatever the number of shows.
+MAX_QUERIES = {
+    '/shows': 2,
+    '/venues': 2,
+    '/artists': 2,
+    '/venues/1': 4,
+    '/artists/1': 4,
+}
+
+VENUES = ARTISTS = 10
+SHOWS = 300
+
+
+@pytest.fixture(scope='module')
+def app():
+    from app import app
+    from models import Venue, Artist, Show, Genre
+    from shared import db
+
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        db.create_all()
+        jazz = Genre(name='Jazz')
+        venues = [Venue(name=f'Venue {i}', city='San Francisco', state='CA', address=f'{i} Main St',
+                        phone='123-123-1234', genres=[jazz]) for i in range(VENUES)]
+        artists = [Artist(name=f'Artist {i}', city='San Francisco', state='CA', phone='123-123-1234', genres=[jazz])
+                   for i in range(ARTISTS)]
+        db.session.add_all(venues + artists)
+        db.session.flush()
+        # Every venue hosts every artist, half of the shows are past and half upcoming.
+        db.session.add_all([Show(venue_id=venues[i % VENUES].id, artist_id=artists[i // VENUES % ARTISTS].id,
+                                 start_time=now + timedelta(days=i - SHOWS // 2)) for i in range(SHOWS)])
+        db.session.commit()
+        db.session.remove()
+    yield app
+    os.remove(DB_FILE)
+
+
+def count_queries(app, url: str) -> int:
+    """Return the number of statements run by this thread to answer a GET of url."""
+    from shared import db
+
+    thread = threading.get_ident()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == thread:
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = app.test_client().get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('url', sorted(MAX_QUERIES))
+def test_page_query_count(app, url):
+    assert count_queries(app, url) <= MAX_QUERIES[url]